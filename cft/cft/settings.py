@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -25,6 +26,9 @@ SECRET_KEY = 'django-insecure-u_6921ljum&$-9k5=o$l$qb5b4x90oaskq($u8fy*@x2wdqh8d
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# `manage.py test` is running; keeps request instrumentation out of test runs
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = []
 
 
@@ -39,15 +43,19 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'tracker',
     'widget_tweaks',
-    'django.contrib.humanize'
+    'django.contrib.humanize',
+    'rest_framework',
+    'rest_framework.authtoken',
 ]
 
 MIDDLEWARE = [
+    'tracker.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tracker.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,12 +84,98 @@ WSGI_APPLICATION = 'cft.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Configured from the environment. SQLite is the default; set CFT_DB_ENGINE=postgresql
+# (plus CFT_DB_NAME/USER/PASSWORD/HOST/PORT) for production. Setting CFT_DB_REPLICA_HOST adds
+# a 'replica' alias that tracker.db_router.ReplicaRouter sends dashboard reads to.
+# PostgreSQL needs psycopg, and CFT_DB_POOL=1 needs its pool extra; neither is in the
+# default install: `pip install -r requirements-postgresql.txt`.
+DB_ENGINE = os.environ.get('CFT_DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DB_POOL = os.environ.get('CFT_DB_POOL', '') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('CFT_DB_NAME', 'cft'),
+            'USER': os.environ.get('CFT_DB_USER', 'cft'),
+            'PASSWORD': os.environ.get('CFT_DB_PASSWORD', ''),
+            'HOST': os.environ.get('CFT_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('CFT_DB_PORT', '5432'),
+            # Persistent connections, unless psycopg's pool is managing them
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('CFT_DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('CFT_DB_POOL_MIN', '2')),
+                    'max_size': int(os.environ.get('CFT_DB_POOL_MAX', '10')),
+                },
+            } if DB_POOL else {},
+        }
     }
-}
+    if os.environ.get('CFT_DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'HOST': os.environ['CFT_DB_REPLICA_HOST'],
+            'PORT': os.environ.get('CFT_DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+    # WAL lets readers run alongside the single writer, and IMMEDIATE transactions plus a
+    # busy timeout make concurrent writers wait their turn instead of failing with
+    # "database is locked". Set CFT_SQLITE_OPTIMIZED=0 for the stock configuration.
+    if os.environ.get('CFT_SQLITE_OPTIMIZED', '1') == '1':
+        DATABASES['default']['OPTIONS'] = {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=134217728;'
+                'PRAGMA cache_size=-20000;'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        }
+
+DATABASE_ROUTERS = ['tracker.db_router.ReplicaRouter']
+
+
+# Cache
+# Local memory by default; point CFT_CACHE_URL at Redis (redis://host:6379/1) when running
+# more than one process so the cached home page and leaderboard are shared between them.
+if os.environ.get('CFT_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CFT_CACHE_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'cft',
+        }
+    }
+
+HOME_PAGE_CACHE_TTL = 60  # whole home page for anonymous visitors, seconds
+LEADERBOARD_CACHE_TTL = 60
+SHARED_FRAGMENT_CACHE_TTL = 300  # global stats, map and badges on the logged-in home page
+
+
+# Live feed (tracker.live): leaderboard and challenge updates as server-sent events.
+# Streaming needs the ASGI app (e.g. `uvicorn cft.asgi:application`). With more than one
+# server process, set CFT_LIVE_BROKER=tracker.live.RedisBroker so they share updates.
+LIVE_BROKER = os.environ.get('CFT_LIVE_BROKER', 'tracker.live.LocalBroker')
+LIVE_BROKER_URL = os.environ.get('CFT_LIVE_BROKER_URL', os.environ.get('CFT_CACHE_URL', 'redis://localhost:6379/2'))
+LIVE_COALESCE_SECONDS = 1.0  # at most one event per topic per window
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_RECONNECT_SECONDS = 30  # also how often WSGI deployments re-poll the feed
 
 
 # Password validation
@@ -121,6 +215,26 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]  
 
+# Uploaded files (bill and statement imports)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Statement imports (tracker.statements): uploads up to STATEMENT_INLINE_MAX_BYTES are
+# imported during the request, larger ones on STATEMENT_IMPORT_WORKERS background threads.
+STATEMENT_MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+STATEMENT_INLINE_MAX_BYTES = 256 * 1024
+STATEMENT_IMPORT_WORKERS = 2
+
+# Activities with the same content logged within one bucket of this many seconds are
+# treated as one submission (tracker.dedupe)
+ACTIVITY_DEDUPE_BUCKET_SECONDS = 60
+
+# Anomaly screening (tracker.anomalies): once a user has logged ANOMALY_MIN_SAMPLES
+# amounts of a kind, one more than ANOMALY_Z_SCORE standard deviations above their usual
+# (on a log scale) is left out of totals until they confirm it
+ANOMALY_MIN_SAMPLES = 5
+ANOMALY_Z_SCORE = 4.0
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -128,4 +242,54 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 LOGIN_REDIRECT_URL = 'tracker-home'
-LOGIN_URL = 'login'
\ No newline at end of file
+LOGIN_URL = 'login'
+
+
+# Per-view performance instrumentation (tracker.middleware.PerformanceMiddleware)
+# Summarize with `python manage.py perfreport`. Off outside DEBUG unless a deployment opts in.
+PERF_MONITORING_ENABLED = DEBUG and not TESTING
+PERF_SAMPLE_RATE = 1.0 if DEBUG else 0.05
+PERF_BUFFER_SIZE = 1000
+PERF_FLUSH_INTERVAL = 30  # seconds
+PERF_LOG_PATH = BASE_DIR / 'perf' / 'requests.jsonl'
+
+# Sampling profiler for single requests (tracker.middleware.ProfilingMiddleware). Staff
+# get a profile by sending "X-Profile: 1" or adding ?_profile to the URL; a fraction of
+# everyone's requests can be profiled too. Captures go to PROFILE_DIR as collapsed stacks
+# and speedscope files; list and merge them with `python manage.py profilereport`.
+PROFILE_ENABLED = True
+PROFILE_SAMPLE_RATE = 0
+PROFILE_INTERVAL = 0.005  # seconds between stack samples
+PROFILE_DIR = BASE_DIR / 'perf' / 'profiles'
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_PARAM = '_profile'
+
+# REST API (tracker.api), served under /api/v1/. Browsers use their session; apps and
+# integrations send "Authorization: Token <key>" (POST /api/v1/auth/token/ to get one).
+REST_FRAMEWORK = {
+    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
+    'DEFAULT_VERSION': 'v1',
+    'ALLOWED_VERSIONS': ['v1'],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.TokenAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    # List views pick a cursor pagination class with their own ordering
+    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.CursorPagination',
+    'PAGE_SIZE': 50,
+}
+API_MAX_BULK_ACTIVITIES = 500
+
+# Activities older than this are folded into monthly summaries by `manage.py
+# archive_activities` (tracker.archive); whole months only, so the cutoff is the first
+# of the month this many days ago. ARCHIVE_KEEP_RAW keeps the rows too, compressed.
+ARCHIVE_AFTER_DAYS = 730
+ARCHIVE_KEEP_RAW = True
+
+# Home page comparison figures, tonnes CO2e per person per year (India and world averages).
+# The country's average is also the baseline "CO2 saved" is measured against
+# (tracker.counters); run `manage.py recount_platform_counters` nightly to reconcile.
+COUNTRY_AVERAGE_TONNES = 1.9
+GLOBAL_AVERAGE_TONNES = 4.7
+PLATFORM_BASELINE_KG_PER_DAY = COUNTRY_AVERAGE_TONNES * 1000 / 365
@@ -40,7 +40,7 @@ function initializeCounters() {
     const counters = [
         { id: 'totalUsers', target: 15847 },
         { id: 'co2Saved', target: 847 },
-        { id: 'countriesCount', target: 67 }
+        { id: 'regionsCount', target: 67 }
     ];
     
     // Intersection Observer for counters
@@ -1,13 +1,158 @@
-from django.contrib import admin
-from .models import Profile, Activity, Emission
+from django.contrib import admin, messages
+from django.db import connection
+from django.db.models import Max
+from django.core.paginator import Paginator
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .anomalies import counted_kg
+from .counters import record_counts
+from .models import Profile, Activity, Emission, ExchangeRate, StatementImport, ArchivedMonth, ActivityArchive, PlatformCounters, User
+from .recalculation import apply_recalculation, recalculate_activities
+from .streaks import clear_if_inactive, mark_active
+from .summary import rebuild_totals
 
 # Register your models here to make them accessible in the Django admin panel.
 
+# --- Large tables ---
+# Above this many rows an unfiltered changelist shows an estimated total instead of
+# running an exact COUNT(*) over the whole table.
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+def estimated_count(model):
+    """A cheap row count: the planner's estimate on PostgreSQL, the highest primary key elsewhere."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 until the table has been analyzed
+        return row[0] if row and row[0] >= 0 else None
+    return model._default_manager.aggregate(highest=Max('pk'))['highest']
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model)
+            if estimate is not None and estimate > ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Filtered pages would otherwise count the whole table again for "N total"
+    show_full_result_count = False
+    list_per_page = 50
+
+
 # This will allow you to see and edit Profile objects in the admin.
-admin.site.register(Profile)
+@admin.register(Profile)
+class ProfileAdmin(LargeTableAdmin):
+    list_display = ('user', 'location', 'carbon_budget_kg')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('=user__username', 'location')
+
 
 # This will allow you to see and edit Activity objects.
-admin.site.register(Activity)
+@admin.register(Activity)
+class ActivityAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'category', 'subtype', 'value', 'unit', 'timestamp', 'quarantined')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    # Backed by indexes on (timestamp), (category, timestamp) and the quarantined rows
+    list_filter = ('category', 'quarantined')
+    date_hierarchy = 'timestamp'
+    search_fields = ('=user__username',)
+    ordering = ('-timestamp',)
+    actions = ['recalculate_footprints']
+
+    # Edits here skip the views, so the totals, calendars and platform counters are
+    # brought back in line by hand
+    def save_model(self, request, obj, form, change):
+        old = Activity.objects.select_related('user', 'emission').get(pk=obj.pk) if change else None
+        super().save_model(request, obj, form, change)
+        new_days = mark_active(obj.user, obj.timestamp)
+        cleared = bool(old) and clear_if_inactive(old.user, old.timestamp)
+        rebuild_totals({obj.user_id, old.user_id if old else obj.user_id})
+        record_counts(
+            activity_count=0 if change else 1,
+            co2_logged_kg=counted_kg(obj) - (counted_kg(old) if old else 0),
+            active_user_days=new_days - cleared,
+        )
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Activity.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        removed = list(queryset.values_list('user_id', 'timestamp', 'quarantined', 'emission__co2_equivalent_kg'))
+        super().delete_queryset(request, queryset)
+        users = User.objects.in_bulk({user_id for user_id, *_ in removed})
+        # One check per user and day is enough
+        days = {(user_id, timezone.localdate(when)): when for user_id, when, *_ in removed}
+        cleared = sum(clear_if_inactive(users[user_id], when) for (user_id, _), when in days.items())
+        rebuild_totals(users.keys())
+        record_counts(
+            activity_count=-len(removed),
+            co2_logged_kg=-sum(kg or 0 for *_, quarantined, kg in removed if not quarantined),
+            active_user_days=-cleared,
+        )
+
+    @admin.action(description="Recalculate footprints of selected activities")
+    def recalculate_footprints(self, request, queryset):
+        # Reads and writes in batches, so "select all" over a large filter is fine
+        stats = recalculate_activities(queryset, chunk_size=2000, batch_size=500)
+        if stats['changed']:
+            apply_recalculation(stats['users'], stats['delta_kg'])
+        self.message_user(
+            request,
+            f"Recalculated {stats['scanned']} footprints: {stats['changed']} changed ({stats['delta_kg']:+.2f} kg CO2e) "
+            f"for {len(stats['users'])} user(s); {stats['manual']} edited by hand were left as they are.",
+            messages.SUCCESS,
+        )
+
 
 # This will allow you to see and edit Emission objects.
-admin.site.register(Emission)
+@admin.register(Emission)
+class EmissionAdmin(LargeTableAdmin):
+    list_display = ('id', 'activity', 'co2_equivalent_kg')
+    # Emission.__str__ and Activity.__str__ read the activity and its user
+    list_select_related = ('activity__user',)
+    raw_id_fields = ('activity',)
+    list_filter = ('activity__category',)
+    date_hierarchy = 'activity__timestamp'
+    search_fields = ('=activity__user__username',)
+    ordering = ('-id',)
+
+    def save_model(self, request, obj, form, change):
+        old = Emission.objects.select_related('activity').get(pk=obj.pk) if change else None
+        super().save_model(request, obj, form, change)
+        obj.activity.emission = obj
+        old_kg = counted_kg(old.activity) if old else 0
+        apply_recalculation({obj.activity.user_id, old.activity.user_id if old else obj.activity.user_id}, counted_kg(obj.activity) - old_kg)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Emission.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        removed = list(queryset.values_list('activity__user_id', 'activity__quarantined', 'co2_equivalent_kg'))
+        super().delete_queryset(request, queryset)
+        apply_recalculation({user_id for user_id, *_ in removed}, -sum(kg for _, quarantined, kg in removed if not quarantined))
+
+
+# Dated currency rates used to value purchases (see tracker/units.py).
+admin.site.register(ExchangeRate)
+
+# Bill and statement uploads, with their import progress (see tracker/statements.py).
+admin.site.register(StatementImport)
+
+# Monthly totals and raw rows of archived activities (see tracker/archive.py).
+admin.site.register(ArchivedMonth)
+admin.site.register(ActivityArchive)
+
+# Platform-wide home page counters (see tracker/counters.py).
+admin.site.register(PlatformCounters)
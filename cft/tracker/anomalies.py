@@ -0,0 +1,175 @@
+"""
+Anomaly screening for logged activities.
+
+A mistyped reading (5000 kWh instead of 50) or a faulty smart plug can wreck a month's
+totals, budget bars and leaderboard place on its own. Every activity written through the
+activity form, the API or a statement import is scored against the user's own history:
+
+- ActivityBaseline keeps a running mean and variance (Welford) of log(1 + amount in base
+  units) per (user, category, subtype), updated in place. On a log scale a misplaced zero
+  is the same distance from the mean whatever the usual amount is.
+- Once ANOMALY_MIN_SAMPLES amounts have been seen, one more than ANOMALY_Z_SCORE standard
+  deviations above the mean is quarantined. The activity and its emission are stored,
+  but Activity.quarantined keeps its kg out of the dashboard totals, forecasts,
+  leaderboard, history and platform counters until the user confirms it (confirm()) or
+  deletes it. Low amounts aren't flagged; they can't inflate anything.
+
+Quarantined amounts don't feed the baseline until confirmed. `manage.py scan_anomalies`
+rebuilds every baseline from the full history and re-screens unconfirmed activities.
+"""
+import math
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import record_counts
+from .models import Activity, ActivityBaseline
+from .summary import record_activity_change
+from .units import get_converter
+
+# Floor on the standard deviation (log scale), so a user whose readings never vary isn't
+# flagged for a modest change: at 0.35 and a z-score of 4 an amount has to be ~4x the usual.
+MIN_SPREAD = 0.35
+
+
+def log_amounts(values, units, timestamps):
+    """log(1 + amount in base units) for parallel sequences, as a float64 array."""
+    amounts = get_converter().normalize(values, units, timestamps)
+    return np.log1p(np.maximum(amounts, 0))
+
+
+def observe(count, mean, m2, x):
+    """Welford's update: the running (count, mean, m2) with x added."""
+    count += 1
+    delta = x - mean
+    mean += delta / count
+    return count, mean, m2 + delta * (x - mean)
+
+
+def is_outlier(count, mean, m2, x):
+    if count < settings.ANOMALY_MIN_SAMPLES:
+        return False
+    spread = max(math.sqrt(m2 / (count - 1)), MIN_SPREAD)
+    return (x - mean) / spread > settings.ANOMALY_Z_SCORE
+
+
+def screen(activities):
+    """
+    Scores newly stored activities (any users, any order), quarantines the outliers and
+    adds the rest to the baselines. Call inside the transaction that stored them, before
+    their kg is added to any total. Returns the ids of the quarantined activities.
+    """
+    if not activities:
+        return set()
+    amounts = log_amounts([a.value for a in activities], [a.unit for a in activities], [a.timestamp for a in activities])
+    keys = {(a.user_id, a.category, a.subtype) for a in activities}
+    baselines = {
+        (b.user_id, b.category, b.subtype): b
+        for b in ActivityBaseline.objects.select_for_update().filter(
+            user_id__in={key[0] for key in keys}, category__in={key[1] for key in keys}, subtype__in={key[2] for key in keys},
+        )
+    }
+    new_baselines = {}
+    flagged = set()
+    for i in sorted(range(len(activities)), key=lambda i: activities[i].timestamp):
+        activity = activities[i]
+        key = (activity.user_id, activity.category, activity.subtype)
+        baseline = baselines.get(key) or new_baselines.get(key)
+        if baseline is None:
+            baseline = new_baselines[key] = ActivityBaseline(user_id=key[0], category=key[1], subtype=key[2])
+        if is_outlier(baseline.count, baseline.mean, baseline.m2, amounts[i]):
+            activity.quarantined = True
+            flagged.add(activity.pk)
+        else:
+            baseline.count, baseline.mean, baseline.m2 = observe(baseline.count, baseline.mean, baseline.m2, amounts[i])
+
+    now = timezone.now()
+    changed = [b for key, b in baselines.items() if key in keys]
+    for baseline in changed:
+        baseline.updated_at = now
+    ActivityBaseline.objects.bulk_update(changed, ['count', 'mean', 'm2', 'updated_at'])
+    # A concurrent first write for the same key wins; its baseline is as good as this one
+    ActivityBaseline.objects.bulk_create(new_baselines.values(), ignore_conflicts=True)
+    if flagged:
+        Activity.objects.filter(pk__in=flagged).update(quarantined=True)
+    return flagged
+
+
+def confirm(activity):
+    """
+    Releases a quarantined activity into the user's totals and its amount into the
+    baseline. Returns False if it wasn't quarantined.
+    """
+    with transaction.atomic():
+        if not Activity.objects.filter(pk=activity.pk, quarantined=True).update(quarantined=False, anomaly_confirmed=True):
+            return False
+        activity.quarantined, activity.anomaly_confirmed = False, True
+        kg = activity.emission.co2_equivalent_kg if hasattr(activity, 'emission') else 0
+        record_activity_change(activity.user, activity.category, activity.timestamp, kg)
+        record_counts(co2_logged_kg=kg)
+        baseline, _ = ActivityBaseline.objects.select_for_update().get_or_create(
+            user_id=activity.user_id, category=activity.category, subtype=activity.subtype,
+        )
+        x = log_amounts([activity.value], [activity.unit], [activity.timestamp])[0]
+        baseline.count, baseline.mean, baseline.m2 = observe(baseline.count, baseline.mean, baseline.m2, x)
+        baseline.save()
+    return True
+
+
+def counted_kg(activity):
+    """The kg an activity contributes to totals: none while it's quarantined."""
+    if activity.quarantined or not hasattr(activity, 'emission'):
+        return 0
+    return activity.emission.co2_equivalent_kg
+
+
+# --- Full re-scan (manage.py scan_anomalies) ---
+
+def scan_users(user_ids):
+    """
+    Read-only half of the re-scan, safe to run in a worker process. Replays each user's
+    activities oldest first through fresh baselines. Returns {'baselines': {key: (count,
+    mean, m2)}, 'quarantine': {id: kg}, 'release': {id: kg}, 'users': {user ids}} for
+    activities whose flag should change; confirmed activities are never flagged.
+    """
+    rows = list(
+        Activity.objects.filter(user_id__in=user_ids).order_by('user_id', 'timestamp', 'id')
+        .values_list('id', 'user_id', 'category', 'subtype', 'value', 'unit', 'timestamp',
+                     'quarantined', 'anomaly_confirmed', 'emission__co2_equivalent_kg')
+    )
+    result = {'baselines': {}, 'quarantine': {}, 'release': {}, 'users': set()}
+    if not rows:
+        return result
+    ids, users, categories, subtypes, values, units, timestamps, quarantined, confirmed, co2 = zip(*rows)
+    amounts = log_amounts(values, units, timestamps)
+    baselines = defaultdict(lambda: (0, 0.0, 0.0))
+    for i, x in enumerate(amounts):
+        key = (users[i], categories[i], subtypes[i])
+        outlier = not confirmed[i] and is_outlier(*baselines[key], x)
+        if not outlier:
+            baselines[key] = observe(*baselines[key], x)
+        if outlier != quarantined[i]:
+            result['quarantine' if outlier else 'release'][ids[i]] = co2[i] or 0
+            result['users'].add(users[i])
+    result['baselines'] = dict(baselines)
+    return result
+
+
+def save_scan(user_ids, result, batch_size=500):
+    """Replaces the users' baselines and applies the flag changes from scan_users()."""
+    now = timezone.now()
+    with transaction.atomic():
+        ActivityBaseline.objects.filter(user_id__in=user_ids).delete()
+        ActivityBaseline.objects.bulk_create([
+            ActivityBaseline(user_id=user_id, category=category, subtype=subtype, count=count, mean=mean, m2=m2, updated_at=now)
+            for (user_id, category, subtype), (count, mean, m2) in result['baselines'].items()
+        ], batch_size=batch_size)
+        for flag, ids in ((True, list(result['quarantine'])), (False, list(result['release']))):
+            for start in range(0, len(ids), batch_size):
+                Activity.objects.filter(id__in=ids[start:start + batch_size]).update(quarantined=flag)
+        delta = sum(result['release'].values()) - sum(result['quarantine'].values())
+        if delta:
+            record_counts(co2_logged_kg=delta)
@@ -0,0 +1,481 @@
+"""
+REST API, versioned by URL (/api/v1/...), for the mobile apps and partner integrations.
+
+    activities/            GET list (cursor-paginated, newest first), POST one or a list
+    activities/<id>/       GET, PATCH (description), DELETE
+    activities/<id>/confirm/  POST: counts an activity quarantined as unusually large
+    stats/                 the activity page's stats and budget bars
+    stats/history/         kg CO2e per day, week or month over a date range
+    stats/calendar/        active days over a date range as a bitmap, with streaks
+    simulations/           GET the built-in what-if plans ranked by saving, POST your own plans
+    leaderboard/           30-day leaderboard, cursor-paginated by rank; ?rank_by=emission|reduction
+    challenges/            challenges with totals and the caller's progress
+    auth/token/            exchanges a username and password for an API token
+
+Reads are conditional. Each resource's ETag and Last-Modified come from a version that
+already exists for it: the user's DashboardSummary.updated_at (moved on every activity
+write), ActivityCalendar.updated_at, Challenge.updated_at (moved by any participant's
+progress) or the cached leaderboard. A client revalidating an unchanged resource gets a 304 after one
+primary-key or indexed lookup, before any aggregate runs.
+"""
+import base64
+import hashlib
+from datetime import date, datetime, time, timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncDay, TruncWeek
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+
+from .anomalies import confirm, counted_kg, screen
+from .archive import monthly_totals
+from .counters import record_counts
+from .dedupe import MAX_IDEMPOTENCY_KEY_LENGTH, activity_hash, bulk_create_activities, create_activity, idempotency_key
+from .footprint import calculate_footprint, calculate_footprints
+from .forecast import forecast_users, save_forecasts
+from .models import Activity, Challenge, Emission, UserChallenge, get_profile
+from .serializers import ActivitySerializer, ActivityUpdateSerializer, ChallengeSerializer, LeaderboardSerializer, PlanSerializer
+from .simulator import MAX_PLANS, MAX_SIMULATION_MONTHS, PLANS, SIMULATION_MONTHS, simulate
+from .statements import PREFIXES
+from .streaks import STREAK_CHART_DAYS, clear_if_inactive, get_calendar, mark_active, streak_stats, window
+from .summary import dashboard_stats, get_summary, rebuild_summary, record_activity_change
+
+MAX_HISTORY_POINTS = {'day': 366, 'week': 260, 'month': 120}
+MAX_CALENDAR_DAYS = 3660
+
+
+# --- Conditional GETs ---
+
+def conditional(validators):
+    """
+    Decorates a GET handler. `validators(view, request, *args, **kwargs)` returns
+    (version, last_modified); the ETag is derived from the version plus the URL, so
+    every page and filter of a resource has its own.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            version, last_modified = validators(view, request, *args, **kwargs)
+            digest = hashlib.blake2b(f"{version}|{request.get_full_path()}".encode(), digest_size=16).hexdigest()
+            etag = quote_etag(digest)
+            last_modified = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = handler(view, request, *args, **kwargs)
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            # Per-user data: clients and private caches may keep it, but must revalidate
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def user_version(view, request, *args, **kwargs):
+    """Moves whenever one of the user's activities is added, changed or removed."""
+    summary, _ = get_summary(request.user)
+    return f"{request.user.pk}-{summary.updated_at.timestamp()}", summary.updated_at
+
+
+def stats_version(view, request, *args, **kwargs):
+    # Also covers the day rolling over and a budget change
+    summary, _ = get_summary(request.user)
+    version = f"{request.user.pk}-{date.today().isoformat()}-{summary.updated_at.timestamp()}-{get_profile(request.user).carbon_budget_kg}"
+    return version, summary.updated_at
+
+
+def calendar_version(view, request, *args, **kwargs):
+    # Streaks depend on the date as well as the calendar
+    calendar = get_calendar(request.user)
+    return f"{request.user.pk}-{date.today().isoformat()}-{calendar.updated_at.timestamp()}", calendar.updated_at
+
+
+def challenges_version(view, request, *args, **kwargs):
+    # Max() is answered from the updated_at index; the count notices deleted challenges
+    latest = Challenge.objects.aggregate(updated_at=Max('updated_at'), count=Count('id'))
+    updated_at = latest['updated_at']
+    version = f"{request.user.pk}-{date.today().isoformat()}-{latest['count']}-{updated_at.timestamp() if updated_at else 0}"
+    return version, updated_at
+
+
+def leaderboard_version(view, request, *args, **kwargs):
+    rank_by = request.query_params.get('rank_by', 'emission')
+    view.leaderboard = _leaderboard(rank_by)
+    standings = '|'.join(f"{row['user_id']}:{row['emission']:.4f}:{row['previous']:.4f}" for row in view.leaderboard)
+    return hashlib.blake2b(standings.encode(), digest_size=16).hexdigest(), None
+
+
+def _leaderboard(rank_by):
+    # views imports this module's neighbours; importing it lazily keeps the graph acyclic
+    from .views import LEADERBOARD_RANKINGS, cached_leaderboard_data
+    if rank_by not in LEADERBOARD_RANKINGS:
+        raise ValidationError({'rank_by': f"Must be one of: {', '.join(LEADERBOARD_RANKINGS)}."})
+    return cached_leaderboard_data(rank_by)
+
+
+# --- Pagination ---
+
+class ActivityCursorPagination(CursorPagination):
+    ordering = ('-timestamp', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class ChallengeCursorPagination(CursorPagination):
+    ordering = ('-end_date', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class RankCursorPagination(BasePagination):
+    """
+    Cursor pagination for an already ranked in-memory list, such as the cached
+    leaderboard. The cursor is opaque, like CursorPagination's, and holds the offset.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_list(self, items, request):
+        self.base_url = request.build_absolute_uri()
+        self.offset = self.decode_cursor(request)
+        try:
+            self.page_size = int(request.query_params.get(self.page_size_query_param, api_settings.PAGE_SIZE))
+        except ValueError:
+            self.page_size = api_settings.PAGE_SIZE
+        self.page_size = min(max(self.page_size, 1), self.max_page_size)
+        self.count = len(items)
+        return list(enumerate(items[self.offset:self.offset + self.page_size], start=self.offset + 1))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return 0
+        try:
+            offset = int(base64.urlsafe_b64decode(encoded.encode()).decode().removeprefix('o='))
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+        if offset < 0:
+            raise NotFound('Invalid cursor')
+        return offset
+
+    def encode_cursor(self, offset):
+        if offset <= 0:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        encoded = base64.urlsafe_b64encode(f"o={offset}".encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_paginated_response(self, data):
+        following = self.offset + self.page_size
+        return Response({
+            'next': self.encode_cursor(following) if following < self.count else None,
+            'previous': self.encode_cursor(self.offset - self.page_size) if self.offset > 0 else None,
+            'results': data,
+        })
+
+
+# --- Activities ---
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _describe(category, subtype, value, unit):
+    """Same shape as the activity form's descriptions, so parse_subtype can read them back."""
+    amount = f"₹{value:,.2f}" if unit == 'INR' else f"{value:g} {unit}"
+    return f"{PREFIXES[category]}: {subtype.replace('-', ' ').title()} - {amount}"
+
+
+def _build_activity(user, data):
+    activity = Activity(
+        user=user, category=data['category'], subtype=data['subtype'], value=data['value'], unit=data['unit'],
+        description=data.get('description') or _describe(data['category'], data['subtype'], data['value'], data['unit']),
+        idempotency_key=data.get('idempotency_key') or None,
+    )
+    if data.get('timestamp'):
+        activity.timestamp = data['timestamp']
+    return activity
+
+
+class ActivityList(APIView):
+    @conditional(user_version)
+    def get(self, request, version):
+        activities = Activity.objects.filter(user=request.user)
+        params = request.query_params
+        if params.get('category'):
+            activities = activities.filter(category=params['category'])
+        try:
+            if params.get('since'):
+                activities = activities.filter(timestamp__gte=_start_of(date.fromisoformat(params['since'])))
+            if params.get('until'):
+                activities = activities.filter(timestamp__lt=_start_of(date.fromisoformat(params['until']) + timedelta(days=1)))
+        except ValueError:
+            raise ValidationError({'detail': "since and until must be dates (YYYY-MM-DD)."})
+
+        paginator = ActivityCursorPagination()
+        page = paginator.paginate_queryset(activities.values(*ActivitySerializer.VALUES), request, view=self)
+        return paginator.get_paginated_response(ActivitySerializer.rows(page))
+
+    def post(self, request, version):
+        """
+        Logs one activity (an object) or several (a list). Resubmitting with the same
+        idempotency key, or the same content within the dedupe window, logs nothing new.
+        """
+        if isinstance(request.data, list):
+            return self.bulk_create(request)
+        serializer = ActivitySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        activity = _build_activity(request.user, serializer.validated_data)
+        activity.idempotency_key = idempotency_key(request) or activity.idempotency_key
+        footprint = calculate_footprint(activity.category, activity.subtype, activity.value, activity.unit, activity.timestamp)
+        with transaction.atomic():
+            activity, created = create_activity(activity, footprint)
+            if created:
+                screen([activity])
+                record_activity_change(request.user, activity.category, activity.timestamp, counted_kg(activity))
+                new_days = mark_active(request.user, activity.timestamp)
+                record_counts(activity_count=1, co2_logged_kg=counted_kg(activity), active_user_days=new_days)
+        body = {**ActivitySerializer.from_instance(activity), 'duplicate': not created}
+        return Response(body, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    def bulk_create(self, request):
+        if len(request.data) > settings.API_MAX_BULK_ACTIVITIES:
+            raise ValidationError({'detail': f"At most {settings.API_MAX_BULK_ACTIVITIES} activities per request."})
+        serializer = ActivitySerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        activities = [_build_activity(request.user, item) for item in serializer.validated_data]
+        # An Idempotency-Key header covers the whole list: items without a key of their own
+        # get one per position, so retrying the same list after the dedupe window adds nothing
+        header = idempotency_key(request)
+        for index, activity in enumerate(activities):
+            if header and not activity.idempotency_key:
+                suffix = f":{index}"
+                activity.idempotency_key = header[:MAX_IDEMPOTENCY_KEY_LENGTH - len(suffix)] + suffix
+            activity.content_hash = activity_hash(activity)
+        footprints = calculate_footprints(
+            [a.category for a in activities], [a.subtype for a in activities], [a.value for a in activities],
+            [a.unit for a in activities], [a.timestamp for a in activities],
+        )
+        footprint_by_hash = {activity.content_hash: float(footprint) for activity, footprint in zip(activities, footprints)}
+        with transaction.atomic():
+            inserted = bulk_create_activities(activities, footprints)
+            quarantined = screen(inserted)
+        if inserted:
+            # Bulk inserts bypass the write-through totals, so they're rebuilt once here
+            rebuild_summary(request.user)
+            save_forecasts(forecast_users([request.user.pk]))
+            new_days = mark_active(request.user, *(activity.timestamp for activity in inserted))
+            record_counts(
+                activity_count=len(inserted), active_user_days=new_days,
+                co2_logged_kg=sum(footprint_by_hash[a.content_hash] for a in inserted if a.pk not in quarantined),
+            )
+        results = [
+            ActivitySerializer.row(a.id, a.category, a.subtype, a.description, a.value, a.unit, a.timestamp, footprint_by_hash[a.content_hash], a.quarantined)
+            for a in inserted
+        ]
+        return Response(
+            {'created': len(inserted), 'duplicates': len(activities) - len(inserted), 'results': results},
+            status=status.HTTP_201_CREATED if inserted else status.HTTP_200_OK,
+        )
+
+
+class ActivityDetail(APIView):
+    def get_activity(self, request, pk):
+        return get_object_or_404(Activity.objects.select_related('emission'), pk=pk, user=request.user)
+
+    @conditional(user_version)
+    def get(self, request, version, pk):
+        return Response(ActivitySerializer.from_instance(self.get_activity(request, pk)))
+
+    def patch(self, request, version, pk):
+        activity = self.get_activity(request, pk)
+        serializer = ActivityUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        activity.description = serializer.validated_data['description']
+        with transaction.atomic():
+            activity.save(update_fields=['description'])
+            # No change in kg, but this moves the version the ETags are built from
+            record_activity_change(request.user, activity.category, activity.timestamp, 0)
+        return Response(ActivitySerializer.from_instance(activity))
+
+    def delete(self, request, version, pk):
+        activity = self.get_activity(request, pk)
+        removed = counted_kg(activity)
+        with transaction.atomic():
+            activity.delete()
+            record_activity_change(request.user, activity.category, activity.timestamp, -removed)
+            day_cleared = clear_if_inactive(request.user, activity.timestamp)
+            record_counts(activity_count=-1, co2_logged_kg=-removed, active_user_days=-1 if day_cleared else 0)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ActivityConfirm(APIView):
+    """Adds a quarantined activity to the caller's totals; DELETE the activity to reject it."""
+
+    def post(self, request, version, pk):
+        activity = get_object_or_404(Activity.objects.select_related('emission'), pk=pk, user=request.user)
+        confirm(activity)
+        return Response(ActivitySerializer.from_instance(activity))
+
+
+# --- Stats ---
+
+class Stats(APIView):
+    @conditional(stats_version)
+    def get(self, request, version):
+        return Response(dashboard_stats(request.user))
+
+
+class StatsHistory(APIView):
+    """kg CO2e per period; ?period=day|week|month&start=YYYY-MM-DD&end=YYYY-MM-DD."""
+
+    @conditional(user_version)
+    def get(self, request, version):
+        period = request.query_params.get('period', 'month')
+        if period not in MAX_HISTORY_POINTS:
+            raise ValidationError({'period': "Must be day, week or month."})
+        today = date.today()
+        default_start = {
+            'day': today - timedelta(days=29),
+            'week': today - timedelta(weeks=11),
+            'month': (today.replace(day=1) - timedelta(days=320)).replace(day=1),
+        }[period]
+        try:
+            start = date.fromisoformat(request.query_params.get('start') or default_start.isoformat())
+            end = date.fromisoformat(request.query_params.get('end') or today.isoformat())
+        except ValueError:
+            raise ValidationError({'detail': "start and end must be dates (YYYY-MM-DD)."})
+        if end < start:
+            raise ValidationError({'detail': "end is before start."})
+
+        if period == 'month':
+            # Includes archived months (see tracker/archive.py)
+            totals = monthly_totals(request.user, start, end)
+        else:
+            totals = self.hot_totals(request.user, period, start, end)
+        if len(totals) > MAX_HISTORY_POINTS[period]:
+            raise ValidationError({'detail': f"At most {MAX_HISTORY_POINTS[period]} {period}s per request."})
+        return Response({
+            'period': period,
+            'results': [{'start': bucket.isoformat(), 'kg': round(total, 2)} for bucket, total in totals.items()],
+        })
+
+    def hot_totals(self, user, period, start, end):
+        """Daily or weekly (Monday-based) totals; archived months only have monthly totals."""
+        if period == 'week':
+            start = start - timedelta(days=start.weekday())
+        step = timedelta(days=7 if period == 'week' else 1)
+        totals = {}
+        bucket = start
+        while bucket <= end:
+            totals[bucket] = 0.0
+            bucket += step
+        if len(totals) > MAX_HISTORY_POINTS[period]:
+            return totals
+        trunc = TruncWeek if period == 'week' else TruncDay
+        rows = (
+            Emission.objects.filter(activity__user=user, activity__quarantined=False, activity__timestamp__gte=_start_of(start), activity__timestamp__lt=_start_of(end + timedelta(days=1)))
+            .annotate(bucket=trunc('activity__timestamp')).values('bucket').annotate(total=Sum('co2_equivalent_kg'))
+        )
+        for row in rows:
+            totals[timezone.localdate(row['bucket'])] += row['total'] or 0
+        return totals
+
+
+class StatsCalendar(APIView):
+    """
+    Active days, ?start=YYYY-MM-DD&end=YYYY-MM-DD (default: the last 20 weeks). `bitmap` is
+    base64; bit n (little-endian, eight days per byte) is set if `start` + n days was active.
+    """
+
+    @conditional(calendar_version)
+    def get(self, request, version):
+        today = date.today()
+        try:
+            start = date.fromisoformat(request.query_params.get('start') or (today - timedelta(days=STREAK_CHART_DAYS - 1)).isoformat())
+            end = date.fromisoformat(request.query_params.get('end') or today.isoformat())
+        except ValueError:
+            raise ValidationError({'detail': "start and end must be dates (YYYY-MM-DD)."})
+        if end < start:
+            raise ValidationError({'detail': "end is before start."})
+        if (end - start).days >= MAX_CALENDAR_DAYS:
+            raise ValidationError({'detail': f"At most {MAX_CALENDAR_DAYS} days per request."})
+        return Response({**streak_stats(request.user, today), **window(request.user, start, end)})
+
+
+class Simulations(APIView):
+    """
+    What-if plans priced against the caller's last ?months= months (default 3). GET ranks
+    the built-in plans; POST {"plans": [{"key", "label", "swaps": [{"category",
+    "from_subtype", "to_subtype", "share"}]}]} ranks up to MAX_PLANS of the caller's own.
+    """
+
+    def months(self, value):
+        try:
+            months = int(value or SIMULATION_MONTHS)
+        except (TypeError, ValueError):
+            raise ValidationError({'months': "Must be a whole number of months."})
+        if not 1 <= months <= MAX_SIMULATION_MONTHS:
+            raise ValidationError({'months': f"Must be between 1 and {MAX_SIMULATION_MONTHS}."})
+        return months
+
+    @conditional(stats_version)
+    def get(self, request, version):
+        return Response(simulate(request.user, PLANS, self.months(request.query_params.get('months'))))
+
+    def post(self, request, version):
+        months = self.months(request.data.get('months'))
+        plans = request.data.get('plans')
+        if not isinstance(plans, list) or not plans:
+            raise ValidationError({'plans': "Send a non-empty list of plans."})
+        if len(plans) > MAX_PLANS:
+            raise ValidationError({'plans': f"At most {MAX_PLANS} plans per request."})
+        serializer = PlanSerializer(data=plans, many=True)
+        serializer.is_valid(raise_exception=True)
+        return Response(simulate(request.user, [PlanSerializer.as_plan(plan) for plan in serializer.validated_data], months))
+
+
+# --- Leaderboard and challenges ---
+
+class Leaderboard(APIView):
+    @conditional(leaderboard_version)
+    def get(self, request, version):
+        paginator = RankCursorPagination()
+        page = paginator.paginate_list(self.leaderboard, request)
+        return paginator.get_paginated_response(LeaderboardSerializer.rows(page))
+
+
+class ChallengeList(APIView):
+    """?status=active|completed filters by end date."""
+
+    @conditional(challenges_version)
+    def get(self, request, version):
+        mine = UserChallenge.objects.filter(challenge=OuterRef('pk'), user=request.user)
+        challenges = Challenge.objects.annotate(
+            participant_count=Count('userchallenge'),
+            completed_count=Count('userchallenge', filter=Q(userchallenge__is_completed=True)),
+            my_progress=Subquery(mine.values('progress')[:1]),
+            my_completed=Subquery(mine.values('is_completed')[:1]),
+        )
+        state = request.query_params.get('status')
+        if state == 'active':
+            challenges = challenges.filter(end_date__gte=date.today())
+        elif state == 'completed':
+            challenges = challenges.filter(end_date__lt=date.today())
+        paginator = ChallengeCursorPagination()
+        page = paginator.paginate_queryset(challenges.values(*ChallengeSerializer.VALUES), request, view=self)
+        return paginator.get_paginated_response(ChallengeSerializer.rows(page))
@@ -0,0 +1,19 @@
+# tracker/api_urls.py
+# Mounted at api/<version>/ by tracker/urls.py; see tracker/api.py.
+
+from django.urls import path
+from rest_framework.authtoken.views import obtain_auth_token
+from . import api
+
+urlpatterns = [
+    path('auth/token/', obtain_auth_token, name='api-token'),
+    path('activities/', api.ActivityList.as_view(), name='api-activities'),
+    path('activities/<int:pk>/', api.ActivityDetail.as_view(), name='api-activity-detail'),
+    path('activities/<int:pk>/confirm/', api.ActivityConfirm.as_view(), name='api-activity-confirm'),
+    path('stats/', api.Stats.as_view(), name='api-stats'),
+    path('stats/history/', api.StatsHistory.as_view(), name='api-stats-history'),
+    path('stats/calendar/', api.StatsCalendar.as_view(), name='api-stats-calendar'),
+    path('simulations/', api.Simulations.as_view(), name='api-simulations'),
+    path('leaderboard/', api.Leaderboard.as_view(), name='api-leaderboard'),
+    path('challenges/', api.ChallengeList.as_view(), name='api-challenges'),
+]
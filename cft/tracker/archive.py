@@ -0,0 +1,200 @@
+"""
+Archival of old activities.
+
+`manage.py archive_activities` moves activities from months that ended more than
+ARCHIVE_AFTER_DAYS ago out of the activity table:
+
+- ArchivedMonth keeps one row per (user, month, category) with the activity count,
+  total kg CO2e and a bitmask of the days that had an activity.
+- ActivityArchive keeps the raw rows of each (user, month) as zlib-compressed JSON,
+  unless ARCHIVE_KEEP_RAW is off. archived_rows() reads them back.
+
+Only whole months are archived, so everything the dashboard, forecasts, insights and
+leaderboard read stays in the hot table. Reports that reach further back use the
+helpers at the bottom, which combine both: monthly_totals(), category_totals() and
+active_days().
+"""
+import json
+import zlib
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Activity, ActivityArchive, ArchivedMonth, DashboardSummary, Emission
+
+RAW_FIELDS = ['id', 'category', 'subtype', 'description', 'value', 'unit', 'timestamp', 'co2_kg', 'content_hash', 'idempotency_key']
+
+
+def _month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def _local_date(timestamp):
+    return timezone.localdate(timestamp) if timezone.is_aware(timestamp) else timestamp.date()
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def archive_cutoff(today=None):
+    """First day of the oldest month that stays in the activity table."""
+    today = today or date.today()
+    return _month_start(today - timedelta(days=settings.ARCHIVE_AFTER_DAYS))
+
+
+def compress_rows(rows):
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), 6)
+
+
+def decompress_rows(data):
+    return json.loads(zlib.decompress(bytes(data))) if data else []
+
+
+def archive_users(user_ids, cutoff, keep_raw=True, dry_run=False, batch_size=500):
+    """
+    Archives the given users' activities dated before `cutoff` (a first of the month).
+    Returns {'activities', 'months', 'co2_kg'} for what was (or would be) archived.
+    """
+    rows = (
+        # Quarantined activities stay hot until they're confirmed or deleted
+        Activity.objects.filter(user_id__in=user_ids, timestamp__lt=_start_of(cutoff), quarantined=False)
+        .order_by('user_id', 'timestamp')
+        .values_list('id', 'user_id', 'category', 'subtype', 'description', 'value', 'unit', 'timestamp',
+                     'emission__co2_equivalent_kg', 'content_hash', 'idempotency_key')
+    )
+    totals = defaultdict(lambda: [0, 0.0, 0])  # (user, month, category) -> [count, kg, day bits]
+    raw = defaultdict(list)  # (user, month) -> rows
+    activity_ids = []
+    for activity_id, user_id, category, subtype, description, value, unit, timestamp, co2, content_hash, key in rows.iterator(chunk_size=5000):
+        day = _local_date(timestamp)
+        month = _month_start(day)
+        entry = totals[(user_id, month, category)]
+        entry[0] += 1
+        entry[1] += co2 or 0
+        entry[2] |= 1 << (day.day - 1)
+        if keep_raw:
+            raw[(user_id, month)].append(
+                [activity_id, category, subtype, description, value, unit, timestamp.isoformat(), co2, content_hash, key]
+            )
+        activity_ids.append(activity_id)
+
+    stats = {
+        'activities': len(activity_ids),
+        'months': len({(user_id, month) for user_id, month, _ in totals}),
+        'co2_kg': sum(entry[1] for entry in totals.values()),
+    }
+    if dry_run or not activity_ids:
+        return stats
+
+    months = {month for _, month, _ in totals}
+    with transaction.atomic():
+        # Months archived on an earlier run (activities backdated since) are added to
+        existing = {
+            (row.user_id, row.month, row.category): row
+            for row in ArchivedMonth.objects.select_for_update().filter(user_id__in=user_ids, month__in=months)
+        }
+        new_rows, changed_rows = [], []
+        for key, (count, co2, bits) in totals.items():
+            row = existing.get(key)
+            if row is None:
+                new_rows.append(ArchivedMonth(user_id=key[0], month=key[1], category=key[2], activity_count=count, co2_kg=co2, active_days=bits))
+            else:
+                row.activity_count += count
+                row.co2_kg += co2
+                row.active_days |= bits
+                changed_rows.append(row)
+        ArchivedMonth.objects.bulk_create(new_rows, batch_size=batch_size)
+        ArchivedMonth.objects.bulk_update(changed_rows, ['activity_count', 'co2_kg', 'active_days'], batch_size=batch_size)
+
+        if raw:
+            archives = {
+                (archive.user_id, archive.month): archive
+                for archive in ActivityArchive.objects.select_for_update().filter(user_id__in=user_ids, month__in=months)
+            }
+            new_archives, changed_archives = [], []
+            for key, month_rows in raw.items():
+                archive = archives.get(key)
+                if archive is None:
+                    new_archives.append(ActivityArchive(user_id=key[0], month=key[1], row_count=len(month_rows), data=compress_rows(month_rows)))
+                else:
+                    month_rows = decompress_rows(archive.data) + month_rows
+                    archive.row_count = len(month_rows)
+                    archive.data = compress_rows(month_rows)
+                    changed_archives.append(archive)
+            ActivityArchive.objects.bulk_create(new_archives, batch_size=batch_size)
+            ActivityArchive.objects.bulk_update(changed_archives, ['row_count', 'data'], batch_size=batch_size)
+
+        for start in range(0, len(activity_ids), batch_size):
+            Activity.objects.filter(id__in=activity_ids[start:start + batch_size]).delete()
+        # Current totals don't change, but activity lists do; their API ETags follow updated_at
+        DashboardSummary.objects.filter(pk__in={user_id for user_id, _, _ in totals}).update(updated_at=timezone.now())
+    return stats
+
+
+def archived_rows(user, month):
+    """The raw activities archived for a user's month, as dicts (timestamps as ISO strings)."""
+    archive = ActivityArchive.objects.filter(user=user, month=_month_start(month)).first()
+    return [dict(zip(RAW_FIELDS, row)) for row in decompress_rows(archive.data if archive else None)]
+
+
+# --- Reports over hot and archived data ---
+
+def monthly_totals(user, start, end):
+    """{first of month: kg CO2e} for every month from start to end inclusive, zero-filled."""
+    first, last = _month_start(start), _month_start(end)
+    totals = {}
+    month = first
+    while month <= last:
+        totals[month] = 0.0
+        month = _next_month(month)
+
+    hot = (
+        Emission.objects.filter(activity__user=user, activity__quarantined=False, activity__timestamp__gte=_start_of(first), activity__timestamp__lt=_start_of(_next_month(last)))
+        .annotate(month=TruncMonth('activity__timestamp'))
+        .values('month').annotate(total=Sum('co2_equivalent_kg'))
+    )
+    for row in hot:
+        totals[_local_date(row['month'])] += row['total'] or 0
+
+    archived = ArchivedMonth.objects.filter(user=user, month__range=(first, last)).values('month').annotate(total=Sum('co2_kg'))
+    for row in archived:
+        totals[row['month']] += row['total'] or 0
+    return totals
+
+
+def category_totals(user, start, end):
+    """{category: kg CO2e} over whole months from start to end inclusive."""
+    first, last = _month_start(start), _month_start(end)
+    totals = defaultdict(float)
+    hot = (
+        Emission.objects.filter(activity__user=user, activity__quarantined=False, activity__timestamp__gte=_start_of(first), activity__timestamp__lt=_start_of(_next_month(last)))
+        .values('activity__category').annotate(total=Sum('co2_equivalent_kg'))
+    )
+    for row in hot:
+        totals[row['activity__category']] += row['total'] or 0
+    for row in ArchivedMonth.objects.filter(user=user, month__range=(first, last)).values('category').annotate(total=Sum('co2_kg')):
+        totals[row['category']] += row['total'] or 0
+    return dict(totals)
+
+
+def active_days(user):
+    """Every date the user logged an activity on, oldest first, archived months included."""
+    days = set(Activity.objects.filter(user=user).dates('timestamp', 'day'))
+    for month, bits in ArchivedMonth.objects.filter(user=user, active_days__gt=0).values_list('month', 'active_days'):
+        day = 0
+        while bits:
+            if bits & 1:
+                days.add(month + timedelta(days=day))
+            bits >>= 1
+            day += 1
+    return sorted(days)
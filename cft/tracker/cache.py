@@ -0,0 +1,75 @@
+"""
+Caching helpers for content that is the same for every visitor.
+
+get_or_recompute() keeps a value fresh for `ttl` seconds and then serves the stale copy
+for up to `grace` more while exactly one caller recomputes it (single flight), so an
+expiring entry never sends every concurrent request to the database at once.
+cache_anonymous_page() applies the same idea to whole responses for logged-out users.
+"""
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.http import HttpResponse
+
+STALE_GRACE = 300
+LOCK_TIMEOUT = 30
+# How long a request waits for another one to fill an empty cache before computing itself.
+COLD_WAIT = 2.0
+
+
+def get_or_recompute(key, compute, ttl, grace=STALE_GRACE):
+    """Returns the cached value for key, recomputing it with compute() when it goes stale."""
+    lock_key = f"{key}:lock"
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if fresh_until > time.time():
+            return value
+        # Stale: whoever takes the lock recomputes, everyone else gets the stale copy
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            return value
+    elif not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        # Cold cache and someone else is already computing; wait for their result
+        deadline = time.monotonic() + COLD_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+
+    try:
+        value = compute()
+        cache.set(key, (value, time.time() + ttl), ttl + grace)
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+def cache_anonymous_page(key, ttl=None):
+    """
+    Caches a view's whole response for anonymous GET requests.
+    Requests with a query string or pending flash messages always hit the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (
+                request.user.is_authenticated
+                or request.method != 'GET'
+                or request.GET
+                or CookieStorage.cookie_name in request.COOKIES
+            ):
+                return view(request, *args, **kwargs)
+
+            def render_page():
+                response = view(request, *args, **kwargs)
+                return response.status_code, response['Content-Type'], response.content
+
+            page_ttl = ttl if ttl is not None else settings.HOME_PAGE_CACHE_TTL
+            status, content_type, content = get_or_recompute(key, render_page, page_ttl)
+            return HttpResponse(content, content_type=content_type, status=status)
+        return wrapper
+    return decorator
@@ -1,39 +1,13 @@
-from .models import Activity, UserAchievement
-from datetime import date, timedelta
+from .models import UserAchievement
+from .streaks import streak_stats
 
 def global_context(request):
     if not request.user.is_authenticated:
         return {}
 
     # --- REAL STREAK CALCULATION ---
-    active_days_query = Activity.objects.filter(user=request.user).dates('timestamp', 'day', order='DESC')
-    active_days = {d.strftime("%Y-%m-%d") for d in active_days_query}
-    
-    total_active = len(active_days)
-    max_streak = 0
-    current_streak = 0
-    
-    today = date.today()
-    # Check a reasonable period back in time to calculate the streak
-    for i in range(365): 
-        check_date = today - timedelta(days=i)
-        if check_date.strftime("%Y-%m-%d") in active_days:
-            current_streak += 1
-        else:
-            if current_streak > max_streak:
-                max_streak = current_streak
-            # Optimization: if we're past the oldest activity and streak is 0, we can stop.
-            if i > total_active * 2 and current_streak == 0:
-                 break
-            current_streak = 0
-
-    if current_streak > max_streak:
-        max_streak = current_streak
-
-    streak_data = {
-        "total_active": total_active,
-        "max_streak": max_streak,
-    }
+    # Bit operations on the user's activity calendar, archived months included (see tracker/streaks.py)
+    streak_data = streak_stats(request.user)
 
     # --- REAL ACHIEVEMENT DATA ---
     earned_achievements_query = UserAchievement.objects.filter(user=request.user).select_related('achievement')
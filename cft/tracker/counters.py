@@ -0,0 +1,112 @@
+"""
+Platform-wide counters for the home page.
+
+PlatformCounters is a single row holding the number of users and activities, the kg
+CO2e logged, the days with an activity summed over users and the number of distinct
+profile locations. Writes move it incrementally: record_counts() applies F() deltas
+once the writing transaction commits, so the row is locked for one short UPDATE and
+never for the length of someone's activity transaction.
+
+Paths that can't tell their deltas cheaply (cascading user deletes, seeding) leave it
+to `manage.py recount_platform_counters`, which recomputes everything exactly and
+should run periodically, e.g. nightly.
+
+CO2 saved is derived on read: what users would have emitted at the national average
+(PLATFORM_BASELINE_KG_PER_DAY) on the days they logged, less what they did log.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Lower, Trim, TruncDate
+from django.utils import timezone
+
+from .models import Activity, ArchivedMonth, Emission, PlatformCounters, Profile, User
+
+COUNTER_FIELDS = ('user_count', 'activity_count', 'co2_logged_kg', 'active_user_days', 'region_count')
+
+
+def record_counts(**deltas):
+    """Adds deltas (by field name) to the counters after the current transaction commits."""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    def apply():
+        updates = {field: F(field) + delta for field, delta in deltas.items()}
+        if not PlatformCounters.objects.filter(pk=1).update(updated_at=timezone.now(), **updates):
+            # No row yet: the first recount includes this change
+            recount()
+    transaction.on_commit(apply)
+
+
+def location_changed(profile, old):
+    """Adjusts the region count after a profile's location changed from `old`."""
+    old, new = (old or '').strip(), (profile.location or '').strip()
+    if old.lower() == new.lower():
+        return
+    others = Profile.objects.exclude(pk=profile.pk)
+    delta = 0
+    if new and not others.filter(location__iexact=new).exists():
+        delta += 1
+    if old and not others.filter(location__iexact=old).exists():
+        delta -= 1
+    record_counts(region_count=delta)
+
+
+def _active_user_days(users_per_chunk=500):
+    """Days with an activity summed over users, archived months included, a chunk of users at a time."""
+    total = 0
+    last_id = 0
+    while True:
+        user_ids = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:users_per_chunk])
+        if not user_ids:
+            return total
+        last_id = user_ids[-1]
+        days = set(
+            Activity.objects.filter(user_id__in=user_ids).annotate(day=TruncDate('timestamp'))
+            .values_list('user_id', 'day').distinct()
+        )
+        # A month may have both archived rows and backdated hot ones, so days are unioned
+        months = defaultdict(int)
+        for user_id, month, bits in ArchivedMonth.objects.filter(user_id__in=user_ids, active_days__gt=0).values_list('user_id', 'month', 'active_days'):
+            months[(user_id, month)] |= bits
+        for (user_id, month), bits in months.items():
+            for day in range(bits.bit_length()):
+                if bits >> day & 1:
+                    days.add((user_id, month.replace(day=day + 1)))
+        total += len(days)
+
+
+def recount():
+    """Recomputes every counter exactly and stores them. Returns the row."""
+    hot = Emission.objects.filter(activity__quarantined=False).aggregate(kg=Sum('co2_equivalent_kg'))
+    archived = ArchivedMonth.objects.aggregate(activities=Sum('activity_count'), kg=Sum('co2_kg'))
+    regions = (
+        Profile.objects.annotate(region=Lower(Trim('location'))).exclude(region='').exclude(region__isnull=True)
+        .values('region').distinct().count()
+    )
+    values = {
+        'user_count': User.objects.count(),
+        'activity_count': Activity.objects.count() + (archived['activities'] or 0),
+        'co2_logged_kg': (hot['kg'] or 0) + (archived['kg'] or 0),
+        'active_user_days': _active_user_days(),
+        'region_count': regions,
+        'reconciled_at': timezone.now(),
+    }
+    counters, _ = PlatformCounters.objects.update_or_create(pk=1, defaults=values)
+    return counters
+
+
+def platform_stats():
+    """The home page's global stats, from the counters row (counted exactly the first time)."""
+    counters = PlatformCounters.objects.filter(pk=1).first() or recount()
+    baseline_kg = counters.active_user_days * settings.PLATFORM_BASELINE_KG_PER_DAY
+    return {
+        'totalUsers': counters.user_count,
+        'co2Saved': round(max(baseline_kg - counters.co2_logged_kg, 0) / 1000),
+        'regionsCount': counters.region_count,
+        # Tonnes a year at the users' average daily footprint, for the country comparison
+        'userAverage': round(counters.co2_logged_kg / counters.active_user_days * 365 / 1000, 1) if counters.active_user_days else None,
+    }
@@ -0,0 +1,43 @@
+"""
+Database routing for deployments with a read replica.
+
+Writes and ordinary reads always use 'default', so a user sees their own changes
+immediately. Read-heavy, staleness-tolerant queries (leaderboard, dashboard charts,
+map counts) opt in to the replica by running inside `read_from_replica()`. Without a
+'replica' alias in settings.DATABASES everything stays on 'default'.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+
+_use_replica = contextvars.ContextVar('tracker_use_replica', default=False)
+
+
+@contextmanager
+def read_from_replica():
+    """Routes reads made inside the block to the replica, if one is configured."""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and REPLICA_ALIAS in settings.DATABASES:
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,114 @@
+"""
+Duplicate protection for activity writes.
+
+Two unique indexes on Activity stop the same activity from being stored twice:
+
+- (user, idempotency_key): clients send a key with each submission, either the
+  activity form's hidden field or an Idempotency-Key header. A retry carrying the same
+  key gets the activity that was already stored instead of a second one.
+- (user, content_hash): a hash of category, subtype, value, unit and the timestamp
+  rounded down to ACTIVITY_DEDUPE_BUCKET_SECONDS. It catches double submits and
+  repeated device pushes that don't send a key.
+
+create_activity() writes one activity and falls back to the stored row when an index
+rejects it. bulk_create_activities() inserts with ignore_conflicts, so a batch never
+fails because some of it was already there. Rows written before these indexes existed
+have no hash; `manage.py merge_duplicate_activities` backfills them and merges the
+duplicates.
+"""
+import hashlib
+from datetime import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+MAX_IDEMPOTENCY_KEY_LENGTH = 64
+
+
+def time_bucket(timestamp):
+    return int(timestamp.timestamp()) // settings.ACTIVITY_DEDUPE_BUCKET_SECONDS
+
+
+def content_hash(user_id, category, subtype, value, unit, timestamp, occurrence=0):
+    """
+    Hex digest identifying an activity's content. `occurrence` tells apart genuine
+    repeats that share a bucket, such as two identical purchases on one statement day.
+    """
+    bucket = time_bucket(timestamp) if isinstance(timestamp, datetime) else timestamp
+    key = f"{user_id}|{category}|{subtype}|{float(value):.6f}|{unit}|{bucket}"
+    if occurrence:
+        key += f"|{occurrence}"
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def activity_hash(activity, occurrence=0):
+    return content_hash(
+        activity.user_id, activity.category, activity.subtype, activity.value, activity.unit, activity.timestamp, occurrence,
+    )
+
+
+def idempotency_key(request):
+    """The key a request was sent with (header first, then form field), or None."""
+    key = request.headers.get(IDEMPOTENCY_HEADER) or request.POST.get(IDEMPOTENCY_FIELD)
+    key = (key or '').strip()
+    return key[:MAX_IDEMPOTENCY_KEY_LENGTH] or None
+
+
+def find_duplicate(activity):
+    """The stored activity that `activity` duplicates, by key or content hash, or None."""
+    Activity = apps.get_model('tracker', 'Activity')
+    stored = Activity.objects.filter(user_id=activity.user_id).select_related('emission')
+    if activity.idempotency_key:
+        match = stored.filter(idempotency_key=activity.idempotency_key).first()
+        if match is not None:
+            return match
+    return stored.filter(content_hash=activity.content_hash).first()
+
+
+def create_activity(activity, footprint):
+    """
+    Saves an unsaved activity and its emission. Returns (activity, created); when the
+    activity is a duplicate, nothing is written and the stored one is returned instead.
+    """
+    Emission = apps.get_model('tracker', 'Emission')
+    try:
+        # Savepoint, so a rejected insert leaves the caller's transaction usable.
+        # Activity.save() fills in content_hash.
+        with transaction.atomic():
+            activity.save()
+            Emission.objects.create(activity=activity, co2_equivalent_kg=footprint)
+    except IntegrityError:
+        activity.pk = None
+        duplicate = find_duplicate(activity)
+        if duplicate is None:
+            raise
+        return duplicate, False
+    return activity, True
+
+
+def bulk_create_activities(activities, footprints):
+    """
+    Inserts activities (with content_hash set) and their emissions, skipping any the
+    unique indexes reject. Returns the inserted activities, with primary keys.
+    """
+    Activity = apps.get_model('tracker', 'Activity')
+    Emission = apps.get_model('tracker', 'Emission')
+    footprint_by_key = {(activity.user_id, activity.content_hash): footprint for activity, footprint in zip(activities, footprints)}
+    with transaction.atomic():
+        # Primary keys aren't returned for ignore_conflicts inserts, so the new rows are
+        # found again by hash: they are the matching rows that don't have an emission yet
+        Activity.objects.bulk_create(activities, ignore_conflicts=True)
+        inserted = list(Activity.objects.filter(
+            user_id__in={user_id for user_id, _ in footprint_by_key},
+            content_hash__in={content_hash for _, content_hash in footprint_by_key},
+            emission__isnull=True,
+        ))
+        inserted = [activity for activity in inserted if (activity.user_id, activity.content_hash) in footprint_by_key]
+        Emission.objects.bulk_create([
+            Emission(activity=activity, co2_equivalent_kg=float(footprint_by_key[(activity.user_id, activity.content_hash)]))
+            for activity in inserted
+        ], ignore_conflicts=True)
+    return inserted
@@ -0,0 +1,99 @@
+"""
+Emission factor table and footprint calculations.
+
+Factors are kg CO2e per base unit of activity value (see tracker/units.py): per km
+for transport, per kWh for energy, per serving for food and per USD spent for
+consumption; fuel logged in litres and travel or food known only by what was spent
+(statement imports) use FUEL_FACTORS and SPEND_FACTORS instead. The same table
+backs the activity form and the bulk recalculation job, so a factor change here is
+all that's needed before running `manage.py recalculate_footprints`.
+"""
+import re
+
+import numpy as np
+
+from .units import get_converter
+
+EMISSION_FACTORS = {
+    'transport': {'car-gasoline': 0.25, 'bus': 0.1, 'flight-short': 0.2, 'car-electric': 0.05, 'train': 0.04, 'motorcycle': 0.1, 'bicycle': 0, 'walking': 0, 'flight-long': 0.25},
+    'energy': {'electricity': 0.39, 'natural-gas': 0.18},
+    'food': {'red-meat': 7.1, 'white-meat': 2.5, 'fish': 1.5, 'vegetarian': 1.0, 'vegan': 0.7, 'other': 1.2},
+    'consumption': {'clothing': 0.1, 'electronics': 0.5, 'home-goods': 0.3, 'services': 0.05, 'other': 0.2},
+}
+
+# Used when a subtype isn't in the table above (e.g. an unknown transport mode).
+DEFAULT_FACTORS = {'transport': 0.15, 'energy': 0.39, 'food': 1.0, 'consumption': 0.2}
+
+# kg CO2e per litre of fuel burned, for transport logged by fuel rather than distance.
+FUEL_FACTORS = {'car-gasoline': 2.31, 'motorcycle': 2.31, 'bus': 2.68, 'flight-short': 2.53, 'flight-long': 2.53}
+DEFAULT_FUEL_FACTOR = 2.31
+
+# kg CO2e per USD spent, for travel and food known only from a bank statement line.
+SPEND_FACTORS = {
+    'transport': {'fuel': 1.9, 'taxi': 0.6, 'flight': 1.1, 'train': 0.3, 'public-transport': 0.3},
+    'food': {'groceries': 0.5, 'dining': 0.4},
+}
+DEFAULT_SPEND_FACTORS = {'transport': 0.6, 'food': 0.45}
+
+# Descriptions are written by views.activity as e.g. "Travel: Car Gasoline - 12.0 km",
+# "Food: Red Meat (2.0 servings)" or "Purchase: Home Goods - ₹1,000.00".
+DESCRIPTION_RE = re.compile(r'^(?P<prefix>Travel|Energy|Food|Purchase):\s*(?P<label>.+?)\s*(?:\(| - )')
+
+
+def get_factor(category, subtype, dimension=None):
+    """
+    Returns the kg CO2e factor for a (category, subtype) pair: per litre when dimension
+    is 'volume', per USD for transport and food amounts in a currency.
+    """
+    if dimension == 'volume':
+        return FUEL_FACTORS.get(subtype, DEFAULT_FUEL_FACTOR)
+    if dimension == 'currency' and category in SPEND_FACTORS:
+        return SPEND_FACTORS[category].get(subtype, DEFAULT_SPEND_FACTORS[category])
+    return EMISSION_FACTORS.get(category, {}).get(subtype, DEFAULT_FACTORS.get(category, 0))
+
+
+def calculate_footprint(category, subtype, value, unit=None, when=None):
+    """
+    Footprint in kg CO2e for a single activity, rounded the way it is stored.
+    `when` picks the exchange rate for currency amounts (latest if omitted).
+    """
+    converter = get_converter()
+    base_value = converter.convert(value, unit, when)
+    return round(base_value * get_factor(category, subtype, converter.dimension(unit)), 2)
+
+
+def parse_subtype(category, description):
+    """
+    Recovers the subtype slug (e.g. 'car-gasoline') from an activity description.
+    Energy entries are electricity unless another source is named; returns '' if
+    nothing can be parsed.
+    """
+    match = DESCRIPTION_RE.match(description or '')
+    subtype = match.group('label').strip().lower().replace(' ', '-') if match else ''
+    if category == 'energy' and subtype not in EMISSION_FACTORS['energy']:
+        return 'electricity'
+    return subtype
+
+
+def calculate_footprints(categories, subtypes, values, units, dates=None):
+    """
+    Vectorized version of calculate_footprint.
+
+    Takes parallel sequences (dates optional, for exchange rates) and returns a float64
+    array of footprints. Factor and unit lookups are done once per distinct key rather
+    than once per row.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.size == 0:
+        return values
+
+    converter = get_converter()
+    unique_units, unit_index = np.unique(np.asarray(units, dtype=str), return_inverse=True)
+    dimensions = np.array([converter.dimension(unit) or '' for unit in unique_units], dtype=str)[unit_index]
+
+    keys = np.char.add(np.char.add(np.asarray(categories, dtype=str), ':'), np.asarray(subtypes, dtype=str))
+    keys = np.char.add(np.char.add(keys, ':'), dimensions)
+    unique_keys, key_index = np.unique(keys, return_inverse=True)
+    factors = np.array([get_factor(*key.split(':', 2)) for key in unique_keys], dtype=np.float64)
+
+    return np.round(converter.normalize(values, units, dates) * factors[key_index], 2)
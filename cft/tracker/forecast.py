@@ -0,0 +1,145 @@
+"""
+End-of-month emission forecasts.
+
+Daily emission totals for a batch of users are loaded into a (users x days) matrix and
+every user is forecast at once with array operations:
+
+* 'ses'            simple exponential smoothing of the daily level, shaped by each
+                   user's weekday profile (e.g. more driving on weekdays)
+* 'seasonal-naive' each remaining day repeats the same weekday of the last full week
+
+The projection is month-to-date plus the forecast for the rest of the month. New
+activities only move the month-to-date part, so views keep the stored forecast current
+with a single UPDATE (record_emission_change) and the smoothing state is recomputed
+once a day, either by `manage.py forecast_emissions` or lazily on first read.
+"""
+import calendar
+from datetime import date, timedelta
+
+import numpy as np
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Emission, EmissionForecast
+
+# Days of daily totals used to fit the models (today excluded, it isn't over yet).
+HISTORY_DAYS = 56
+SMOOTHING_ALPHA = 0.3
+# Projected share of the budget at which dashboards start warning.
+WARNING_THRESHOLD = 100
+METHODS = ('ses', 'seasonal-naive')
+
+
+def daily_matrix(user_ids, start, end):
+    """(len(user_ids), days) array of daily kg CO2e totals between start and end inclusive."""
+    days = (end - start).days + 1
+    matrix = np.zeros((len(user_ids), days))
+    rows = (
+        Emission.objects.filter(activity__user_id__in=user_ids, activity__quarantined=False, activity__timestamp__date__gte=start, activity__timestamp__date__lte=end)
+        .values_list('activity__user_id', 'activity__timestamp__date')
+        .annotate(total=Sum('co2_equivalent_kg'))
+        .order_by()
+    )
+    if rows:
+        position = {user_id: i for i, user_id in enumerate(user_ids)}
+        user_idx, day_idx, totals = zip(*[(position[u], (d - start).days, t) for u, d, t in rows])
+        np.add.at(matrix, (np.array(user_idx), np.array(day_idx)), np.array(totals, dtype=np.float64))
+    return matrix
+
+
+def exponential_smoothing(history, alpha=SMOOTHING_ALPHA):
+    """Final smoothed level per row, starting from the mean of the first week."""
+    level = history[:, :7].mean(axis=1)
+    for day in range(7, history.shape[1]):
+        level = alpha * history[:, day] + (1 - alpha) * level
+    return level
+
+
+def weekday_profile(history, first_day):
+    """(users, 7) multiplicative weekday index, Monday first; flat for users with no history."""
+    weekdays = (np.arange(history.shape[1]) + first_day.weekday()) % 7
+    sums = np.stack([history[:, weekdays == wd].sum(axis=1) for wd in range(7)], axis=1)
+    counts = np.bincount(weekdays, minlength=7)
+    means = sums / np.maximum(counts, 1)
+    overall = means.mean(axis=1, keepdims=True)
+    return np.divide(means, overall, out=np.ones_like(means), where=overall > 0)
+
+
+def forecast_users(user_ids, today=None, method='ses'):
+    """
+    Forecasts month-end emissions for a batch of users.
+    Returns {user_id: (month_to_date_kg, remaining_kg)}.
+    """
+    today = today or date.today()
+    month_start = today.replace(day=1)
+    month_end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+    history_start = today - timedelta(days=HISTORY_DAYS)
+
+    matrix = daily_matrix(user_ids, min(history_start, month_start), today)
+    offset = (history_start - min(history_start, month_start)).days
+    history = matrix[:, offset:-1]
+    month_to_date = matrix[:, (month_start - min(history_start, month_start)).days:].sum(axis=1)
+
+    remaining_weekdays = np.array([(today + timedelta(days=i)).weekday() for i in range(1, (month_end - today).days + 1)], dtype=int)
+    if remaining_weekdays.size == 0:
+        remaining = np.zeros(len(user_ids))
+    elif method == 'seasonal-naive':
+        last_week = history[:, -7:]
+        last_week_weekdays = np.array([(today - timedelta(days=7 - i)).weekday() for i in range(7)])
+        by_weekday = last_week[:, np.argsort(last_week_weekdays)]
+        remaining = by_weekday[:, remaining_weekdays].sum(axis=1)
+    else:
+        level = exponential_smoothing(history)
+        profile = weekday_profile(history, history_start)
+        remaining = level * profile[:, remaining_weekdays].sum(axis=1)
+
+    return {user_id: (float(month_to_date[i]), float(remaining[i])) for i, user_id in enumerate(user_ids)}
+
+
+def save_forecasts(results, today=None, method='ses'):
+    """Upserts EmissionForecast rows for the given {user_id: (mtd, remaining)} results."""
+    today = today or date.today()
+    EmissionForecast.objects.bulk_create(
+        [
+            EmissionForecast(user_id=user_id, as_of=today, month_to_date_kg=round(mtd, 2), remaining_kg=round(remaining, 2), method=method)
+            for user_id, (mtd, remaining) in results.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['as_of', 'month_to_date_kg', 'remaining_kg', 'method', 'updated_at'],
+    )
+
+
+def get_forecast(user, today=None):
+    """The user's current forecast, recomputing it if it was made on an earlier day."""
+    today = today or date.today()
+    forecast = EmissionForecast.objects.filter(user=user).first()
+    if forecast is None or forecast.as_of != today:
+        method = forecast.method if forecast else 'ses'
+        save_forecasts(forecast_users([user.id], today, method), today, method)
+        forecast = EmissionForecast.objects.get(user=user)
+    return forecast
+
+
+def record_emission_change(user, when, delta_kg, today=None):
+    """
+    Applies an emission added/edited/removed on `when` to the stored forecast.
+    Only this month's activity moves the projection; the next daily refresh absorbs the rest.
+    """
+    today = today or date.today()
+    day = timezone.localdate(when) if timezone.is_aware(when) else when
+    if not delta_kg or (day.year, day.month) != (today.year, today.month):
+        return
+    EmissionForecast.objects.filter(user=user, as_of=today).update(month_to_date_kg=F('month_to_date_kg') + delta_kg)
+
+
+def budget_projection(user, budget_kg, today=None):
+    """Projected month-end usage against the user's budget, shaped for the dashboards."""
+    forecast = get_forecast(user, today)
+    projected = forecast.projected_kg
+    percentage = round(projected / budget_kg * 100) if budget_kg > 0 else 100
+    return {
+        'projected': round(projected, 2),
+        'percentage': percentage,
+        'warning': percentage >= WARNING_THRESHOLD,
+    }
@@ -5,7 +5,8 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.db import transaction
 from .models import Profile
-from .models import User, Profile, Challenge, Community
+from .models import User, Profile, Challenge, Community, StatementImport
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
 
 class UserRegisterForm(UserCreationForm):
@@ -77,4 +78,25 @@ class ChallengeForm(forms.ModelForm):
         fields = ['community', 'title', 'description', 'goal', 'unit', 'reward_achievement', 'end_date']
         help_texts = {
             'reward_achievement': 'Optional. Select a badge to award upon completion.'
-        }
\ No newline at end of file
+        }
+
+class StatementUploadForm(forms.ModelForm):
+    class Meta:
+        model = StatementImport
+        fields = ['kind', 'file']
+        help_texts = {
+            'file': 'CSV export, or a PDF/text statement. Up to 20 MB.'
+        }
+
+    def __init__(self, *args, **kwargs):
+        super(StatementUploadForm, self).__init__(*args, **kwargs)
+        self.fields['kind'].widget.attrs.update({'class': 'custom-select'})
+        self.fields['file'].widget.attrs.update({'class': 'form-control-file', 'accept': '.csv,.pdf,.txt'})
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if not upload.name.lower().endswith(('.csv', '.pdf', '.txt')):
+            raise forms.ValidationError('Upload a .csv, .pdf or .txt file.')
+        if upload.size > settings.STATEMENT_MAX_UPLOAD_BYTES:
+            raise forms.ValidationError(f'Files can be at most {settings.STATEMENT_MAX_UPLOAD_BYTES // (1024 * 1024)} MB.')
+        return upload
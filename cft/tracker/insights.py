@@ -0,0 +1,209 @@
+"""
+Batch insight generation.
+
+Each user's recent activity history is loaded into a pandas DataFrame and turned
+into a short, ranked list of insights:
+
+* substitution savings (e.g. car trips -> train), priced with the emission factors
+* the biggest single source of emissions (category / subtype)
+* when in the week energy use peaks (hour-of-week histogram)
+
+`manage.py generate_insights` runs this over every user with new activity since
+their last run and stores the result in the Insight table, which the profile and
+home views read directly.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .footprint import get_factor
+from .units import get_converter
+from .models import Activity, Insight, Profile
+
+# Days of history each run looks at.
+HISTORY_DAYS = 90
+# Insights kept per user.
+MAX_INSIGHTS = 5
+
+# (category, from subtype) -> (to subtype, icon, phrasing of the swap)
+SUBSTITUTIONS = {
+    ('transport', 'car-gasoline'): ('train', 'fas fa-train', "Switching your petrol car trips to the train"),
+    ('transport', 'motorcycle'): ('bus', 'fas fa-bus', "Taking the bus instead of your motorcycle"),
+    ('transport', 'flight-short'): ('train', 'fas fa-train', "Replacing short flights with the train"),
+    ('food', 'red-meat'): ('white-meat', 'fas fa-drumstick-bite', "Swapping red meat for chicken or other white meat"),
+    ('food', 'white-meat'): ('vegetarian', 'fas fa-seedling', "Going vegetarian for your white-meat meals"),
+}
+
+CATEGORY_ICONS = {
+    'transport': 'fas fa-car',
+    'energy': 'fas fa-bolt',
+    'food': 'fas fa-utensils',
+    'consumption': 'fas fa-shopping-bag',
+    'waste': 'fas fa-trash',
+}
+
+# Hour ranges used to describe a peak in plain words.
+DAY_PARTS = [(0, 6, 'nights'), (6, 12, 'mornings'), (12, 17, 'afternoons'), (17, 22, 'evenings'), (22, 24, 'nights')]
+
+FRAME_COLUMNS = ['user_id', 'timestamp', 'category', 'subtype', 'value', 'unit', 'co2']
+
+
+def load_activity_frame(user_ids, since):
+    """Loads activities (with their emissions) for a batch of users in a single query."""
+    rows = Activity.objects.filter(
+        user_id__in=user_ids, timestamp__gte=since, emission__isnull=False, quarantined=False,
+    ).values_list('user_id', 'timestamp', 'category', 'subtype', 'value', 'unit', 'emission__co2_equivalent_kg')
+    return pd.DataFrame.from_records(list(rows), columns=FRAME_COLUMNS)
+
+
+def hour_of_week_histogram(timestamps, weights):
+    """168-bin histogram (Monday 00:00 = bin 0) of weights by hour of the week."""
+    if len(timestamps) == 0:
+        return np.zeros(168)
+    ts = pd.DatetimeIndex(timestamps)
+    slots = ts.dayofweek.to_numpy() * 24 + ts.hour.to_numpy()
+    return np.bincount(slots, weights=np.asarray(weights, dtype=np.float64), minlength=168)
+
+
+def describe_peak(histogram):
+    """Returns (phrase, share) for the weekday/weekend part of day holding the most weight."""
+    by_day = histogram.reshape(7, 24)
+    best_label, best_total = None, 0.0
+    for days, day_label in ((slice(0, 5), 'weekday'), (slice(5, 7), 'weekend')):
+        for start, end, part in DAY_PARTS:
+            total = by_day[days, start:end].sum()
+            if total > best_total:
+                best_label, best_total = f"{day_label} {part}", total
+    grand_total = histogram.sum()
+    return best_label, (best_total / grand_total if grand_total else 0.0)
+
+
+def build_insights(frame, days=HISTORY_DAYS):
+    """
+    Builds a ranked list of insight dicts from one user's activity frame.
+    Insights with a quantified saving rank first, largest saving first.
+    """
+    if frame.empty or frame['co2'].sum() <= 0:
+        return []
+
+    months = days / 30
+    total = frame['co2'].sum()
+    insights = []
+
+    # Substitution savings, priced per (category, subtype) using the factor table
+    by_subtype = frame.groupby(['category', 'subtype', 'unit'], sort=False)['value'].sum()
+    savings = {}
+    converter = get_converter()
+    for (category, subtype, unit), value in by_subtype.items():
+        swap = SUBSTITUTIONS.get((category, subtype))
+        if not swap:
+            continue
+        scaled = converter.convert(value, unit)
+        dimension = converter.dimension(unit)
+        saving = scaled * (get_factor(category, subtype, dimension) - get_factor(category, swap[0], dimension)) / months
+        savings[(category, subtype)] = savings.get((category, subtype), 0.0) + saving
+    for (category, subtype), saving in savings.items():
+        if saving < 0.5:
+            continue
+        _, icon, phrase = SUBSTITUTIONS[(category, subtype)]
+        insights.append({
+            'kind': 'substitution',
+            'icon': icon,
+            'text': f"{phrase} could save ~{saving:.0f}kg CO₂e a month.",
+            'impact': f"Potential save: {saving:.1f}kg CO2/month",
+            'saving_kg': round(saving, 2),
+        })
+
+    # Biggest single contributor
+    co2_by_subtype = frame.groupby(['category', 'subtype'])['co2'].sum()
+    (top_category, top_subtype), top_co2 = co2_by_subtype.idxmax(), co2_by_subtype.max()
+    label = (top_subtype or top_category).replace('-', ' ').title()
+    insights.append({
+        'kind': 'top_contributor',
+        'icon': CATEGORY_ICONS.get(top_category, 'fas fa-chart-pie'),
+        'text': f"{label} is your biggest source: {top_co2 / total:.0%} of your footprint over the last {days} days.",
+        'impact': f"{top_co2:.1f}kg CO2 in {days} days",
+        'saving_kg': 0,
+    })
+
+    # Category mix, only worth saying if one category dominates
+    co2_by_category = frame.groupby('category')['co2'].sum()
+    if len(co2_by_category) > 1 and co2_by_category.max() / total >= 0.5:
+        category = co2_by_category.idxmax()
+        insights.append({
+            'kind': 'top_category',
+            'icon': CATEGORY_ICONS.get(category, 'fas fa-chart-pie'),
+            'text': f"{dict(Activity.ACTIVITY_CATEGORIES)[category]} makes up {co2_by_category.max() / total:.0%} of your emissions.",
+            'impact': f"{co2_by_category.max():.1f}kg CO2 in {days} days",
+            'saving_kg': 0,
+        })
+
+    # When energy use peaks during the week
+    energy = frame[frame['category'] == 'energy']
+    if len(energy) >= 5:
+        peak, share = describe_peak(hour_of_week_histogram(energy['timestamp'], energy['co2']))
+        if peak and share >= 0.3:
+            insights.append({
+                'kind': 'peak_time',
+                'icon': 'fas fa-clock',
+                'text': f"You use the most electricity on {peak} ({share:.0%} of your energy emissions).",
+                'impact': "Try shifting heavy appliances to other times",
+                'saving_kg': 0,
+            })
+
+    insights.sort(key=lambda item: -item['saving_kg'])
+    return insights[:MAX_INSIGHTS]
+
+
+def compute_insights_for_users(user_ids, days=HISTORY_DAYS):
+    """
+    Read-only half of the pipeline, safe to run in a worker process.
+    Returns {user_id: [insight dicts]} for every user id passed in.
+    """
+    frame = load_activity_frame(user_ids, timezone.now() - timedelta(days=days))
+    results = {user_id: [] for user_id in user_ids}
+    for user_id, user_frame in frame.groupby('user_id', sort=False):
+        results[user_id] = build_insights(user_frame, days)
+    return results
+
+
+def users_needing_insights():
+    """Ids of users with activity newer than their insights watermark."""
+    return list(
+        Activity.objects.filter(id__gt=F('user__profile__insights_watermark'))
+        .values_list('user_id', flat=True).distinct().order_by('user_id')
+    )
+
+
+def save_insights(results, watermarks):
+    """Replaces stored insights for the given users and advances their watermarks."""
+    with transaction.atomic():
+        Insight.objects.filter(user_id__in=list(results)).delete()
+        created = Insight.objects.bulk_create([
+            Insight(user_id=user_id, rank=rank, **item)
+            for user_id, items in results.items()
+            for rank, item in enumerate(items, start=1)
+        ])
+        for user_id, watermark in watermarks.items():
+            Profile.objects.filter(user_id=user_id).update(insights_watermark=watermark)
+    return len(created)
+
+
+def activity_watermarks(user_ids):
+    """Newest activity id per user, read before computing so later writes are picked up next run."""
+    return dict(
+        Activity.objects.filter(user_id__in=user_ids)
+        .values('user_id').annotate(last_id=Max('id')).values_list('user_id', 'last_id')
+    )
+
+
+def insights_for_display(user, limit=3):
+    """The user's top stored insights, in the shape the templates expect."""
+    return [
+        {'text': insight.text, 'icon': insight.icon, 'impact': insight.impact}
+        for insight in Insight.objects.filter(user=user).order_by('rank')[:limit]
+    ]
@@ -0,0 +1,284 @@
+"""
+Live leaderboard and challenge updates, pushed to browsers as server-sent events.
+
+Publishers (the leaderboard recompute, UserChallenge signals) call publish() from any
+thread. Messages go through a broker into this process's Hub, which fans them out to
+the subscribers of each topic:
+
+    leaderboard          the top of the 30-day leaderboard plus the rows that changed
+    challenge:<id>       participant, completion and average progress totals
+
+The Hub coalesces: only the newest message per topic is kept, topics are flushed at most
+once every LIVE_COALESCE_SECONDS, unchanged messages are dropped, and a slow subscriber
+only ever has the latest message per topic waiting. A burst of updates to one popular
+challenge therefore costs each client one event per window, not one per update.
+
+LocalBroker delivers in-process and is the default (and the stub for development).
+Point LIVE_BROKER at RedisBroker when running several server processes so that every
+process sees every update. Streaming needs the ASGI application (cft.asgi); under WSGI
+the feed answers with the current state and lets the browser reconnect later.
+"""
+import asyncio
+import json
+import re
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Avg, Count, Q
+from django.utils.module_loading import import_string
+
+from .models import Challenge, UserChallenge
+
+LEADERBOARD_TOPIC = 'leaderboard'
+LEADERBOARD_SIZE = 5
+TOPIC_RE = re.compile(r'^(leaderboard|challenge:\d+)$')
+MAX_TOPICS = 50
+
+
+class Subscription:
+    """One client's view of the hub: the latest undelivered message per topic."""
+
+    def __init__(self, hub, topics):
+        self.hub = hub
+        self.topics = frozenset(topics)
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def deliver(self, topic, message):
+        self.pending[topic] = message
+        self.ready.set()
+
+    async def get(self, timeout=None):
+        """Waits for the next batch of {topic: message}; returns {} if `timeout` passes first."""
+        if not self.pending:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return {}
+        self.ready.clear()
+        batch, self.pending = self.pending, {}
+        return batch
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class Hub:
+    """In-process fan-out. Subscriptions live on one event loop; receive() is thread-safe."""
+
+    def __init__(self, coalesce_seconds=1.0):
+        self.coalesce_seconds = coalesce_seconds
+        self.subscribers = defaultdict(set)
+        # Last message flushed per topic, so new subscribers start from the current state
+        self.latest = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.loop = None
+        self.flush_scheduled = False
+
+    def subscribe(self, topics):
+        self.loop = asyncio.get_running_loop()
+        subscription = Subscription(self, topics)
+        for topic in subscription.topics:
+            self.subscribers[topic].add(subscription)
+            if topic in self.latest:
+                subscription.deliver(topic, self.latest[topic])
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for topic in subscription.topics:
+            subscribers = self.subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[topic]
+
+    def subscriber_count(self, topic):
+        return len(self.subscribers.get(topic, ()))
+
+    def receive(self, topic, message):
+        """Queues a message for the next flush. Called by the broker, from any thread."""
+        with self.lock:
+            if self.loop is None or self.loop.is_closed():
+                # Nobody is streaming from this process; just remember the state
+                self.latest[topic] = message
+                return
+            self.pending[topic] = message
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+        self.loop.call_soon_threadsafe(self.loop.call_later, self.coalesce_seconds, self.flush)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flush_scheduled = False
+        for topic, message in pending.items():
+            if self.latest.get(topic) == message:
+                continue
+            self.latest[topic] = message
+            for subscription in self.subscribers.get(topic, ()):
+                subscription.deliver(topic, message)
+
+
+class LocalBroker:
+    """Delivers straight to this process's hub."""
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, topic, message):
+        self.deliver(topic, message)
+
+
+class RedisBroker:
+    """Relays messages through Redis pub/sub so every server process receives them. Needs `redis`."""
+    channel = 'cft:live'
+
+    def __init__(self, deliver):
+        import redis
+
+        self.deliver = deliver
+        self.client = redis.Redis.from_url(settings.LIVE_BROKER_URL)
+        threading.Thread(target=self.listen, name='cft-live-broker', daemon=True).start()
+
+    def publish(self, topic, message):
+        self.client.publish(self.channel, json.dumps([topic, message]))
+
+    def listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for item in pubsub.listen():
+            topic, message = json.loads(item['data'])
+            self.deliver(topic, message)
+
+
+hub = Hub(getattr(settings, 'LIVE_COALESCE_SECONDS', 1.0))
+_broker = None
+_refresher = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(getattr(settings, 'LIVE_BROKER', 'tracker.live.LocalBroker'))
+                _broker = broker_class(hub.receive)
+    return _broker
+
+
+def publish(topic, message):
+    get_broker().publish(topic, message)
+
+
+# --- Leaderboard ---
+
+def leaderboard_rows(leaderboard_data):
+    return [
+        {
+            'rank': rank, 'user': row['username'], 'emission': round(row['emission'], 1),
+            'reduction': row['reduction'], 'trend': row['trend'],
+        }
+        for rank, row in enumerate(leaderboard_data[:LEADERBOARD_SIZE], start=1)
+    ]
+
+
+def publish_leaderboard(leaderboard_data):
+    """Broadcasts the top of a freshly computed leaderboard, if it differs from the last one."""
+    rows = leaderboard_rows(leaderboard_data)
+    previous = {row['user']: row for row in (hub.latest.get(LEADERBOARD_TOPIC) or {}).get('rows', [])}
+    changed = [row for row in rows if previous.get(row['user']) != row]
+    removed = sorted(set(previous) - {row['user'] for row in rows})
+    if changed or removed:
+        publish(LEADERBOARD_TOPIC, {'rows': rows, 'changed': [row['user'] for row in changed], 'removed': removed})
+
+
+def refresh_leaderboard():
+    # Goes through the shared cache, so this only recomputes (and publishes) once per TTL
+    from .views import cached_leaderboard_data
+    return cached_leaderboard_data()
+
+
+# --- Challenges ---
+
+def challenge_totals(challenge_id):
+    totals = UserChallenge.objects.filter(challenge_id=challenge_id).aggregate(
+        participants=Count('id'),
+        completed=Count('id', filter=Q(is_completed=True)),
+        average_progress=Avg('progress'),
+    )
+    goal = Challenge.objects.filter(pk=challenge_id).values_list('goal', flat=True).first() or 0
+    average = totals['average_progress'] or 0
+    return {
+        'id': challenge_id,
+        'participants': totals['participants'],
+        'completed': totals['completed'],
+        'average_percentage': min(round(average / goal * 100), 100) if goal > 0 else 0,
+    }
+
+
+def publish_challenge(challenge_id):
+    publish(f'challenge:{challenge_id}', challenge_totals(challenge_id))
+
+
+def snapshot(topic):
+    """The current state of a topic, for subscribers that arrive before any update."""
+    if topic == LEADERBOARD_TOPIC:
+        return {'rows': leaderboard_rows(refresh_leaderboard()), 'changed': [], 'removed': []}
+    return challenge_totals(int(topic.split(':', 1)[1]))
+
+
+# --- Server-sent events ---
+
+def parse_topics(value):
+    topics = [topic for topic in (value or '').split(',') if TOPIC_RE.match(topic)]
+    return list(dict.fromkeys(topics))[:MAX_TOPICS]
+
+
+def format_event(topic, message):
+    return f"event: {topic.split(':', 1)[0]}\ndata: {json.dumps({'topic': topic, **message})}\n\n"
+
+
+async def _refresh_leaderboard_while_watched(interval):
+    # Recomputing needs a request or a timer; this is the timer, and it stops with the last viewer
+    while hub.subscriber_count(LEADERBOARD_TOPIC):
+        await sync_to_async(refresh_leaderboard)()
+        await asyncio.sleep(interval)
+
+
+async def event_stream(topics):
+    """Yields server-sent events for `topics` until the client disconnects."""
+    global _refresher
+    get_broker()
+    subscription = hub.subscribe(topics)
+    try:
+        yield f"retry: {int(settings.LIVE_RECONNECT_SECONDS * 1000)}\n\n"
+        for topic in subscription.topics - set(subscription.pending):
+            message = await sync_to_async(snapshot)(topic)
+            if message is not None:
+                subscription.deliver(topic, message)
+        if LEADERBOARD_TOPIC in subscription.topics and (_refresher is None or _refresher.done()):
+            _refresher = asyncio.create_task(_refresh_leaderboard_while_watched(settings.LEADERBOARD_CACHE_TTL))
+
+        while True:
+            batch = await subscription.get(timeout=settings.LIVE_HEARTBEAT_SECONDS)
+            if not batch:
+                # Comment line; keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+            for topic, message in batch.items():
+                yield format_event(topic, message)
+    finally:
+        subscription.close()
+
+
+def snapshot_events(topics):
+    """The WSGI fallback: one event per topic, after which the browser reconnects."""
+    yield f"retry: {int(settings.LIVE_RECONNECT_SECONDS * 1000)}\n\n"
+    for topic in topics:
+        message = snapshot(topic)
+        if message is not None:
+            yield format_event(topic, message)
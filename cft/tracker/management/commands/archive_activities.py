@@ -0,0 +1,65 @@
+"""
+Moves activities from months older than ARCHIVE_AFTER_DAYS into monthly summaries
+(see tracker/archive.py). Safe to run repeatedly, e.g. nightly; each run only picks up
+what has aged past the horizon since the last one.
+
+Usage:
+    python manage.py archive_activities --dry-run
+    python manage.py archive_activities --users-per-chunk 500 --no-raw
+"""
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+
+from tracker.archive import archive_cutoff, archive_users
+from tracker.models import Activity, User
+
+
+class Command(BaseCommand):
+    help = "Archives old activities into monthly per-category summaries, optionally keeping the raw rows compressed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be archived without writing anything.")
+        parser.add_argument('--before', type=date.fromisoformat, help="Archive months before this date's month instead of the configured horizon (only further back).")
+        parser.add_argument('--users-per-chunk', type=int, default=200, help="Users archived per transaction.")
+        parser.add_argument('--no-raw', action='store_true', help="Keep only the monthly summaries, not the raw rows.")
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff()
+        if options['before']:
+            before = options['before'].replace(day=1)
+            if before > cutoff:
+                # Later months feed the dashboard, forecasts and insights straight from the activity table
+                raise CommandError(f"--before can't be later than the configured horizon ({cutoff}).")
+            cutoff = before
+        keep_raw = settings.ARCHIVE_KEEP_RAW and not options['no_raw']
+
+        started = time.perf_counter()
+        totals = {'activities': 0, 'months': 0, 'co2_kg': 0.0}
+        users = 0
+        last_id = 0
+        old = Activity.objects.filter(timestamp__date__lt=cutoff)
+        oldest = old.aggregate(oldest=Min('timestamp'))['oldest']
+        while True:
+            user_ids = list(
+                User.objects.filter(id__gt=last_id, id__in=old.values('user_id'))
+                .order_by('id').values_list('id', flat=True)[:options['users_per_chunk']]
+            )
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            stats = archive_users(user_ids, cutoff, keep_raw=keep_raw, dry_run=options['dry_run'])
+            for key in totals:
+                totals[key] += stats[key]
+            users += len(user_ids)
+
+        elapsed = time.perf_counter() - started
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        since = f" dating back to {oldest:%Y-%m-%d}" if oldest else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {totals['activities']} activities{since} ({totals['co2_kg']:.2f} kg CO2e) into "
+            f"{totals['months']} user-month(s) for {users} user(s), before {cutoff}, in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,178 @@
+"""
+Benchmarks the main pages against the current database through the Django test client,
+plus the work they only reach through a cache (see CALLABLES), such as computing the
+leaderboard.
+
+For each page it reports query count, latency percentiles and peak Python memory, and
+saves the results as JSON so runs from different commits can be compared. Seed data
+first with `manage.py seed_synthetic`.
+
+Usage:
+    python manage.py benchmark --repeat 30
+    python manage.py benchmark --output before.json
+    python manage.py benchmark --compare before.json
+"""
+import json
+import os
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from tracker.models import Activity, User
+
+# (name, url name, needs a logged-in user)
+PAGES = [
+    ('home_anonymous', 'tracker-home', False),
+    ('home', 'tracker-home', True),
+    ('myprofile', 'myprofile', True),
+    ('activity', 'activity', True),
+    ('community', 'community', True),
+    ('challenges', 'challenges', True),
+]
+
+
+def _leaderboard_compute(user):
+    from tracker.views import compute_leaderboard_data
+    compute_leaderboard_data()
+
+
+def _leaderboard_by_reduction(user):
+    from tracker.views import cached_leaderboard_data
+    cached_leaderboard_data('reduction')
+
+
+def _simulate_plans(user):
+    from tracker.simulator import PLANS, simulate
+    simulate(user, PLANS * 4)
+
+
+# Work the pages only reach through a cache or the API, timed directly: (name, callable taking the user)
+CALLABLES = [
+    ('leaderboard', _leaderboard_compute),
+    ('leaderboard_reduction', _leaderboard_by_reduction),
+    ('simulate_48_plans', _simulate_plans),
+]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR).stdout.strip()
+    except OSError:
+        return ''
+
+
+def benchmark_callable(func, repeat, warmup=2):
+    """Times func() `repeat` times and measures queries and peak memory on a separate run."""
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    # tracemalloc slows everything down, so memory is measured on its own run
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        'queries': len(queries),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'mean_ms': round(float(np.mean(timings)), 2),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the main pages and saves query counts, latency percentiles and peak memory as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per page.")
+        parser.add_argument('--username', help="User to log in as; defaults to the user with the most activities.")
+        parser.add_argument('--output', help="Where to write the JSON results (default: benchmarks/<timestamp>.json).")
+        parser.add_argument('--compare', help="Earlier results file to compare against.")
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            busiest = Activity.objects.values('user_id').annotate(n=Count('id')).order_by('-n').first()
+            user = User.objects.filter(id=busiest['user_id']).first() if busiest else None
+        if user is None:
+            raise CommandError("No user to benchmark with. Run `manage.py seed_synthetic` first.")
+
+        setup_test_environment()
+        try:
+            results = {}
+            for name, url_name, needs_login in PAGES:
+                client = Client()
+                if needs_login:
+                    client.force_login(user)
+                url = reverse(url_name)
+
+                def request_page():
+                    response = client.get(url)
+                    if response.status_code != 200:
+                        raise CommandError(f"{url} returned {response.status_code}")
+
+                results[name] = benchmark_callable(request_page, options['repeat'])
+                self.stdout.write(f"{name:<16} {results[name]}")
+
+            for name, func in CALLABLES:
+                results[name] = benchmark_callable(lambda: func(user), options['repeat'])
+                self.stdout.write(f"{name:<16} {results[name]}")
+        finally:
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'database': connection.vendor,
+                'users': User.objects.count(),
+                'activities': Activity.objects.count(),
+                'benchmark_user': user.username,
+                'repeat': options['repeat'],
+            },
+            'results': results,
+        }
+
+        output = options['output'] or os.path.join(settings.BASE_DIR, 'benchmarks', f"{datetime.now():%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        self.stdout.write(f"\n{'page':<16}{'queries':>16}{'p50 ms':>22}{'peak kb':>22}")
+        for name, current in results.items():
+            before = baseline.get(name)
+            if not before:
+                continue
+            cells = []
+            for key in ('queries', 'p50_ms', 'peak_kb'):
+                change = (current[key] - before[key]) / before[key] * 100 if before[key] else 0
+                cells.append(f"{before[key]:>7} -> {current[key]:<7}({change:+.0f}%)")
+            self.stdout.write(f"{name:<16}" + ''.join(f"{cell:>22}" for cell in cells))
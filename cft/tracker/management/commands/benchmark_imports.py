@@ -0,0 +1,95 @@
+"""
+Benchmarks the statement import pipeline (tracker.statements) on synthetic bank statements.
+
+Generates CSV statements for a throwaway user, uploads each as a StatementImport and
+runs import_statement() on it, reporting statements/sec, lines/sec and peak memory.
+Each statement is then imported a second time to time the duplicate path, which is what
+a user re-uploading last month's export hits. The user and everything imported for it
+are deleted afterwards unless --keep is given.
+
+Usage:
+    python manage.py benchmark_imports
+    python manage.py benchmark_imports --statements 50 --lines 2000
+"""
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from tracker.models import StatementImport, User
+from tracker.statements import CLASSIFICATION_RULES, SKIP_KEYWORDS, import_statement
+
+BENCHMARK_USERNAME = 'benchmark-imports'
+
+
+def synthetic_statement(rng, lines, start):
+    """A bank CSV with a short preamble, `lines` transactions from `start` on, some of them credits."""
+    merchants = [keywords[0].upper() for _, _, keywords in CLASSIFICATION_RULES] + ['AMAZON PAY', 'LOCAL STORE']
+    rows = [
+        'Account Statement,,,,',
+        'Account No,XXXX1234,,,',
+        ',,,,',
+        'Txn Date,Narration,Withdrawal Amt,Deposit Amt,Closing Balance',
+    ]
+    days = np.sort(rng.integers(0, 28, lines))
+    for n, day in enumerate(days):
+        when = (start + timedelta(days=int(day))).strftime('%d/%m/%Y')
+        if rng.random() < 0.1:
+            rows.append(f"{when},{SKIP_KEYWORDS[int(rng.integers(len(SKIP_KEYWORDS)))].upper()} {n},,{rng.uniform(100, 50000):.2f},0")
+        else:
+            merchant = merchants[int(rng.integers(len(merchants)))]
+            rows.append(f"{when},UPI/{merchant}/{n:06d},{rng.uniform(20, 5000):.2f},,0")
+    return ('\n'.join(rows) + '\n').encode('utf-8')
+
+
+class Command(BaseCommand):
+    help = "Measures statement import throughput (statements/sec and lines/sec) on synthetic bank CSVs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--statements', type=int, default=20)
+        parser.add_argument('--lines', type=int, default=500, help="Transactions per statement.")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark user and its activities.")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        User.objects.filter(username=BENCHMARK_USERNAME).delete()
+        user = User.objects.create_user(BENCHMARK_USERNAME)
+
+        # One statement per month going back from today, so they don't overlap
+        month = date.today().replace(day=1)
+        statements = []
+        for _ in range(options['statements']):
+            month = (month - timedelta(days=1)).replace(day=1)
+            content = synthetic_statement(rng, options['lines'], month)
+            statement = StatementImport(user=user, kind='bank', original_name=f"{month:%Y-%m}.csv", bytes_total=len(content))
+            statement.file.save(statement.original_name, ContentFile(content))
+            statements.append(statement)
+
+        try:
+            for label in ('first import', 're-import'):
+                tracemalloc.start()
+                totals = {'lines': 0, 'imported': 0, 'duplicates': 0, 'skipped': 0}
+                started = time.perf_counter()
+                for statement in statements:
+                    stats = import_statement(statement)
+                    for key in totals:
+                        totals[key] += stats[key]
+                elapsed = time.perf_counter() - started
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                failed = StatementImport.objects.filter(user=user, status='failed').count()
+                self.stdout.write(
+                    f"{label:<13} {len(statements) / elapsed:8.1f} statements/sec  {totals['lines'] / elapsed:10,.0f} lines/sec  "
+                    f"imported {totals['imported']}  duplicates {totals['duplicates']}  skipped {totals['skipped']}  "
+                    f"failed {failed}  peak {peak / 1024 / 1024:.1f} MB"
+                )
+        finally:
+            for statement in statements:
+                statement.file.delete(save=False)
+            if not options['keep']:
+                user.delete()
@@ -0,0 +1,50 @@
+"""
+Refreshes every user's end-of-month emission forecast and reports throughput.
+
+Usage:
+    python manage.py forecast_emissions
+    python manage.py forecast_emissions --method seasonal-naive --workers 4
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tracker.forecast import METHODS, forecast_users, save_forecasts
+from tracker.management.workers import init_worker
+from tracker.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Forecasts month-end emissions for all users."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--method', choices=METHODS, default='ses', help="Forecasting model to use.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Users forecast per matrix.")
+        parser.add_argument('--workers', type=int, default=1, help="Processes used to compute forecasts.")
+
+    def handle(self, *args, **options):
+        today = date.today()
+        method = options['method']
+        user_ids = list(Profile.objects.order_by('user_id').values_list('user_id', flat=True))
+        batch_size = max(1, options['batch_size'])
+        batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
+
+        started = time.perf_counter()
+        if options['workers'] > 1 and len(batches) > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+                futures = [pool.submit(forecast_users, batch, today, method) for batch in batches]
+                for future in futures:
+                    save_forecasts(future.result(), today, method)
+        else:
+            for batch in batches:
+                save_forecasts(forecast_users(batch, today, method), today, method)
+        elapsed = time.perf_counter() - started
+
+        rate = len(user_ids) / elapsed if elapsed > 0 else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Forecast {len(user_ids)} users with '{method}' in {elapsed:.2f}s ({rate:,.0f} users/sec)."
+        ))
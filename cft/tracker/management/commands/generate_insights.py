@@ -0,0 +1,60 @@
+"""
+Regenerates the ranked Insight rows shown on the profile and home pages.
+
+Only users with activity logged since their last run are processed unless --all is given.
+
+Usage:
+    python manage.py generate_insights
+    python manage.py generate_insights --all --workers 4
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tracker.insights import HISTORY_DAYS, activity_watermarks, compute_insights_for_users, save_insights, users_needing_insights
+from tracker.management.workers import init_worker
+from tracker.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Generates personalized insights for users with new activity."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Process every user, not just those with new activity.")
+        parser.add_argument('--workers', type=int, default=1, help="Processes used to compute insights.")
+        parser.add_argument('--batch-size', type=int, default=200, help="Users loaded per query.")
+        parser.add_argument('--days', type=int, default=HISTORY_DAYS, help="Days of history to analyse.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['all']:
+            user_ids = list(Profile.objects.order_by('user_id').values_list('user_id', flat=True))
+        else:
+            user_ids = users_needing_insights()
+
+        batch_size = max(1, options['batch_size'])
+        batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
+        # Read before computing so anything logged mid-run is picked up next time
+        watermarks = activity_watermarks(user_ids)
+
+        def store(batch, results):
+            return save_insights(results, {user_id: watermarks[user_id] for user_id in batch if user_id in watermarks})
+
+        created = 0
+        if options['workers'] > 1 and len(batches) > 1:
+            # Workers only read and compute; all writes happen here to keep SQLite happy.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+                futures = [(batch, pool.submit(compute_insights_for_users, batch, options['days'])) for batch in batches]
+                for batch, future in futures:
+                    created += store(batch, future.result())
+        else:
+            for batch in batches:
+                created += store(batch, compute_insights_for_users(batch, options['days']))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {created} insights for {len(user_ids)} users in {elapsed:.2f}s."
+        ))
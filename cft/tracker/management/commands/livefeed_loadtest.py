@@ -0,0 +1,124 @@
+"""
+Fan-out load test for the live feed hub (tracker.live), entirely in-process.
+
+Opens N subscribers on one event loop, each watching the leaderboard and one challenge,
+then publishes bursts of updates from a separate thread the way request threads do, with
+one "hot" challenge taking a large share of them. Reports how many events were published
+versus actually delivered after coalescing, delivery latency percentiles and peak memory.
+
+Usage:
+    python manage.py livefeed_loadtest
+    python manage.py livefeed_loadtest --subscribers 10000 --updates 5000 --coalesce 0.5
+"""
+import asyncio
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from tracker.live import LEADERBOARD_TOPIC, Hub
+
+
+class Command(BaseCommand):
+    help = "Measures live feed fan-out and coalescing with many concurrent in-process subscribers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=10000)
+        parser.add_argument('--challenges', type=int, default=100, help="Distinct challenge topics.")
+        parser.add_argument('--updates', type=int, default=2000, help="Messages to publish.")
+        parser.add_argument('--rate', type=float, default=1000, help="Messages published per second.")
+        parser.add_argument('--hot-share', type=float, default=0.5, help="Share of updates going to a single challenge.")
+        parser.add_argument('--coalesce', type=float, default=1.0, help="Coalescing window in seconds.")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        tracemalloc.start()
+        results = asyncio.run(self.run(options))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies = np.array(results['latencies']) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (0, 0, 0)
+        self.stdout.write(
+            f"subscribers        {options['subscribers']}\n"
+            f"published          {options['updates']} in {results['publish_seconds']:.2f}s\n"
+            f"delivered events   {len(latencies)} ({len(latencies) / max(options['subscribers'], 1):.1f} per subscriber, "
+            f"{len(latencies) / max(results['elapsed'], 1e-9):,.0f}/sec)\n"
+            f"without coalescing {results['uncoalesced']}\n"
+            f"flushes            {results['flushes']} (max {results['max_flush_ms']:.1f} ms to fan out)\n"
+            f"latency ms         p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}\n"
+            f"peak memory        {peak / 1024 / 1024:.1f} MB"
+        )
+
+    async def run(self, options):
+        rng = np.random.default_rng(options['seed'])
+        hub = Hub(options['coalesce'])
+        challenges = [f"challenge:{n}" for n in range(options['challenges'])]
+        hot = challenges[0]
+
+        # Time each flush, which is where the fan-out cost lands
+        flush_ms = []
+        flush = hub.flush
+
+        def timed_flush():
+            started = time.perf_counter()
+            flush()
+            flush_ms.append((time.perf_counter() - started) * 1000)
+        hub.flush = timed_flush
+
+        latencies = []
+        subscriptions = [
+            hub.subscribe([LEADERBOARD_TOPIC, challenges[int(rng.integers(len(challenges)))]])
+            for _ in range(options['subscribers'])
+        ]
+
+        async def consume(subscription):
+            while True:
+                batch = await subscription.get()
+                received = time.perf_counter()
+                latencies.extend(received - message['sent'] for message in batch.values())
+
+        consumers = [asyncio.create_task(consume(subscription)) for subscription in subscriptions]
+
+        uncoalesced = 0
+
+        def publisher():
+            nonlocal uncoalesced
+            interval = 1 / options['rate']
+            for n in range(options['updates']):
+                roll = rng.random()
+                if roll < options['hot_share']:
+                    topic = hot
+                elif roll < options['hot_share'] + 0.1:
+                    topic = LEADERBOARD_TOPIC
+                else:
+                    topic = challenges[int(rng.integers(len(challenges)))]
+                uncoalesced += hub.subscriber_count(topic)
+                hub.receive(topic, {'n': n, 'sent': time.perf_counter()})
+                time.sleep(interval)
+
+        started = time.perf_counter()
+        thread = threading.Thread(target=publisher)
+        thread.start()
+        await asyncio.to_thread(thread.join)
+        publish_seconds = time.perf_counter() - started
+        # Let the last window flush and the consumers drain it
+        await asyncio.sleep(options['coalesce'] + 0.5)
+        elapsed = time.perf_counter() - started
+
+        for task in consumers:
+            task.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        for subscription in subscriptions:
+            subscription.close()
+
+        return {
+            'latencies': latencies,
+            'publish_seconds': publish_seconds,
+            'elapsed': elapsed,
+            'uncoalesced': uncoalesced,
+            'flushes': len(flush_ms),
+            'max_flush_ms': max(flush_ms, default=0),
+        }
@@ -0,0 +1,195 @@
+"""
+Measures what the main pages cost a browser: bytes on the wire and time, for a first
+visit and for a repeat visit with a warm cache.
+
+Each page in benchmark.PAGES is requested through the Django test client with
+"Accept-Encoding: gzip, br", followed by every asset under STATIC_URL it links to
+(third-party CDN files aren't counted). The repeat visit replays the page with the
+ETag/Last-Modified it was given, and only requests assets the first response didn't
+allow the browser to cache. Assets the settings don't serve themselves (no WhiteNoise)
+are answered by django.contrib.staticfiles' view, as runserver would.
+
+Run it once per settings module to compare; the production settings need
+`collectstatic` first.
+
+Usage:
+    python manage.py measure_pages --output before.json
+    python manage.py collectstatic --noinput --settings cft.settings_production
+    python manage.py measure_pages --settings cft.settings_production --compare before.json
+"""
+import gzip
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.contrib.staticfiles.views import serve
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.http import Http404
+from django.test import Client, RequestFactory
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils.cache import get_max_age
+
+from tracker.models import Activity, User
+
+from .benchmark import PAGES, git_revision
+
+ACCEPT_ENCODING = 'gzip, br'
+
+
+def body_bytes(response):
+    """Bytes of the body as sent, reading (and closing) streamed file responses."""
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+        response.close()
+        return size
+    return len(response.content)
+
+
+def page_html(response):
+    content = response.content
+    if response.get('Content-Encoding') == 'gzip':
+        content = gzip.decompress(content)
+    return content.decode(response.charset or 'utf-8')
+
+
+def asset_urls(html):
+    """STATIC_URL paths the page links to, in order, once each."""
+    pattern = re.compile(r'["\'(](' + re.escape(settings.STATIC_URL) + r'[^"\')?#\s]+)')
+    return list(dict.fromkeys(pattern.findall(html)))
+
+
+def validators(response):
+    headers = {}
+    if response.has_header('ETag'):
+        headers['HTTP_IF_NONE_MATCH'] = response['ETag']
+    if response.has_header('Last-Modified'):
+        headers['HTTP_IF_MODIFIED_SINCE'] = response['Last-Modified']
+    return headers
+
+
+def cacheable(response):
+    """Whether a browser may reuse the response without asking again."""
+    return response.status_code == 200 and bool(get_max_age(response))
+
+
+class Command(BaseCommand):
+    help = "Measures page and static asset bytes and time, first and repeat visit, and saves them as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10, help="Timed requests per page and visit.")
+        parser.add_argument('--username', help="User to log in as; defaults to the user with the most activities.")
+        parser.add_argument('--output', help="Where to write the JSON results (default: benchmarks/pages-<timestamp>.json).")
+        parser.add_argument('--compare', help="Earlier results file to compare against.")
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            busiest = Activity.objects.values('user_id').annotate(n=Count('id')).order_by('-n').first()
+            user = User.objects.filter(id=busiest['user_id']).first() if busiest else None
+        if user is None:
+            raise CommandError("No user to measure with. Run `manage.py seed_synthetic` first.")
+
+        setup_test_environment()
+        try:
+            results = {}
+            for name, url_name, needs_login in PAGES:
+                client = Client(HTTP_ACCEPT_ENCODING=ACCEPT_ENCODING)
+                if needs_login:
+                    client.force_login(user)
+                results[name] = self.measure(client, reverse(url_name), options['repeat'])
+                self.stdout.write(f"{name:<16} {results[name]}")
+        finally:
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'settings': settings.SETTINGS_MODULE,
+                'debug': settings.DEBUG,
+                'benchmark_user': user.username,
+                'repeat': options['repeat'],
+            },
+            'results': results,
+        }
+
+        output = options['output'] or os.path.join(settings.BASE_DIR, 'benchmarks', f"pages-{datetime.now():%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def measure(self, client, url, repeat):
+        timings, response = [], None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+
+        first_bytes, first_requests = body_bytes(response), 1
+        raw_bytes = len(page_html(response).encode())
+        repeat_bytes, repeat_requests = 0, 1
+        for asset in asset_urls(page_html(response)):
+            fetched = self.fetch(client, asset)
+            first_bytes += body_bytes(fetched)
+            first_requests += 1
+            if not cacheable(fetched):
+                repeat_bytes += body_bytes(self.fetch(client, asset, **validators(fetched)))
+                repeat_requests += 1
+
+        repeat_timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            revisit = client.get(url, **validators(response))
+            repeat_timings.append((time.perf_counter() - start) * 1000)
+        repeat_bytes += body_bytes(revisit)
+
+        return {
+            'html_bytes': body_bytes(response),
+            'html_raw_bytes': raw_bytes,
+            'page_status_repeat': revisit.status_code,
+            'first_visit_requests': first_requests,
+            'first_visit_bytes': first_bytes,
+            'repeat_visit_requests': repeat_requests,
+            'repeat_visit_bytes': repeat_bytes,
+            'p50_ms': round(float(np.percentile(timings, 50)), 2),
+            'repeat_p50_ms': round(float(np.percentile(repeat_timings, 50)), 2),
+        }
+
+    def fetch(self, client, url, **headers):
+        response = client.get(url, **headers)
+        if response.status_code != 404:
+            return response
+        # Nothing in the middleware stack serves static files; do what runserver does
+        request = RequestFactory().get(url, HTTP_ACCEPT_ENCODING=ACCEPT_ENCODING, **headers)
+        try:
+            return serve(request, url[len(settings.STATIC_URL):], insecure=True)
+        except Http404:
+            raise CommandError(f"{url} not found; run `manage.py collectstatic` for these settings")
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        keys = ('first_visit_bytes', 'repeat_visit_bytes', 'repeat_visit_requests', 'p50_ms')
+        self.stdout.write(f"\n{'page':<16}" + ''.join(f"{key:>28}" for key in keys))
+        for name, current in results.items():
+            before = baseline.get(name)
+            if not before:
+                continue
+            cells = []
+            for key in keys:
+                change = (current[key] - before[key]) / before[key] * 100 if before[key] else 0
+                cells.append(f"{before[key]:>9} -> {current[key]:<9}({change:+.0f}%)")
+            self.stdout.write(f"{name:<16}" + ''.join(f"{cell:>28}" for cell in cells))
@@ -0,0 +1,107 @@
+"""
+Finds and merges duplicate activities (see tracker/dedupe.py).
+
+Users are processed a chunk at a time. Within a chunk every activity gets its content
+hash (backfilled for rows written before hashes existed); for each (user, hash) the
+oldest activity is kept and later copies are deleted with their emissions. Each
+chunk's deletes and backfill run in one transaction, and the dashboard totals and
+forecasts of users who lost rows are rebuilt afterwards.
+
+Usage:
+    python manage.py merge_duplicate_activities --dry-run
+    python manage.py merge_duplicate_activities --users-per-chunk 500
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tracker.counters import record_counts
+from tracker.dedupe import content_hash
+from tracker.models import Activity, User
+from tracker.summary import rebuild_totals
+
+# How many merged rows to list with --dry-run.
+SAMPLE_SIZE = 20
+
+
+def merge_chunk(user_ids, batch_size=500, dry_run=False):
+    """Merges duplicates for the given users. Returns stats for the chunk."""
+    rows = (
+        Activity.objects.filter(user_id__in=user_ids)
+        .order_by('id')
+        .values_list('id', 'user_id', 'category', 'subtype', 'value', 'unit', 'timestamp', 'content_hash', 'description', 'emission__co2_equivalent_kg', 'quarantined')
+    )
+    keepers = {}
+    duplicates = []
+    backfill = []
+    stats = {'scanned': 0, 'duplicates': 0, 'backfilled': 0, 'removed_kg': 0.0, 'users': set(), 'sample': []}
+    for activity_id, user_id, category, subtype, value, unit, timestamp, stored_hash, description, footprint, quarantined in rows.iterator(chunk_size=5000):
+        stats['scanned'] += 1
+        key = (user_id, stored_hash or content_hash(user_id, category, subtype, value, unit, timestamp))
+        if key in keepers:
+            duplicates.append(activity_id)
+            # A quarantined copy was never in the totals (see tracker/anomalies.py)
+            stats['removed_kg'] += 0 if quarantined else footprint or 0
+            stats['users'].add(user_id)
+            if len(stats['sample']) < SAMPLE_SIZE:
+                stats['sample'].append((activity_id, keepers[key], description))
+        else:
+            keepers[key] = activity_id
+            if stored_hash is None:
+                backfill.append(Activity(id=activity_id, content_hash=key[1]))
+    stats['duplicates'] = len(duplicates)
+    stats['backfilled'] = len(backfill)
+
+    if not dry_run and (duplicates or backfill):
+        with transaction.atomic():
+            # Duplicates go first, so a backfilled hash never collides with a row being removed
+            for start in range(0, len(duplicates), batch_size):
+                Activity.objects.filter(id__in=duplicates[start:start + batch_size]).delete()
+            Activity.objects.bulk_update(backfill, ['content_hash'], batch_size=batch_size)
+    return stats
+
+
+class Command(BaseCommand):
+    help = "Backfills activity content hashes and merges activities logged more than once."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be merged without writing anything.")
+        parser.add_argument('--users-per-chunk', type=int, default=200, help="Users whose activities are processed together.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows per delete/update statement.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        totals = {'scanned': 0, 'duplicates': 0, 'backfilled': 0, 'removed_kg': 0.0}
+        affected = set()
+        sample = []
+        last_id = 0
+        while True:
+            user_ids = list(
+                User.objects.filter(id__gt=last_id, activity__isnull=False).distinct()
+                .order_by('id').values_list('id', flat=True)[:options['users_per_chunk']]
+            )
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            stats = merge_chunk(user_ids, options['batch_size'], options['dry_run'])
+            for key in totals:
+                totals[key] += stats[key]
+            affected |= stats['users']
+            sample.extend(stats['sample'][:SAMPLE_SIZE - len(sample)])
+
+        if options['dry_run']:
+            for activity_id, keeper_id, description in sample:
+                self.stdout.write(f"  #{activity_id} duplicates #{keeper_id}: {description}")
+        elif affected:
+            # Deletes bypass the write-through totals
+            rebuild_totals(affected)
+            record_counts(activity_count=-totals['duplicates'], co2_logged_kg=-totals['removed_kg'])
+
+        elapsed = time.perf_counter() - started
+        verb = "Would merge" if options['dry_run'] else "Merged"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {totals['duplicates']} duplicate(s) across {len(affected)} user(s) "
+            f"({totals['removed_kg']:.2f} kg CO2e double-counted) and backfilled {totals['backfilled']} hash(es); "
+            f"scanned {totals['scanned']} activities in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,59 @@
+"""
+Summarizes the request records written by tracker.middleware.PerformanceMiddleware.
+
+Usage:
+    python manage.py perfreport
+    python manage.py perfreport --since-minutes 60 --top 10
+"""
+import json
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Prints p50/p95/p99 latency, query counts and the most duplicated queries per view."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=str(getattr(settings, 'PERF_LOG_PATH', '')), help="JSON-lines file to read.")
+        parser.add_argument('--since-minutes', type=float, help="Only include requests from the last N minutes.")
+        parser.add_argument('--top', type=int, default=5, help="How many duplicate queries to list.")
+
+    def handle(self, *args, **options):
+        cutoff = time.time() - options['since_minutes'] * 60 if options['since_minutes'] else 0
+        by_view = defaultdict(list)
+        duplicates = Counter()
+        try:
+            with open(options['path'], encoding='utf-8') as log:
+                for line in log:
+                    record = json.loads(line)
+                    if record['ts'] < cutoff:
+                        continue
+                    by_view[record['url_name']].append(record)
+                    for sql, count in record.get('top_similar', []):
+                        duplicates[(record['url_name'], sql)] += count - 1
+        except FileNotFoundError:
+            raise CommandError(f"No performance log at {options['path']}. Is PerformanceMiddleware enabled?")
+
+        header = f"{'view':<24}{'reqs':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'sql ms':>8}{'tpl ms':>8}{'dups':>6}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        rows = sorted(by_view.items(), key=lambda item: -np.percentile([r['total_ms'] for r in item[1]], 95))
+        for url_name, records in rows:
+            total = np.array([r['total_ms'] for r in records])
+            p50, p95, p99 = np.percentile(total, [50, 95, 99])
+            self.stdout.write(
+                f"{url_name[:23]:<24}{len(records):>6}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}"
+                f"{np.mean([r['queries'] for r in records]):>9.1f}"
+                f"{np.mean([r['sql_ms'] for r in records]):>8.1f}"
+                f"{np.mean([r['template_ms'] for r in records]):>8.1f}"
+                f"{np.mean([r['similar_queries'] for r in records]):>6.1f}"
+            )
+
+        if duplicates:
+            self.stdout.write("\nTop repeated queries (extra executions across all requests):")
+            for (url_name, sql), extra in duplicates.most_common(options['top']):
+                self.stdout.write(f"  {extra:>6}  [{url_name}] {sql[:160]}")
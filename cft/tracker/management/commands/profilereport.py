@@ -0,0 +1,74 @@
+"""
+Lists and merges the request profiles captured by tracker.middleware.ProfilingMiddleware.
+
+Without --url-name, prints each URL name's captures with their median duration and the
+functions most samples were spent in. With --url-name, lists that view's captures and can
+merge their collapsed stacks into one file for flamegraph.pl or speedscope.
+
+Usage:
+    python manage.py profilereport
+    python manage.py profilereport --since-minutes 60 --top 5
+    python manage.py profilereport --url-name myprofile --output myprofile.folded
+"""
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.profiling import read_folded, read_index
+
+
+def hottest(stacks, top):
+    """(label, share of samples) for the leaf frames holding the most samples."""
+    total = sum(stacks.values())
+    own = Counter()
+    for stack, count in stacks.items():
+        own[stack.rpartition(';')[2]] += count
+    return [(label, count / total) for label, count in own.most_common(top)] if total else []
+
+
+class Command(BaseCommand):
+    help = "Lists captured request profiles per URL name and merges their stacks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=str(getattr(settings, 'PROFILE_DIR', '')), help="Directory the profiles were written to.")
+        parser.add_argument('--since-minutes', type=float, help="Only include profiles from the last N minutes.")
+        parser.add_argument('--url-name', help="Only this view; lists its captures one by one.")
+        parser.add_argument('--top', type=int, default=3, help="How many of the hottest functions to show.")
+        parser.add_argument('--output', help="Write the selected captures' merged collapsed stacks here.")
+
+    def handle(self, *args, **options):
+        cutoff = time.time() - options['since_minutes'] * 60 if options['since_minutes'] else 0
+        records = [record for record in read_index(options['dir']) if record['ts'] >= cutoff]
+        if options['url_name']:
+            records = [record for record in records if record['url_name'] == options['url_name']]
+        if not records:
+            raise CommandError(f"No profiles in {options['dir']}. Send a staff request with the X-Profile header or ?_profile.")
+
+        by_view = defaultdict(list)
+        for record in records:
+            by_view[record['url_name']].append(record)
+
+        merged = Counter()
+        for url_name, captures in sorted(by_view.items(), key=lambda item: -len(item[1])):
+            stacks = Counter()
+            for record in captures:
+                stacks.update(read_folded(options['dir'], record['stem']))
+            merged.update(stacks)
+            p50 = np.percentile([record['total_ms'] for record in captures], 50)
+            self.stdout.write(f"{url_name}: {len(captures)} profile(s), p50 {p50:.1f} ms, {sum(stacks.values())} samples")
+            for label, share in hottest(stacks, options['top']):
+                self.stdout.write(f"    {share:6.1%}  {label}")
+            if options['url_name']:
+                for record in captures:
+                    self.stdout.write(
+                        f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['ts']))}  {record['method']} {record['path']}  "
+                        f"{record['status']}  {record['total_ms']:.1f} ms  {record['stem']}"
+                    )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as out:
+                out.writelines(f"{stack} {count}\n" for stack, count in merged.most_common())
+            self.stdout.write(self.style.SUCCESS(f"Merged stacks of {len(records)} profile(s) written to {options['output']}"))
@@ -0,0 +1,91 @@
+"""
+Recomputes every stored Emission from the current emission factor table (see
+tracker/recalculation.py), spreading user id ranges over worker processes.
+
+Usage:
+    python manage.py recalculate_footprints --dry-run
+    python manage.py recalculate_footprints --workers 4 --chunk-size 10000
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
+
+from tracker.management.workers import init_worker
+from tracker.models import Activity
+from tracker.recalculation import DIFF_SAMPLE_SIZE, apply_recalculation, recalculate_activities
+
+
+def recalculate_range(user_id_from, user_id_to, chunk_size=5000, batch_size=1000, dry_run=False, category=None):
+    """Recalculates footprints for activities of users with user_id_from <= id <= user_id_to."""
+    activities = Activity.objects.filter(user_id__gte=user_id_from, user_id__lte=user_id_to)
+    if category:
+        activities = activities.filter(category=category)
+    return recalculate_activities(activities, chunk_size, batch_size, dry_run)
+
+
+def partition_user_ids(workers):
+    """Splits the user id space into contiguous, roughly equal ranges."""
+    bounds = Activity.objects.aggregate(low=Min('user_id'), high=Max('user_id'))
+    if bounds['low'] is None:
+        return []
+    edges = np.linspace(bounds['low'], bounds['high'] + 1, num=workers + 1).astype(np.int64)
+    return [(int(lo), int(hi) - 1) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+
+
+class Command(BaseCommand):
+    help = "Recalculates Emission.co2_equivalent_kg for all activities using the current emission factors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without writing anything.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Activities read per query.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per bulk_update statement.")
+        parser.add_argument('--workers', type=int, default=1, help="Processes to spread user id ranges over.")
+        parser.add_argument('--category', choices=[c[0] for c in Activity.ACTIVITY_CATEGORIES], help="Only recalculate one category.")
+
+    def handle(self, *args, **options):
+        kwargs = {
+            'chunk_size': options['chunk_size'],
+            'batch_size': options['batch_size'],
+            'dry_run': options['dry_run'],
+            'category': options['category'],
+        }
+        ranges = partition_user_ids(max(1, options['workers']))
+        started = time.perf_counter()
+
+        if options['workers'] > 1 and len(ranges) > 1:
+            # Forked children must open their own connections.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=len(ranges), initializer=init_worker) as pool:
+                futures = [pool.submit(recalculate_range, lo, hi, **kwargs) for lo, hi in ranges]
+                results = [f.result() for f in futures]
+        else:
+            results = [recalculate_range(lo, hi, **kwargs) for lo, hi in ranges]
+
+        elapsed = time.perf_counter() - started
+        scanned = sum(r['scanned'] for r in results)
+        changed = sum(r['changed'] for r in results)
+        delta = sum(r['delta_kg'] for r in results)
+        manual = sum(r['manual'] for r in results)
+
+        if not options['dry_run']:
+            apply_recalculation(set().union(*(r['users'] for r in results)), delta)
+        else:
+            for activity_id, description, old, new in [d for r in results for d in r['diff']][:DIFF_SAMPLE_SIZE]:
+                self.stdout.write(f"  #{activity_id} {description}: {old:.2f} -> {new:.2f} kg")
+            manual_diff = [d for r in results for d in r['manual_diff']][:DIFF_SAMPLE_SIZE]
+            if manual_diff:
+                self.stdout.write("Edited by hand, left unchanged:")
+            for activity_id, description, old, new in manual_diff:
+                self.stdout.write(f"  #{activity_id} {description}: {old:.2f} (table: {new:.2f} kg)")
+
+        rate = scanned / elapsed if elapsed > 0 else 0
+        verb = "Would update" if options['dry_run'] else "Updated"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {changed} of {scanned} emissions ({delta:+.2f} kg CO2e total) "
+            f"in {elapsed:.2f}s, {rate:,.0f} rows/sec across {len(ranges)} range(s); "
+            f"{manual} footprint(s) edited by hand were left as they are."
+        ))
@@ -0,0 +1,73 @@
+"""
+Re-screens every activity for anomalies (see tracker/anomalies.py).
+
+Each user's history is replayed oldest first through fresh baselines, which replace the
+stored ones. Unconfirmed activities are quarantined or released to match, so this also
+catches bad readings logged before screening existed or while a baseline was still
+warming up. Users whose flags changed get their dashboard totals and forecasts rebuilt.
+
+Usage:
+    python manage.py scan_anomalies --dry-run
+    python manage.py scan_anomalies --workers 4
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tracker.anomalies import save_scan, scan_users
+from tracker.forecast import forecast_users, save_forecasts
+from tracker.management.workers import init_worker
+from tracker.models import Activity, User
+from tracker.summary import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = "Rebuilds anomaly baselines from all history and re-screens unconfirmed activities."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without writing anything.")
+        parser.add_argument('--workers', type=int, default=1, help="Processes used to score users.")
+        parser.add_argument('--users-per-chunk', type=int, default=200, help="Users whose activities are loaded together.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        user_ids = list(Activity.objects.values_list('user_id', flat=True).distinct().order_by('user_id'))
+        size = max(1, options['users_per_chunk'])
+        chunks = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+
+        totals = {'quarantined': 0, 'released': 0, 'baselines': 0}
+        affected = set()
+
+        def store(chunk, result):
+            totals['quarantined'] += len(result['quarantine'])
+            totals['released'] += len(result['release'])
+            totals['baselines'] += len(result['baselines'])
+            affected.update(result['users'])
+            if not options['dry_run']:
+                save_scan(chunk, result)
+
+        if options['workers'] > 1 and len(chunks) > 1:
+            # Workers only read and score; all writes happen here to keep SQLite happy.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+                futures = [(chunk, pool.submit(scan_users, chunk)) for chunk in chunks]
+                for chunk, future in futures:
+                    store(chunk, future.result())
+        else:
+            for chunk in chunks:
+                store(chunk, scan_users(chunk))
+
+        if affected and not options['dry_run']:
+            # Flag changes move kg in or out of the totals
+            for user in User.objects.filter(id__in=affected):
+                rebuild_summary(user)
+            save_forecasts(forecast_users(sorted(affected)))
+
+        elapsed = time.perf_counter() - started
+        verbs = ("Would quarantine", "release") if options['dry_run'] else ("Quarantined", "released")
+        self.stdout.write(self.style.SUCCESS(
+            f"{verbs[0]} {totals['quarantined']} and {verbs[1]} {totals['released']} activities across {len(affected)} user(s); "
+            f"{totals['baselines']} baselines from {len(user_ids)} users in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,194 @@
+"""
+Fills the database with realistic synthetic data for load testing and benchmarks.
+
+Everything is written with bulk_create in batches, so seeding hundreds of thousands of
+activities takes seconds rather than hours. Use --seed for reproducible datasets.
+
+Usage:
+    python manage.py seed_synthetic --users 500 --days 730
+    python manage.py seed_synthetic --users 50 --days 90 --activities-per-day 2 --seed 7
+"""
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from tracker.counters import recount
+from tracker.footprint import EMISSION_FACTORS, calculate_footprints
+from tracker.models import (
+    Achievement, Activity, Challenge, Community, Emission, Profile, User, UserAchievement, UserChallenge,
+)
+
+LOCATIONS = [
+    'Mumbai, Maharashtra', 'Pune, Maharashtra', 'Nagpur, Maharashtra', 'Delhi, NCT of Delhi', 'Bengaluru, Karnataka',
+    'Mysuru, Karnataka', 'Chennai, Tamil Nadu', 'Coimbatore, Tamil Nadu', 'Hyderabad, Telangana', 'Kolkata, West Bengal',
+    'Ahmedabad, Gujarat', 'Surat, Gujarat', 'Jaipur, Rajasthan', 'Lucknow, Uttar Pradesh', 'Kochi, Kerala',
+    'Thiruvananthapuram, Kerala', 'Bhopal, Madhya Pradesh', 'Chandigarh, Punjab', 'Bhubaneswar, Odisha', 'Guwahati, Assam',
+]
+COMMUNITY_TYPES = ['University', 'Company', 'City']
+ACHIEVEMENTS = [
+    ('First Step', 'Logged your first activity.', 'fas fa-shoe-prints', 'bronze', 'synthetic-first-activity'),
+    ('Green Commuter', 'Travelled 100 km by train or bus.', 'fas fa-train', 'silver', 'synthetic-green-commuter'),
+    ('Plant Powered', 'Logged 30 vegetarian meals.', 'fas fa-seedling', 'gold', 'synthetic-plant-powered'),
+]
+
+# Share of activities per category and the (low, high) value range drawn for each.
+CATEGORY_WEIGHTS = {'transport': 0.4, 'energy': 0.25, 'food': 0.3, 'consumption': 0.05}
+VALUE_RANGES = {'transport': (1, 60), 'energy': (1, 15), 'food': (1, 3), 'consumption': (200, 5000)}
+UNITS = {'transport': 'km', 'energy': 'kWh', 'food': 'serving', 'consumption': 'INR'}
+
+
+def describe(category, subtype, value):
+    """Mirrors the description format used by views.activity."""
+    label = subtype.replace('-', ' ').title()
+    if category == 'transport':
+        return f"Travel: {label} - {value} km"
+    if category == 'energy':
+        return f"Energy: {'Manual Entry' if subtype == 'electricity' else label} - {value} kWh"
+    if category == 'food':
+        return f"Food: {label} ({value} servings)"
+    return f"Purchase: {label} - ₹{value:,.2f}"
+
+
+class Command(BaseCommand):
+    help = "Generates synthetic users, profiles, communities, challenges and activity history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--days', type=int, default=365, help="Days of activity history per user.")
+        parser.add_argument('--activities-per-day', type=float, default=3.0, help="Average activities per user per day.")
+        parser.add_argument('--communities', type=int, default=10)
+        parser.add_argument('--challenges', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='synthetic', help="Username prefix for generated users.")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for a reproducible dataset.")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        users = self.create_users(options['users'], options['prefix'], rng, batch_size)
+        communities = self.create_communities(options['communities'], users, rng)
+        self.create_challenges(options['challenges'], communities, rng)
+        activity_count = self.create_activities(users, options['days'], options['activities_per_day'], rng, batch_size)
+        self.award_achievements(users, rng)
+        # Bulk inserts skip the incremental platform counters
+        recount()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {len(communities)} communities, {options['challenges']} challenges "
+            f"and {activity_count} activities in {elapsed:.1f}s ({activity_count / max(elapsed, 1e-9):,.0f} activities/sec)."
+        ))
+
+    def create_users(self, count, prefix, rng, batch_size):
+        start = User.objects.filter(username__startswith=f"{prefix}_").count()
+        # Hashing is deliberately slow, so every synthetic user shares one password hash
+        password = make_password('synthetic-password')
+        users = User.objects.bulk_create(
+            [
+                User(username=f"{prefix}_{n}", email=f"{prefix}_{n}@example.com", first_name='Synthetic', last_name=f"User {n}", password=password)
+                for n in range(start, start + count)
+            ],
+            batch_size=batch_size,
+        )
+        # bulk_create doesn't fire post_save, so profiles are created here
+        locations = rng.choice(LOCATIONS, size=len(users))
+        budgets = rng.choice([300.0, 400.0, 500.0, 750.0], size=len(users))
+        Profile.objects.bulk_create(
+            [Profile(user=user, location=str(loc), carbon_budget_kg=float(budget)) for user, loc, budget in zip(users, locations, budgets)],
+            batch_size=batch_size,
+        )
+        return users
+
+    def create_communities(self, count, users, rng):
+        communities = Community.objects.bulk_create([
+            Community(name=f"Synthetic Community {n}", description="Generated for load testing.", community_type=str(rng.choice(COMMUNITY_TYPES)))
+            for n in range(count)
+        ])
+        memberships = []
+        for user in users:
+            for community in rng.choice(communities, size=min(len(communities), int(rng.integers(0, 4))), replace=False):
+                memberships.append(Community.members.through(community_id=community.id, user_id=user.id))
+        Community.members.through.objects.bulk_create(memberships, ignore_conflicts=True)
+        return communities
+
+    def create_challenges(self, count, communities, rng):
+        if not communities:
+            return []
+        today = date.today()
+        challenges = Challenge.objects.bulk_create([
+            Challenge(
+                community=communities[int(rng.integers(len(communities)))],
+                title=f"Synthetic Challenge {n}",
+                description="Cut your emissions together.",
+                goal=float(rng.choice([50, 100, 200])),
+                unit=str(rng.choice(['km', 'days', 'kg'])),
+                end_date=today + timedelta(days=int(rng.integers(-60, 90))),
+            )
+            for n in range(count)
+        ])
+        members = Community.members.through.objects.filter(community__in=communities).values_list('community_id', 'user_id')
+        by_community = {}
+        for community_id, user_id in members:
+            by_community.setdefault(community_id, []).append(user_id)
+        joined = []
+        for challenge in challenges:
+            for user_id in by_community.get(challenge.community_id, []):
+                if rng.random() < 0.5:
+                    progress = float(rng.uniform(0, challenge.goal))
+                    joined.append(UserChallenge(user_id=user_id, challenge=challenge, progress=progress, is_completed=progress >= challenge.goal * 0.95))
+        UserChallenge.objects.bulk_create(joined, ignore_conflicts=True)
+        return challenges
+
+    def create_activities(self, users, days, per_day, rng, batch_size):
+        categories = list(CATEGORY_WEIGHTS)
+        weights = np.array(list(CATEGORY_WEIGHTS.values()))
+        first_day = timezone.make_aware(datetime.combine(date.today() - timedelta(days=days - 1), dt_time.min))
+        total = 0
+
+        for user in users:
+            n = int(rng.poisson(per_day * days))
+            if n == 0:
+                continue
+            cats = rng.choice(categories, size=n, p=weights / weights.sum())
+            subtypes = np.array([rng.choice(list(EMISSION_FACTORS[c])) for c in cats])
+            lows = np.array([VALUE_RANGES[c][0] for c in cats])
+            highs = np.array([VALUE_RANGES[c][1] for c in cats])
+            values = np.round(rng.uniform(lows, highs), 1)
+            units = np.array([UNITS[c] for c in cats])
+            # Activities cluster in waking hours
+            offsets = rng.integers(0, days, size=n) * 86400 + rng.normal(14 * 3600, 4 * 3600, size=n).clip(0, 86399).astype(int)
+            footprints = calculate_footprints(cats, subtypes, values, units)
+
+            for start in range(0, n, batch_size):
+                chunk = slice(start, start + batch_size)
+                with transaction.atomic():
+                    activities = Activity.objects.bulk_create([
+                        Activity(
+                            user=user, category=str(c), subtype=str(s), description=describe(c, s, float(v)),
+                            value=float(v), unit=str(u), timestamp=first_day + timedelta(seconds=int(o)),
+                        )
+                        for c, s, v, u, o in zip(cats[chunk], subtypes[chunk], values[chunk], units[chunk], offsets[chunk])
+                    ])
+                    Emission.objects.bulk_create([
+                        Emission(activity=activity, co2_equivalent_kg=float(footprint))
+                        for activity, footprint in zip(activities, footprints[chunk])
+                    ])
+            total += n
+        return total
+
+    def award_achievements(self, users, rng):
+        achievements = [
+            Achievement.objects.get_or_create(condition_key=key, defaults={'name': name, 'description': desc, 'icon': icon, 'tier': tier})[0]
+            for name, desc, icon, tier, key in ACHIEVEMENTS
+        ]
+        UserAchievement.objects.bulk_create(
+            [UserAchievement(user=user, achievement=a) for user in users for a in achievements if rng.random() < 0.3],
+            ignore_conflicts=True,
+        )
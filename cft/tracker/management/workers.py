@@ -0,0 +1,9 @@
+"""Shared helpers for management commands that fan work out over a process pool."""
+from django.db import connections
+
+
+def init_worker():
+    """Runs in each pool process; inherited DB connections must not be shared across processes."""
+    import django
+    django.setup()
+    connections.close_all()
@@ -0,0 +1,202 @@
+"""
+Per-view performance instrumentation.
+
+PerformanceMiddleware records, for each sampled request, the resolved URL name, total
+latency, number of SQL queries, time spent in SQL, duplicate and repeated ("N+1")
+queries and template render time. Records go into an in-process ring buffer that is
+appended to a JSON-lines file every PERF_FLUSH_INTERVAL seconds; `manage.py perfreport`
+summarizes that file.
+
+Settings (all optional):
+    PERF_MONITORING_ENABLED  off by default; when off the middleware removes itself from
+                             the chain at startup and templates aren't patched
+    PERF_SAMPLE_RATE         fraction of requests to instrument (e.g. 0.05 in production)
+    PERF_BUFFER_SIZE         records kept in memory
+    PERF_FLUSH_INTERVAL      seconds between writes to PERF_LOG_PATH
+    PERF_LOG_PATH            JSON-lines output file
+
+ProfilingMiddleware runs single requests under a sampling profiler (tracker/profiling.py)
+when a staff user asks for it with the PROFILE_HEADER header or PROFILE_QUERY_PARAM, or
+at random with PROFILE_SAMPLE_RATE. With PROFILE_ENABLED off it removes itself from the
+middleware chain at startup.
+"""
+import atexit
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+from .profiling import Sampler, save_profile
+
+# Per-request stats; None outside an instrumented request.
+_current = contextvars.ContextVar('tracker_perf_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = Counter()
+        self.statements = Counter()
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper(); sees every query on that connection
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.statements[sql] += 1
+            self.queries[(sql, repr(params))] += 1
+
+    def as_record(self, url_name, request, status, total_seconds):
+        duplicates = Counter({sql: count for (sql, _), count in self.queries.items() if count > 1})
+        return {
+            'ts': round(time.time(), 3),
+            'url_name': url_name,
+            'method': request.method,
+            'status': status,
+            'total_ms': round(total_seconds * 1000, 2),
+            'sql_ms': round(self.sql_seconds * 1000, 2),
+            'template_ms': round(self.template_seconds * 1000, 2),
+            'queries': sum(self.statements.values()),
+            'duplicate_queries': sum(count - 1 for count in self.queries.values()),
+            'similar_queries': sum(count - 1 for count in self.statements.values()),
+            'top_duplicates': [[sql, count] for sql, count in duplicates.most_common(3)],
+            'top_similar': [[sql, count] for sql, count in self.statements.most_common(3) if count > 1],
+        }
+
+
+class StatsBuffer:
+    """Fixed-size in-memory buffer of request records, appended to a file in batches."""
+
+    def __init__(self, size, path, flush_interval):
+        self.records = deque(maxlen=size)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+            self.unflushed += 1
+            due = time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            # If the buffer wrapped since the last flush, the oldest records are gone
+            pending = list(self.records)[-self.unflushed:] if self.unflushed else []
+            self.unflushed = 0
+            self.last_flush = time.monotonic()
+        if not pending or not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as log:
+            log.writelines(json.dumps(record) + '\n' for record in pending)
+
+
+def _timed_render(render):
+    def wrapper(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return render(self, context, request)
+        # Only the outermost render counts; included templates are part of it
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                stats.template_seconds += time.perf_counter() - started
+    wrapper.perf_instrumented = True
+    return wrapper
+
+
+class PerformanceMiddleware:
+    buffer = None
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if not getattr(settings, 'PERF_MONITORING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.sample_rate = getattr(settings, 'PERF_SAMPLE_RATE', 1.0)
+        if PerformanceMiddleware.buffer is None:
+            PerformanceMiddleware.buffer = StatsBuffer(
+                size=getattr(settings, 'PERF_BUFFER_SIZE', 1000),
+                path=str(getattr(settings, 'PERF_LOG_PATH', '')),
+                flush_interval=getattr(settings, 'PERF_FLUSH_INTERVAL', 30),
+            )
+            atexit.register(PerformanceMiddleware.buffer.flush)
+            if not getattr(DjangoTemplate.render, 'perf_instrumented', False):
+                DjangoTemplate.render = _timed_render(DjangoTemplate.render)
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.view_name if match else None) or request.path
+        self.buffer.add(stats.as_record(url_name, request, response.status_code, elapsed))
+        return response
+
+
+class ProfilingMiddleware:
+    """Goes after AuthenticationMiddleware, which the staff check needs."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILE_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        self.interval = getattr(settings, 'PROFILE_INTERVAL', 0.005)
+        self.directory = str(settings.PROFILE_DIR)
+        self.header = getattr(settings, 'PROFILE_HEADER', 'X-Profile')
+        self.query_param = getattr(settings, 'PROFILE_QUERY_PARAM', '_profile')
+
+    def wants_profile(self, request):
+        # The user (and its session lookup) is only touched when a profile was asked for
+        if request.headers.get(self.header) or self.query_param in request.GET:
+            return request.user.is_staff
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.wants_profile(request):
+            return self.get_response(request)
+
+        sampler = Sampler(self.interval).start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.view_name if match else None) or request.path
+        record = save_profile(sampler, self.directory, url_name, request, response.status_code)
+        response['X-Profile-Id'] = record['stem']
+        return response
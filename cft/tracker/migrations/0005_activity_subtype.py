@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:38
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+BACKFILL_CHUNK_SIZE = 2000
+
+# Frozen copy of tracker.footprint's description parsing as it was when this migration was written.
+DESCRIPTION_RE = re.compile(r'^(?:Travel|Energy|Food|Purchase):\s*(?P<label>.+?)\s*(?:\(| - )')
+UNIT_ALIASES = {
+    'km': 'km', 'kms': 'km', 'kilometer': 'km', 'kilometers': 'km', 'kilometre': 'km', 'kilometres': 'km',
+    'kwh': 'kWh', 'unit': 'kWh', 'units': 'kWh',
+    'serving': 'serving', 'servings': 'serving', 'meal': 'serving', 'meals': 'serving',
+    'inr': 'INR', 'rs': 'INR', 'rs.': 'INR', '₹': 'INR', 'rupees': 'INR',
+}
+
+
+def backfill_subtype(apps, schema_editor):
+    """Parses subtype out of existing descriptions and normalizes units, one chunk per transaction."""
+    Activity = apps.get_model('tracker', 'Activity')
+    last_id = 0
+    while True:
+        chunk = list(Activity.objects.filter(id__gt=last_id).order_by('id').only('id', 'category', 'description', 'unit')[:BACKFILL_CHUNK_SIZE])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        for activity in chunk:
+            if activity.category == 'energy':
+                activity.subtype = 'electricity'
+            else:
+                match = DESCRIPTION_RE.match(activity.description or '')
+                activity.subtype = match.group('label').strip().lower().replace(' ', '-') if match else ''
+            activity.unit = UNIT_ALIASES.get((activity.unit or '').strip().lower(), activity.unit)
+
+        with transaction.atomic():
+            Activity.objects.bulk_update(chunk, ['subtype', 'unit'])
+
+
+class Migration(migrations.Migration):
+    # Each backfill chunk commits on its own instead of holding one huge transaction
+    atomic = False
+
+    dependencies = [
+        ('tracker', '0004_community_challenge_userchallenge_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='subtype',
+            field=models.CharField(blank=True, default='', help_text="e.g., 'car-gasoline', 'vegetarian', 'electronics'", max_length=50),
+        ),
+        migrations.RunPython(backfill_subtype, migrations.RunPython.noop),
+        # Built after the backfill so the bulk updates don't have to maintain it
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['user', 'category', 'subtype'], name='activity_user_cat_subtype_idx'),
+        ),
+    ]
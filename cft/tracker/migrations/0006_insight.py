@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0005_activity_subtype'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='insights_watermark',
+            field=models.BigIntegerField(default=0, help_text="Id of the newest activity covered by the user's generated insights"),
+        ),
+        migrations.CreateModel(
+            name='Insight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(help_text='1 is the most impactful insight for the user')),
+                ('kind', models.CharField(help_text="e.g., 'substitution', 'peak_time', 'top_category'", max_length=30)),
+                ('icon', models.CharField(help_text="e.g., 'fas fa-bus'", max_length=50)),
+                ('text', models.CharField(max_length=255)),
+                ('impact', models.CharField(blank=True, max_length=100)),
+                ('saving_kg', models.FloatField(default=0, help_text='Estimated monthly saving in kg CO2e, if any')),
+                ('generated_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='insights', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'rank'],
+                'indexes': [models.Index(fields=['user', 'rank'], name='tracker_ins_user_id_e23e16_idx')],
+            },
+        ),
+    ]
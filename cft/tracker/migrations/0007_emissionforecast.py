@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0006_insight'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmissionForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateField(help_text='Day the forecast was computed; stale forecasts are recomputed on read')),
+                ('month_to_date_kg', models.FloatField(default=0)),
+                ('remaining_kg', models.FloatField(default=0, help_text='Forecast emissions for the rest of the month after as_of')),
+                ('method', models.CharField(default='ses', max_length=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='forecast', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
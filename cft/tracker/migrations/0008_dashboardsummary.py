@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tracker', '0007_emissionforecast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('day', models.DateField(help_text='The day today_kg refers to; older summaries are rolled forward on read')),
+                ('month', models.DateField(help_text='First day of the month month_kg refers to')),
+                ('today_kg', models.FloatField(default=0)),
+                ('yesterday_kg', models.FloatField(default=0)),
+                ('month_kg', models.FloatField(default=0)),
+                ('last_month_kg', models.FloatField(default=0)),
+                ('transport_month_kg', models.FloatField(default=0)),
+                ('energy_month_kg', models.FloatField(default=0)),
+                ('food_month_kg', models.FloatField(default=0)),
+                ('consumption_month_kg', models.FloatField(default=0)),
+                ('waste_month_kg', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:55
+
+from datetime import date
+
+from django.db import migrations, models
+
+# Local starting rates (units per USD). INR keeps the 83 the app has always used, so
+# recalculating existing footprints doesn't move them; newer rates are added as rows.
+SEED_RATES = [
+    ('INR', date(2000, 1, 1), 83.0),
+    ('EUR', date(2000, 1, 1), 0.92),
+    ('GBP', date(2000, 1, 1), 0.79),
+    ('AED', date(2000, 1, 1), 3.6725),
+    ('SGD', date(2000, 1, 1), 1.35),
+]
+
+
+def seed_rates(apps, schema_editor):
+    ExchangeRate = apps.get_model('tracker', 'ExchangeRate')
+    ExchangeRate.objects.bulk_create(
+        [ExchangeRate(currency=currency, valid_from=valid_from, per_usd=per_usd) for currency, valid_from, per_usd in SEED_RATES],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0008_dashboardsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(help_text="ISO 4217 code, e.g. 'INR'", max_length=3)),
+                ('valid_from', models.DateField(help_text='Applies to purchases from this date until the next rate for the currency')),
+                ('per_usd', models.FloatField(help_text='Units of the currency per US dollar, e.g. 83.0 for INR')),
+            ],
+            options={
+                'ordering': ['currency', 'valid_from'],
+                'unique_together': {('currency', 'valid_from')},
+            },
+        ),
+        migrations.RunPython(seed_rates, migrations.RunPython.noop),
+    ]
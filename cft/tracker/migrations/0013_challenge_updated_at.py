@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_activity_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='challenge',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
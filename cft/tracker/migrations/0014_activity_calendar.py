@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('tracker', '0013_challenge_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityCalendar',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='activity_calendar', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('start', models.DateField(help_text='The day bit 0 stands for; moved back if an earlier day is logged')),
+                ('days', models.BinaryField(default=b'', help_text='Bit n set if there was an activity on start + n days (little-endian)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
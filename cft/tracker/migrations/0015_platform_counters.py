@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0014_activity_calendar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformCounters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_count', models.IntegerField(default=0)),
+                ('activity_count', models.IntegerField(default=0, help_text='Archived activities included')),
+                ('co2_logged_kg', models.FloatField(default=0)),
+                ('active_user_days', models.IntegerField(default=0, help_text='Days with an activity, summed over users')),
+                ('region_count', models.IntegerField(default=0, help_text='Distinct profile locations')),
+                ('reconciled_at', models.DateTimeField(blank=True, help_text='Last exact recount', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'platform counters',
+            },
+        ),
+    ]
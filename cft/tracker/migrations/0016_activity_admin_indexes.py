@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0015_platform_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['timestamp'], name='activity_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['category', 'timestamp'], name='activity_category_ts_idx'),
+        ),
+    ]
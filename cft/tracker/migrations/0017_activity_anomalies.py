@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0016_activity_admin_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityBaseline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('transport', 'Transportation'), ('energy', 'Home Energy'), ('food', 'Food & Diet'), ('consumption', 'Consumption'), ('waste', 'Waste')], max_length=20)),
+                ('subtype', models.CharField(blank=True, default='', max_length=50)),
+                ('count', models.IntegerField(default=0)),
+                ('mean', models.FloatField(default=0, help_text='Mean of log(1 + amount in base units)')),
+                ('m2', models.FloatField(default=0, help_text='Sum of squared deviations from the mean (Welford)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='anomaly_confirmed',
+            field=models.BooleanField(default=False, help_text='Confirmed by the user after being quarantined'),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='quarantined',
+            field=models.BooleanField(default=False, help_text='Unusually large for this user; held out of totals until confirmed'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(condition=models.Q(('quarantined', True)), fields=['user'], name='activity_quarantined_idx'),
+        ),
+        migrations.AddField(
+            model_name='activitybaseline',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='activitybaseline',
+            constraint=models.UniqueConstraint(fields=('user', 'category', 'subtype'), name='activity_baseline_uniq'),
+        ),
+    ]
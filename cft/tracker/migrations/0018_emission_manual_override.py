@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0017_activity_anomalies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emission',
+            name='manual_override',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from .footprint import parse_subtype
+from .units import normalize_unit
+from .dedupe import activity_hash
 
 # 1. Profile Model (Extends the User Model)
 class Profile(models.Model):
@@ -8,10 +11,23 @@ class Profile(models.Model):
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     location = models.CharField(max_length=100, blank=True, null=True, help_text="e.g., Mumbai, India")
     carbon_budget_kg = models.FloatField(default=500.0, help_text="User's personal monthly CO2 budget in kg")
+    insights_watermark = models.BigIntegerField(default=0, help_text="Id of the newest activity covered by the user's generated insights")
 
     def __str__(self):
         return f'{self.user.username} Profile'
 
+def get_profile(user):
+    """
+    The user's profile. It's normally created with the user (signals.create_profile);
+    accounts that somehow lack one get it here, on first use, instead of on every request.
+    """
+    try:
+        return user.profile
+    except Profile.DoesNotExist:
+        profile, _ = Profile.objects.get_or_create(user=user)
+        user.profile = profile
+        return profile
+
 # 2. Activity Model (The Core of the App)
 class Activity(models.Model):
     ACTIVITY_CATEGORIES = [
@@ -23,10 +39,41 @@ class Activity(models.Model):
     ]
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     category = models.CharField(max_length=20, choices=ACTIVITY_CATEGORIES)
+    subtype = models.CharField(max_length=50, blank=True, default='', help_text="e.g., 'car-gasoline', 'vegetarian', 'electronics'")
     description = models.CharField(max_length=255)
     value = models.FloatField(help_text="e.g., distance in km, energy in kWh, quantity of items")
     unit = models.CharField(max_length=50, help_text="e.g., 'km', 'kWh', 'serving'")
     timestamp = models.DateTimeField(default=timezone.now)
+    # Duplicate protection (see tracker/dedupe.py); NULL on rows that predate it
+    content_hash = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    # Anomaly screening (see tracker/anomalies.py); a quarantined activity's kg is left out of every total
+    quarantined = models.BooleanField(default=False, help_text="Unusually large for this user; held out of totals until confirmed")
+    anomaly_confirmed = models.BooleanField(default=False, help_text="Confirmed by the user after being quarantined")
+
+    class Meta:
+        indexes = [
+            # Per-mode breakdowns (GROUP BY subtype) for one user and category
+            models.Index(fields=['user', 'category', 'subtype'], name='activity_user_cat_subtype_idx'),
+            # Cross-user time windows (leaderboard) and the admin's date hierarchy and category filter
+            models.Index(fields=['timestamp'], name='activity_timestamp_idx'),
+            models.Index(fields=['category', 'timestamp'], name='activity_category_ts_idx'),
+            # The few activities awaiting review
+            models.Index(fields=['user'], condition=models.Q(quarantined=True), name='activity_quarantined_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'content_hash'], name='activity_user_content_hash_uniq'),
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='activity_user_idempotency_key_uniq'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep the structured fields filled in no matter which path created the row
+        self.unit = normalize_unit(self.category, self.unit)
+        if not self.subtype:
+            self.subtype = parse_subtype(self.category, self.description)
+        if self._state.adding and self.content_hash is None:
+            self.content_hash = activity_hash(self)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username} - {self.description} on {self.timestamp.strftime('%Y-%m-%d')}"
@@ -36,6 +83,8 @@ class Emission(models.Model):
     activity = models.OneToOneField(Activity, on_delete=models.CASCADE)
     co2_equivalent_kg = models.FloatField()
     calculation_date = models.DateTimeField(auto_now_add=True)
+    # Set when the user edits the footprint on the activity page; recalculation leaves these alone
+    manual_override = models.BooleanField(default=False)
 
     def __str__(self):
         return f"Emission for {self.activity.description}: {self.co2_equivalent_kg} kg CO2e"
@@ -87,6 +136,8 @@ class Challenge(models.Model):
     reward_achievement = models.ForeignKey(Achievement, on_delete=models.SET_NULL, null=True, blank=True)
     end_date = models.DateField()
     participants = models.ManyToManyField(User, through='UserChallenge', related_name='challenges_joined')
+    # Also moved when a participant's progress changes (signals.touch_challenge); versions the API's challenge list
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.title
@@ -104,3 +155,184 @@ class UserChallenge(models.Model):
 
     def __str__(self):
         return f"{self.user.username} in {self.challenge.title}"
+
+# 8. Insight Model (Ranked, precomputed advice from `manage.py generate_insights`)
+class Insight(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='insights')
+    rank = models.PositiveSmallIntegerField(help_text="1 is the most impactful insight for the user")
+    kind = models.CharField(max_length=30, help_text="e.g., 'substitution', 'peak_time', 'top_category'")
+    icon = models.CharField(max_length=50, help_text="e.g., 'fas fa-bus'")
+    text = models.CharField(max_length=255)
+    impact = models.CharField(max_length=100, blank=True)
+    saving_kg = models.FloatField(default=0, help_text="Estimated monthly saving in kg CO2e, if any")
+    generated_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['user', 'rank']
+        indexes = [models.Index(fields=['user', 'rank'])]
+
+    def __str__(self):
+        return f"#{self.rank} for user {self.user_id}: {self.text}"
+
+# 9. EmissionForecast Model (End-of-month projection per user, see tracker/forecast.py)
+class EmissionForecast(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='forecast')
+    as_of = models.DateField(help_text="Day the forecast was computed; stale forecasts are recomputed on read")
+    month_to_date_kg = models.FloatField(default=0)
+    remaining_kg = models.FloatField(default=0, help_text="Forecast emissions for the rest of the month after as_of")
+    method = models.CharField(max_length=20, default='ses')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def projected_kg(self):
+        return self.month_to_date_kg + self.remaining_kg
+
+    def __str__(self):
+        return f"{self.user_id}: {self.projected_kg:.1f} kg projected as of {self.as_of}"
+
+# 10. DashboardSummary Model (Running totals behind the activity page stats, see tracker/summary.py)
+class DashboardSummary(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='dashboard_summary')
+    day = models.DateField(help_text="The day today_kg refers to; older summaries are rolled forward on read")
+    month = models.DateField(help_text="First day of the month month_kg refers to")
+    today_kg = models.FloatField(default=0)
+    yesterday_kg = models.FloatField(default=0)
+    month_kg = models.FloatField(default=0)
+    last_month_kg = models.FloatField(default=0)
+    transport_month_kg = models.FloatField(default=0)
+    energy_month_kg = models.FloatField(default=0)
+    food_month_kg = models.FloatField(default=0)
+    consumption_month_kg = models.FloatField(default=0)
+    waste_month_kg = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard summary for user {self.user_id} on {self.day}"
+
+# 11. ExchangeRate Model (Dated currency rates used to value purchases, see tracker/units.py)
+class ExchangeRate(models.Model):
+    currency = models.CharField(max_length=3, help_text="ISO 4217 code, e.g. 'INR'")
+    valid_from = models.DateField(help_text="Applies to purchases from this date until the next rate for the currency")
+    per_usd = models.FloatField(help_text="Units of the currency per US dollar, e.g. 83.0 for INR")
+
+    class Meta:
+        ordering = ['currency', 'valid_from']
+        unique_together = ('currency', 'valid_from')
+
+    def __str__(self):
+        return f"1 USD = {self.per_usd} {self.currency} from {self.valid_from}"
+
+# 12. StatementImport Model (An uploaded bill or bank statement and its import progress, see tracker/statements.py)
+class StatementImport(models.Model):
+    KINDS = [
+        ('bank', 'Bank or card statement'),
+        ('electricity', 'Electricity bill'),
+    ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='statement_imports')
+    kind = models.CharField(max_length=20, choices=KINDS, default='bank')
+    file = models.FileField(upload_to='statements/%Y/%m/')
+    original_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending')
+    bytes_total = models.BigIntegerField(default=0)
+    bytes_processed = models.BigIntegerField(default=0)
+    lines_read = models.IntegerField(default=0)
+    imported = models.IntegerField(default=0)
+    duplicates = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0, help_text="Lines that weren't spending, e.g. credits, transfers or bill payments")
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @property
+    def progress(self):
+        if self.status == 'done':
+            return 100
+        return min(round(self.bytes_processed / self.bytes_total * 100), 99) if self.bytes_total else 0
+
+    def __str__(self):
+        return f"{self.original_name} ({self.get_status_display()}) for {self.user.username}"
+
+# 13. ArchivedMonth Model (Monthly per-category totals of activities moved out of the hot table, see tracker/archive.py)
+class ArchivedMonth(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_months')
+    month = models.DateField(help_text="First day of the month")
+    category = models.CharField(max_length=20, choices=Activity.ACTIVITY_CATEGORIES)
+    activity_count = models.IntegerField(default=0)
+    co2_kg = models.FloatField(default=0)
+    active_days = models.BigIntegerField(default=0, help_text="Bit n-1 set if there was an activity on day n of the month")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month', 'category'], name='archivedmonth_user_month_cat_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.month:%Y-%m} {self.category}: {self.co2_kg:.1f} kg over {self.activity_count} activities"
+
+# 14. ActivityArchive Model (The raw archived activities of one user and month, zlib-compressed JSON)
+class ActivityArchive(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_archives')
+    month = models.DateField(help_text="First day of the month")
+    row_count = models.IntegerField(default=0)
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='activityarchive_user_month_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.row_count} archived activities of user {self.user_id} for {self.month:%Y-%m}"
+
+# 15. ActivityCalendar Model (Bitmap of the days a user logged activities on, see tracker/streaks.py)
+class ActivityCalendar(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='activity_calendar')
+    start = models.DateField(help_text="The day bit 0 stands for; moved back if an earlier day is logged")
+    days = models.BinaryField(default=b'', help_text="Bit n set if there was an activity on start + n days (little-endian)")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Activity calendar of user {self.user_id} from {self.start}"
+
+# 16. PlatformCounters Model (Platform-wide totals for the home page, a single row; see tracker/counters.py)
+class PlatformCounters(models.Model):
+    user_count = models.IntegerField(default=0)
+    activity_count = models.IntegerField(default=0, help_text="Archived activities included")
+    co2_logged_kg = models.FloatField(default=0)
+    active_user_days = models.IntegerField(default=0, help_text="Days with an activity, summed over users")
+    region_count = models.IntegerField(default=0, help_text="Distinct profile locations")
+    reconciled_at = models.DateTimeField(null=True, blank=True, help_text="Last exact recount")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'platform counters'
+
+    def __str__(self):
+        return f"{self.user_count} users, {self.activity_count} activities, {self.co2_logged_kg:.0f} kg CO2e"
+
+# 17. ActivityBaseline Model (Running statistics of a user's amounts per category and subtype, see tracker/anomalies.py)
+class ActivityBaseline(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.CharField(max_length=20, choices=Activity.ACTIVITY_CATEGORIES)
+    subtype = models.CharField(max_length=50, blank=True, default='')
+    count = models.IntegerField(default=0)
+    mean = models.FloatField(default=0, help_text="Mean of log(1 + amount in base units)")
+    m2 = models.FloatField(default=0, help_text="Sum of squared deviations from the mean (Welford)")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'subtype'], name='activity_baseline_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Baseline of user {self.user_id} for {self.category}/{self.subtype} ({self.count} readings)"
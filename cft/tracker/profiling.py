@@ -0,0 +1,158 @@
+"""
+Statistical profiling of single requests (see middleware.ProfilingMiddleware).
+
+A Sampler thread wakes every PROFILE_INTERVAL seconds and records the profiled thread's
+Python stack from sys._current_frames(). Nothing is hooked into the interpreter, so the
+profiled request runs at close to full speed and requests that aren't profiled pay
+nothing at all. The sampler needs the GIL to run, so intervals below the interpreter's
+switch interval (5 ms by default) don't add samples.
+
+Each capture is saved under PROFILE_DIR as two files, and one line describing it is
+appended to PROFILE_DIR/index.jsonl:
+
+- <stem>.folded: collapsed stacks ("root;caller;callee 12"), the input flamegraph.pl
+  expects; speedscope opens it too
+- <stem>.speedscope.json: the samples in order, for speedscope's time-ordered view
+
+`manage.py profilereport` lists captures and merges them per URL name.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+INDEX_NAME = 'index.jsonl'
+
+# code object -> (label, module, first line); the sampler sees the same few hundred over and over
+_labels = {}
+
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        module = code.co_filename
+        for path in sorted(sys.path, key=len, reverse=True):
+            if path and module.startswith(path):
+                module = module[len(path):].lstrip(os.sep)
+                break
+        label = _labels[code] = (f"{code.co_name} ({module})", module, code.co_firstlineno)
+    return label
+
+
+class Sampler:
+    """Samples one thread's stack on a background thread between start() and stop()."""
+
+    def __init__(self, interval, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = []  # (stack of code objects, root first; seconds it stands for)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if Sampler.stop.__code__ in stack:
+                break  # the request is over; this would only show the sampler being joined
+            stack.reverse()
+            self.samples.append((tuple(stack), now - last))
+            last = now
+
+    def folded(self):
+        """Counter of 'root;...;leaf' -> samples."""
+        return Counter(';'.join(_frame_label(code)[0] for code in stack) for stack, _ in self.samples)
+
+    def speedscope(self, name):
+        """The samples as a speedscope 'sampled' profile, weights in milliseconds."""
+        frames, index, samples, weights = [], {}, [], []
+        for stack, seconds in self.samples:
+            row = []
+            for code in stack:
+                if code not in index:
+                    label, module, line = _frame_label(code)
+                    index[code] = len(frames)
+                    frames.append({'name': label, 'file': module, 'line': line})
+                row.append(index[code])
+            samples.append(row)
+            weights.append(round(seconds * 1000, 3))
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'cft tracker.profiling',
+            'activeProfileIndex': 0,
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled', 'name': name, 'unit': 'milliseconds',
+                'startValue': 0, 'endValue': round(sum(weights), 3),
+                'samples': samples, 'weights': weights,
+            }],
+        }
+
+
+def save_profile(sampler, directory, url_name, request, status):
+    """Writes a finished capture and indexes it. Returns the index record."""
+    os.makedirs(directory, exist_ok=True)
+    stem = f"{datetime.now():%Y%m%d-%H%M%S}-{url_name.replace(':', '-').replace('/', '_')[:60]}-{uuid.uuid4().hex[:6]}"
+    with open(os.path.join(directory, f"{stem}.folded"), 'w', encoding='utf-8') as out:
+        out.writelines(f"{stack} {count}\n" for stack, count in sampler.folded().items())
+    name = f"{request.method} {request.path} ({url_name})"
+    with open(os.path.join(directory, f"{stem}.speedscope.json"), 'w', encoding='utf-8') as out:
+        json.dump(sampler.speedscope(name), out, separators=(',', ':'))
+    record = {
+        'ts': round(time.time(), 3),
+        'url_name': url_name,
+        'method': request.method,
+        'path': request.path,
+        'status': status,
+        'total_ms': round(sampler.elapsed * 1000, 2),
+        'samples': len(sampler.samples),
+        'stem': stem,
+    }
+    with open(os.path.join(directory, INDEX_NAME), 'a', encoding='utf-8') as index:
+        index.write(json.dumps(record) + '\n')
+    return record
+
+
+def read_index(directory):
+    """Every capture's index record, oldest first."""
+    try:
+        with open(os.path.join(directory, INDEX_NAME), encoding='utf-8') as index:
+            return [json.loads(line) for line in index if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def read_folded(directory, stem):
+    """A capture's collapsed stacks as a Counter; empty if the file has been removed."""
+    stacks = Counter()
+    try:
+        with open(os.path.join(directory, f"{stem}.folded"), encoding='utf-8') as folded:
+            for line in folded:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    stacks[stack] += int(count)
+    except FileNotFoundError:
+        pass
+    return stacks
@@ -0,0 +1,82 @@
+"""
+Recalculation of stored emissions after the factor table or exchange rates change.
+
+recalculate_activities() walks an Activity queryset in primary-key chunks and rewrites
+the Emission rows whose footprint moved, except footprints the user set by hand on the
+activity page (Emission.manual_override), which are only counted. It's used by `manage.py recalculate_footprints`
+(spread over worker processes by user id range) and by the activity admin's action.
+Both then call apply_recalculation() once, which rebuilds the affected users' dashboard
+totals and forecasts and moves the platform counters, since bulk updates bypass the
+write-through totals.
+"""
+import numpy as np
+from django.db import transaction
+
+from .counters import record_counts
+from .footprint import calculate_footprints, parse_subtype
+from .models import Emission
+from .summary import rebuild_totals
+
+# Differences smaller than this are rounding noise, not a factor change.
+TOLERANCE = 0.005
+# How many changed rows each call keeps for a dry-run diff.
+DIFF_SAMPLE_SIZE = 20
+
+
+def recalculate_activities(activities, chunk_size=5000, batch_size=1000, dry_run=False):
+    """
+    Recalculates footprints for an Activity queryset. Returns {'scanned', 'changed',
+    'delta_kg', 'diff', 'users', 'manual', 'manual_diff'}; the manual entries are
+    edited footprints that differ from the table but were left as they are.
+
+    Activities are read in primary-key order, chunk_size at a time, so memory use stays
+    flat regardless of table size. Each chunk's updates are written in one transaction.
+    """
+    activities = activities.filter(emission__isnull=False)
+    stats = {'scanned': 0, 'changed': 0, 'delta_kg': 0.0, 'diff': [], 'users': set(), 'manual': 0, 'manual_diff': []}
+    last_id = 0
+    while True:
+        rows = list(
+            activities.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'category', 'subtype', 'description', 'value', 'unit', 'timestamp', 'emission__id', 'emission__co2_equivalent_kg', 'user_id', 'quarantined', 'emission__manual_override')[:chunk_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        activity_ids, categories, subtypes, descriptions, values, units, timestamps, emission_ids, old_footprints, user_ids, quarantined, manual = zip(*rows)
+        # Rows that predate the subtype backfill still carry it only in the description
+        subtypes = [sub or parse_subtype(cat, desc) for cat, sub, desc in zip(categories, subtypes, descriptions)]
+        old = np.array(old_footprints, dtype=np.float64)
+        # Purchases are valued at the exchange rate of the day they were made
+        new = calculate_footprints(categories, subtypes, values, units, timestamps)
+
+        differs = np.abs(new - old) > TOLERANCE
+        edited = np.array(manual, dtype=bool)
+        changed = np.flatnonzero(differs & ~edited)
+        for i in np.flatnonzero(differs & edited)[:max(0, DIFF_SAMPLE_SIZE - len(stats['manual_diff']))]:
+            stats['manual_diff'].append((activity_ids[i], descriptions[i], float(old[i]), float(new[i])))
+        stats['manual'] += int((differs & edited).sum())
+        stats['scanned'] += len(rows)
+        stats['changed'] += changed.size
+        # Quarantined activities aren't in any total yet (see tracker/anomalies.py)
+        counted = changed[~np.array(quarantined, dtype=bool)[changed]]
+        stats['delta_kg'] += float((new[counted] - old[counted]).sum())
+        stats['users'].update(user_ids[i] for i in changed)
+
+        for i in changed[:max(0, DIFF_SAMPLE_SIZE - len(stats['diff']))]:
+            stats['diff'].append((activity_ids[i], descriptions[i], float(old[i]), float(new[i])))
+
+        if changed.size and not dry_run:
+            updated = [Emission(id=emission_ids[i], co2_equivalent_kg=float(new[i])) for i in changed]
+            with transaction.atomic():
+                Emission.objects.bulk_update(updated, ['co2_equivalent_kg'], batch_size=batch_size)
+
+    return stats
+
+
+def apply_recalculation(user_ids, delta_kg):
+    """Brings the totals of users whose emissions were rewritten back in line."""
+    rebuild_totals(user_ids)
+    record_counts(co2_logged_kg=delta_kg)
@@ -0,0 +1,163 @@
+"""
+Serializers for the REST API (tracker/api.py).
+
+Writes are validated with ordinary DRF serializers. Reads skip per-instance model
+serialization: list endpoints fetch `values()` rows and each serializer's `rows()`
+turns them into response dicts directly, which keeps a 50-row page to one query and a
+few microseconds of Python per row.
+"""
+from django.utils import timezone
+from rest_framework import serializers
+
+from .footprint import EMISSION_FACTORS, SPEND_FACTORS
+from .models import Activity
+from .units import get_converter, normalize_unit
+
+
+def _iso(value):
+    """Datetimes the way DRF renders them (ISO 8601, UTC as 'Z')."""
+    if value is None:
+        return None
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class ActivitySerializer(serializers.Serializer):
+    """Validates submitted activities; row()/rows() render stored ones, with their footprint."""
+    VALUES = ('id', 'category', 'subtype', 'description', 'value', 'unit', 'timestamp', 'emission__co2_equivalent_kg', 'quarantined')
+
+    category = serializers.ChoiceField(choices=[c for c, _ in Activity.ACTIVITY_CATEGORIES if c in EMISSION_FACTORS])
+    subtype = serializers.CharField(max_length=50)
+    description = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    value = serializers.FloatField(min_value=0)
+    unit = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    timestamp = serializers.DateTimeField(required=False)
+    idempotency_key = serializers.CharField(max_length=64, required=False, write_only=True)
+
+    def validate(self, data):
+        category = data['category']
+        known = set(EMISSION_FACTORS[category]) | set(SPEND_FACTORS.get(category, ()))
+        if data['subtype'] not in known:
+            raise serializers.ValidationError({'subtype': f"Unknown {category} subtype; expected one of: {', '.join(sorted(known))}."})
+        data['unit'] = normalize_unit(category, data.get('unit'))
+        if not get_converter().accepts(category, data['unit']):
+            raise serializers.ValidationError({'unit': f"{data['unit']!r} can't be used for {category}."})
+        if data.get('timestamp') and data['timestamp'] > timezone.now():
+            raise serializers.ValidationError({'timestamp': "Activities can't be logged in the future."})
+        return data
+
+    @classmethod
+    def row(cls, activity_id, category, subtype, description, value, unit, timestamp, footprint, quarantined=False):
+        return {
+            'id': activity_id,
+            'category': category,
+            'subtype': subtype,
+            'description': description,
+            'value': value,
+            'unit': unit,
+            'timestamp': _iso(timestamp),
+            'footprint_kg': footprint,
+            # Left out of every total until confirmed (see tracker/anomalies.py)
+            'quarantined': quarantined,
+        }
+
+    @classmethod
+    def rows(cls, values):
+        """Response dicts for `values(*VALUES)` rows."""
+        return [cls.row(*(row[field] for field in cls.VALUES)) for row in values]
+
+    @classmethod
+    def from_instance(cls, activity):
+        emission = getattr(activity, 'emission', None)
+        return cls.row(
+            activity.id, activity.category, activity.subtype, activity.description, activity.value, activity.unit,
+            activity.timestamp, emission.co2_equivalent_kg if emission else None, activity.quarantined,
+        )
+
+
+class ActivityUpdateSerializer(serializers.Serializer):
+    description = serializers.CharField(max_length=255)
+
+
+class ChallengeSerializer:
+    """Challenges annotated with totals and the requesting user's progress (see api.ChallengeList)."""
+    VALUES = (
+        'id', 'title', 'description', 'goal', 'unit', 'end_date', 'community_id', 'community__name',
+        'participant_count', 'completed_count', 'my_progress', 'my_completed',
+    )
+
+    @classmethod
+    def rows(cls, values):
+        rows = []
+        for row in values:
+            goal = row['goal']
+            joined = row['my_progress'] is not None
+            rows.append({
+                'id': row['id'],
+                'title': row['title'],
+                'description': row['description'],
+                'goal': goal,
+                'unit': row['unit'],
+                'end_date': row['end_date'].isoformat(),
+                'community': {'id': row['community_id'], 'name': row['community__name']},
+                'participants': row['participant_count'],
+                'completed': row['completed_count'],
+                'joined': joined,
+                'progress': row['my_progress'] if joined else None,
+                'progress_percentage': min(round(row['my_progress'] / goal * 100), 100) if joined and goal > 0 else None,
+                'is_completed': bool(row['my_completed']) if joined else None,
+            })
+        return rows
+
+
+class LeaderboardSerializer:
+    @classmethod
+    def rows(cls, ranked):
+        """`ranked` is [(rank, leaderboard row)] from the cached leaderboard."""
+        return [
+            {
+                'rank': rank,
+                'username': row['username'],
+                'emission_kg': round(row['emission'], 2),
+                'previous_kg': round(row['previous'], 2),
+                'reduction_kg': round(row['reduction_kg'], 2),
+                'reduction_pct': row['reduction_pct'],
+            }
+            for rank, row in ranked
+        ]
+
+
+class SwapSerializer(serializers.Serializer):
+    category = serializers.ChoiceField(choices=sorted(EMISSION_FACTORS))
+    from_subtype = serializers.CharField(max_length=50)
+    to_subtype = serializers.CharField(max_length=50)
+    share = serializers.FloatField(min_value=0, max_value=1)
+
+    def validate(self, data):
+        known = EMISSION_FACTORS[data['category']]
+        for field in ('from_subtype', 'to_subtype'):
+            if data[field] not in known:
+                raise serializers.ValidationError({field: f"Unknown {data['category']} subtype; expected one of: {', '.join(sorted(known))}."})
+        return data
+
+
+class PlanSerializer(serializers.Serializer):
+    """A what-if plan submitted to the simulator (see tracker/simulator.py)."""
+    key = serializers.CharField(max_length=50)
+    label = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    swaps = SwapSerializer(many=True, allow_empty=False)
+
+    def validate_swaps(self, swaps):
+        moved = {}
+        for swap in swaps:
+            source = (swap['category'], swap['from_subtype'])
+            moved[source] = moved.get(source, 0) + swap['share']
+            if moved[source] > 1 + 1e-9:
+                raise serializers.ValidationError(f"More than all of {swap['from_subtype']} is swapped away.")
+        return swaps
+
+    @staticmethod
+    def as_plan(data):
+        """A validated plan as the simulator's (key, label, swaps) tuple."""
+        swaps = [(swap['category'], swap['from_subtype'], swap['to_subtype'], swap['share']) for swap in data['swaps']]
+        return data['key'], data.get('label') or data['key'], swaps
@@ -1,22 +1,53 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
-from .models import Profile
+from django.utils import timezone
+from .counters import record_counts
+from .live import publish_challenge
+from .models import ActivityCalendar, Challenge, ExchangeRate, Profile, UserChallenge
+from .units import reset_converter
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
     """
     Signal handler to create a Profile instance automatically
-    when a new User instance is created.
+    when a new User instance is created. An empty activity calendar is created with it,
+    so the first activity's day is counted by streaks.mark_active().
     """
     if created:
         Profile.objects.create(user=instance)
+        ActivityCalendar.objects.create(user=instance, start=timezone.localdate().replace(day=1))
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
+def count_new_user(sender, instance, created, **kwargs):
+    if created:
+        record_counts(user_count=1)
+
+@receiver(post_delete, sender=User)
+def count_deleted_user(sender, instance, **kwargs):
+    # Their activities go too; the next recount catches those up
+    record_counts(user_count=-1)
+
+@receiver([post_save, post_delete], sender=UserChallenge)
+def broadcast_challenge_progress(sender, instance, **kwargs):
+    """
+    Pushes the challenge's new totals to live feed subscribers once the change is committed.
     """
-    Signal handler to save the profile whenever the user object is saved.
-    This ensures the profile is kept in sync with the user.
+    challenge_id = instance.challenge_id
+    transaction.on_commit(lambda: publish_challenge(challenge_id))
+
+@receiver([post_save, post_delete], sender=UserChallenge)
+def touch_challenge(sender, instance, **kwargs):
+    """
+    Moves the challenge's updated_at, which versions the API's challenge list.
     """
-    instance.profile.save()
+    Challenge.objects.filter(pk=instance.challenge_id).update(updated_at=timezone.now())
 
+@receiver([post_save, post_delete], sender=ExchangeRate)
+def reload_exchange_rates(sender, **kwargs):
+    """
+    Makes the next conversion in this process use the new rates; other processes
+    pick them up within units.RATES_REFRESH_SECONDS.
+    """
+    reset_converter()
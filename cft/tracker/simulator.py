@@ -0,0 +1,154 @@
+"""
+What-if simulator for emission reduction plans.
+
+A plan is a list of swaps, each moving a share of one subtype's activity to another
+subtype in the same category, e.g. "eat vegetarian 3 days a week" moves 3/7 of red- and
+white-meat servings to vegetarian ones. Swaps are priced with the emission factor table
+(tracker/footprint.py), so a plan's saving is what the user's own logged activity would
+have emitted less.
+
+load_history() reads the user's last SIMULATION_MONTHS months in one query and reduces
+them to a (factor key x month) matrix of base-unit amounts. evaluate() turns any number
+of plans into a (plan x factor key) matrix of per-unit savings and multiplies the two,
+so ranking dozens of plans costs one small matrix product rather than a pass over the
+activities per plan. Fuel logged in litres isn't swapped: a litre doesn't say how far
+the trip was.
+"""
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .footprint import get_factor
+from .models import Activity, get_profile
+from .units import get_converter
+
+# History a simulation looks at, in 30-day months ending today.
+SIMULATION_MONTHS = 3
+MAX_SIMULATION_MONTHS = 12
+# Plans a single API request may ask for.
+MAX_PLANS = 50
+# Plans shown on the profile page.
+PROFILE_PLANS = 3
+
+# Built-in plans, ranked for the profile page and the API: (key, label, [(category, from, to, share)])
+VEGETARIAN_3_DAYS = [('food', 'red-meat', 'vegetarian', 3 / 7), ('food', 'white-meat', 'vegetarian', 3 / 7)]
+PLANS = [
+    ('train-for-car', "Take the train instead of driving", [('transport', 'car-gasoline', 'train', 1.0)]),
+    ('train-for-half-car', "Take the train for half of your car trips", [('transport', 'car-gasoline', 'train', 0.5)]),
+    ('bus-for-half-car', "Take the bus for half of your car trips", [('transport', 'car-gasoline', 'bus', 0.5)]),
+    ('cycle-one-in-five', "Cycle one car trip in five", [('transport', 'car-gasoline', 'bicycle', 0.2)]),
+    ('electric-car', "Switch to an electric car", [('transport', 'car-gasoline', 'car-electric', 1.0)]),
+    ('bus-for-motorcycle', "Take the bus instead of your motorcycle", [('transport', 'motorcycle', 'bus', 1.0)]),
+    ('train-for-short-flights', "Replace short flights with the train", [('transport', 'flight-short', 'train', 1.0)]),
+    ('white-for-red-meat', "Swap red meat for white meat", [('food', 'red-meat', 'white-meat', 1.0)]),
+    ('vegetarian-3-days', "Eat vegetarian 3 days a week", VEGETARIAN_3_DAYS),
+    ('vegetarian-weekdays', "Eat vegetarian on weekdays", [('food', 'red-meat', 'vegetarian', 5 / 7), ('food', 'white-meat', 'vegetarian', 5 / 7)]),
+    ('vegan-3-days', "Eat vegan 3 days a week", [('food', subtype, 'vegan', 3 / 7) for subtype in ('red-meat', 'white-meat', 'fish', 'vegetarian')]),
+    ('train-and-vegetarian', "Take the train instead of driving and eat vegetarian 3 days a week", [('transport', 'car-gasoline', 'train', 1.0)] + VEGETARIAN_3_DAYS),
+]
+
+History = namedtuple('History', 'months keys amounts totals')
+
+
+def load_history(user, months=SIMULATION_MONTHS, today=None):
+    """
+    The user's last `months` 30-day months as a History: `keys` are the distinct
+    (category, subtype, dimension) logged, `amounts` a keys x months array of base-unit
+    amounts and `totals` the kg CO2e per month, oldest month first.
+    """
+    today = today or date.today()
+    first_day = today - timedelta(days=months * 30 - 1)
+    rows = list(
+        Activity.objects.filter(
+            user=user,
+            quarantined=False,
+            timestamp__gte=timezone.make_aware(datetime.combine(first_day, time.min)),
+            timestamp__lt=timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min)),
+        )
+        .values_list('category', 'subtype', 'value', 'unit', 'timestamp', 'emission__co2_equivalent_kg')
+    )
+    if not rows:
+        return History(months, [], np.zeros((0, months)), np.zeros(months))
+
+    categories, subtypes, values, units, timestamps, co2 = zip(*rows)
+    converter = get_converter()
+    amounts = converter.normalize(values, units, timestamps)
+    unique_units, unit_index = np.unique(np.asarray(units, dtype=str), return_inverse=True)
+    dimensions = np.array([converter.dimension(unit) or '' for unit in unique_units], dtype=str)[unit_index]
+
+    days_ago = np.array([(today - timezone.localdate(timestamp)).days for timestamp in timestamps])
+    month_index = months - 1 - days_ago // 30
+
+    keys = np.char.add(np.char.add(np.char.add(np.char.add(np.asarray(categories, dtype=str), ':'), np.asarray(subtypes, dtype=str)), ':'), dimensions)
+    unique_keys, key_index = np.unique(keys, return_inverse=True)
+    amounts_by_month = np.bincount(key_index * months + month_index, weights=amounts, minlength=len(unique_keys) * months)
+    totals = np.bincount(month_index, weights=np.array([kg or 0 for kg in co2], dtype=np.float64), minlength=months)
+    return History(months, [tuple(key.split(':', 2)) for key in unique_keys], amounts_by_month.reshape(len(unique_keys), months), totals)
+
+
+def savings_matrix(keys, plans):
+    """kg CO2e saved per base unit of each key (columns) under each plan's swaps (rows)."""
+    columns = {}
+    for column, (category, subtype, dimension) in enumerate(keys):
+        if dimension != 'volume':
+            columns.setdefault((category, subtype), []).append((column, dimension or None))
+    matrix = np.zeros((len(plans), len(keys)))
+    for row, (_, _, swaps) in enumerate(plans):
+        for category, source, target, share in swaps:
+            for column, dimension in columns.get((category, source), ()):
+                matrix[row, column] += share * (get_factor(category, source, dimension) - get_factor(category, target, dimension))
+    return matrix
+
+
+def evaluate(history, plans, budget_kg):
+    """
+    Prices `plans` ((key, label, swaps) tuples) against a History. Returns one dict per
+    plan, largest monthly saving first.
+    """
+    savings = savings_matrix(history.keys, plans) @ history.amounts  # plans x months
+    projected = np.maximum(history.totals - savings, 0)
+    baseline = history.totals.mean()
+    results = []
+    for row, (key, label, swaps) in enumerate(plans):
+        monthly_saving = float(savings[row].mean())
+        results.append({
+            'key': key,
+            'label': label,
+            'swaps': [
+                {'category': category, 'from_subtype': source, 'to_subtype': target, 'share': round(share, 4)}
+                for category, source, target, share in swaps
+            ],
+            'monthly_saving_kg': round(monthly_saving, 2),
+            'saving_percentage': round(monthly_saving / baseline * 100, 1) if baseline > 0 else 0.0,
+            'projected_monthly_kg': round(float(projected[row].mean()), 2),
+            'budget_percentage': round(float(projected[row].mean()) / budget_kg * 100) if budget_kg > 0 else None,
+            'months_over_budget': int((projected[row] > budget_kg).sum()) if budget_kg > 0 else None,
+            'monthly_savings_kg': [round(float(kg), 2) for kg in savings[row]],
+        })
+    results.sort(key=lambda result: -result['monthly_saving_kg'])
+    return results
+
+
+def simulate(user, plans=PLANS, months=SIMULATION_MONTHS, today=None):
+    """The user's baseline over the last `months` months and `plans` ranked against it."""
+    history = load_history(user, months, today)
+    budget_kg = get_profile(user).carbon_budget_kg
+    baseline = float(history.totals.mean())
+    return {
+        'months': months,
+        'baseline': {
+            'monthly_kg': round(baseline, 2),
+            'budget_kg': budget_kg,
+            'budget_percentage': round(baseline / budget_kg * 100) if budget_kg > 0 else None,
+            'months_over_budget': int((history.totals > budget_kg).sum()) if budget_kg > 0 else None,
+        },
+        'plans': evaluate(history, plans, budget_kg),
+    }
+
+
+def plans_for_display(user, limit=PROFILE_PLANS):
+    """The built-in plans that would save the user the most, in the shape the profile page expects."""
+    result = simulate(user)
+    return [plan for plan in result['plans'] if plan['monthly_saving_kg'] >= 0.5][:limit]
@@ -0,0 +1,471 @@
+"""
+Bill and bank statement import.
+
+An upload becomes a StatementImport; import_statement() streams the file line by line
+(CSV rows, or the text of each PDF page), turns each line into a ParsedLine and writes
+activities IMPORT_BATCH_SIZE at a time:
+
+- Bank and card statements: money going out is classified into a category and subtype
+  by keyword (CLASSIFICATION_RULES, compiled once into a word index plus one phrase
+  regex). Credits, transfers and utility bill payments are skipped; the bill itself
+  is imported as energy instead.
+- Electricity bills: each CSV row, or the "units consumed" line of a PDF bill, becomes
+  an energy activity in kWh.
+
+A line is a duplicate when the user already has an activity with the same date and
+value, the (user, date, amount) key, so uploading the same statement twice imports
+nothing the second time. Small files are imported during the upload request and larger
+ones on a background thread, with progress saved to the StatementImport after each batch.
+"""
+import csv
+import hashlib
+import io
+import logging
+import re
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dt_time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .anomalies import screen
+from .archive import archive_cutoff
+from .counters import record_counts
+from .dedupe import activity_hash, bulk_create_activities
+from .footprint import calculate_footprints
+from .models import Activity, StatementImport
+from .streaks import mark_active
+from .summary import rebuild_totals
+from .units import CATEGORY_UNITS, get_converter, normalize_unit
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+# How many rows at the top of a CSV may come before its header (account details etc.)
+MAX_PREAMBLE_ROWS = 50
+
+ParsedLine = namedtuple('ParsedLine', 'day description amount unit category subtype')
+
+
+class StatementError(Exception):
+    """The upload can't be read as the kind of statement it claims to be."""
+
+
+# --- Classification ---
+
+# (category, subtype, keywords). Earlier rules win when a description matches several.
+CLASSIFICATION_RULES = [
+    ('transport', 'fuel', ['petrol', 'diesel', 'fuel', 'indian oil', 'iocl', 'hpcl', 'bpcl', 'shell', 'filling station']),
+    ('transport', 'taxi', ['uber', 'ola', 'rapido', 'taxi', 'cab', 'cabs']),
+    ('transport', 'flight', ['indigo', 'air india', 'vistara', 'spicejet', 'akasa', 'airline', 'airlines', 'airways']),
+    ('transport', 'train', ['irctc', 'railway', 'railways']),
+    ('transport', 'public-transport', ['metro', 'bus', 'bmtc', 'dtc', 'redbus']),
+    ('food', 'groceries', ['bigbasket', 'blinkit', 'zepto', 'dmart', 'grocery', 'groceries', 'supermarket', 'more retail', "nature's basket"]),
+    ('food', 'dining', ['swiggy', 'zomato', 'restaurant', 'cafe', 'starbucks', 'dominos', 'mcdonald', 'kfc', 'pizza']),
+    ('consumption', 'electronics', ['croma', 'reliance digital', 'vijay sales', 'apple', 'samsung', 'electronics']),
+    ('consumption', 'clothing', ['myntra', 'ajio', 'zara', 'h&m', 'pantaloons', 'westside', 'uniqlo', 'clothing', 'apparel']),
+    ('consumption', 'home-goods', ['ikea', 'pepperfry', 'urban ladder', 'home centre', 'furniture']),
+    ('consumption', 'services', ['netflix', 'spotify', 'hotstar', 'prime video', 'salon', 'insurance', 'gym']),
+]
+# Money that isn't spending on goods or services, or that's covered by an imported bill.
+SKIP_KEYWORDS = [
+    'salary', 'refund', 'reversal', 'cashback', 'neft', 'imps', 'rtgs', 'transfer', 'atm', 'cash withdrawal',
+    'interest', 'emi', 'loan', 'credit card payment', 'electricity', 'bescom', 'msedcl', 'bses', 'tneb',
+    'kseb', 'tata power', 'adani electricity', 'torrent power',
+]
+TOKEN_RE = re.compile(r'[a-z0-9&]+')
+
+
+class KeywordIndex:
+    """
+    Finds the rule for a description: phrases through one compiled alternation,
+    single words through a dict lookup per token.
+    """
+
+    def __init__(self, rules):
+        self.words = {}
+        self.phrases = {}
+        for value, keywords in rules:
+            for keyword in keywords:
+                target = self.phrases if ' ' in keyword else self.words
+                target.setdefault(keyword, value)
+        alternation = '|'.join(re.escape(phrase) for phrase in sorted(self.phrases, key=len, reverse=True))
+        self.phrase_re = re.compile(rf'\b(?:{alternation})\b') if self.phrases else None
+
+    def lookup(self, text):
+        text = text.lower()
+        if self.phrase_re:
+            match = self.phrase_re.search(text)
+            if match:
+                return self.phrases[match.group(0)]
+        for token in TOKEN_RE.findall(text):
+            if token in self.words:
+                return self.words[token]
+        return None
+
+
+CLASSIFIER = KeywordIndex([((category, subtype), keywords) for category, subtype, keywords in CLASSIFICATION_RULES])
+SKIP_INDEX = KeywordIndex([(True, SKIP_KEYWORDS)])
+
+
+def classify(description):
+    """(category, subtype) for a statement line, or None if it isn't spending to import."""
+    rule = CLASSIFIER.lookup(description)
+    if rule:
+        return rule
+    if SKIP_INDEX.lookup(description):
+        return None
+    return ('consumption', 'other')
+
+
+# --- Parsing ---
+
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%m-%y', '%d %b %Y', '%d-%b-%Y', '%d %b %y', '%d-%b-%y', '%b %d, %Y']
+AMOUNT_JUNK_RE = re.compile(r'[^\d.\-]')
+# "01/02/2025  SWIGGY BANGALORE  450.00 Dr  12,000.00 Cr": date, description, amount, optional Dr/Cr and balance
+TEXT_LINE_RE = re.compile(
+    r'^\s*(?P<date>\d{4}-\d{2}-\d{2}|\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{1,2}[ -][A-Za-z]{3}[ -]\d{2,4})\s+'
+    r'(?P<description>.+?)\s+(?P<amount>\(?-?[\d,]+\.\d{2}\)?)\s*(?P<drcr>Dr|Cr|DR|CR)?'
+    r'(?:\s+[\d,]+\.\d{2}\s*(?:Dr|Cr|DR|CR)?)?\s*$'
+)
+BILL_DATE_RE = re.compile(r'(?:bill|billing|invoice|reading)\s*date\W*(?P<date>\d[\d/\-]+\d|\d{1,2}[ -][A-Za-z]{3}[ -]\d{2,4})', re.IGNORECASE)
+BILL_UNITS_RE = re.compile(r'(?:units?\s*consumed|total\s*units|energy\s*consumed|consumption)\D{0,20}?(?P<units>\d[\d,]*(?:\.\d+)?)', re.IGNORECASE)
+
+# Header names (lowercased words) that identify each CSV column
+COLUMN_WORDS = {
+    'date': {'date'},
+    'description': {'description', 'narration', 'details', 'particulars', 'merchant', 'remarks', 'payee'},
+    'debit': {'debit', 'withdrawal', 'withdrawals'},
+    'credit': {'credit', 'deposit', 'deposits'},
+    'amount': {'amount'},
+    'type': {'type', 'dr/cr', 'cr/dr'},
+    'currency': {'currency'},
+    'units': {'units', 'kwh', 'consumption'},
+}
+
+
+class DateParser:
+    """Tries the known date formats, starting with whichever one matched last."""
+
+    def __init__(self):
+        self.formats = list(DATE_FORMATS)
+
+    def __call__(self, text):
+        text = (text or '').strip()
+        for i, fmt in enumerate(self.formats):
+            try:
+                parsed = datetime.strptime(text, fmt).date()
+            except ValueError:
+                continue
+            if i:
+                self.formats.insert(0, self.formats.pop(i))
+            return parsed
+        return None
+
+
+def parse_amount(text):
+    """450.00, "1,200.50", "(30.00)" or "₹99" as a float; None if there's no number."""
+    text = (text or '').strip()
+    negative = text.startswith('(') and text.endswith(')')
+    cleaned = AMOUNT_JUNK_RE.sub('', text)
+    if not cleaned or cleaned in {'-', '.'}:
+        return None
+    try:
+        value = float(cleaned)
+    except ValueError:
+        return None
+    return -value if negative else value
+
+
+def _find_columns(rows, needed):
+    """Reads past any preamble to the header row; returns {role: column index}."""
+    for _, header in zip(range(MAX_PREAMBLE_ROWS), rows):
+        columns = {}
+        for index, name in enumerate(header):
+            words = set(re.findall(r'[a-z/]+', name.lower()))
+            for role, role_words in COLUMN_WORDS.items():
+                if role not in columns and words & role_words:
+                    columns[role] = index
+                    break
+        if 'date' in columns and any(role in columns for role in needed):
+            return columns
+    raise StatementError(f"Couldn't find a header row with a date and one of: {', '.join(needed)}.")
+
+
+def _cell(row, columns, role):
+    index = columns.get(role)
+    return row[index] if index is not None and index < len(row) else ''
+
+
+def _spending_line(day, description, amount, currency):
+    """A ParsedLine for money out, or None if the line shouldn't be imported."""
+    if day is None or amount is None or amount <= 0:
+        return None
+    rule = classify(description)
+    if rule is None:
+        return None
+    return ParsedLine(day, description.strip(), round(amount, 2), currency, *rule)
+
+
+def parse_bank_csv(lines, stats, currency):
+    rows = csv.reader(lines)
+    columns = _find_columns(rows, ['debit', 'amount'])
+    parse_date = DateParser()
+    for row in rows:
+        stats['lines'] += 1
+        if 'debit' in columns:
+            amount = parse_amount(_cell(row, columns, 'debit'))
+        else:
+            # A single signed column: positive is spending unless a type column says otherwise,
+            # negative amounts are payments and refunds
+            amount = parse_amount(_cell(row, columns, 'amount'))
+            if _cell(row, columns, 'type').strip().lower() in {'cr', 'credit'}:
+                amount = None
+        row_currency = normalize_unit('consumption', _cell(row, columns, 'currency')) if 'currency' in columns else currency
+        line = _spending_line(parse_date(_cell(row, columns, 'date')), _cell(row, columns, 'description'), amount, row_currency)
+        if line is None:
+            stats['skipped'] += 1
+            continue
+        yield line
+
+
+def parse_bank_text(lines, stats, currency):
+    parse_date = DateParser()
+    for text in lines:
+        match = TEXT_LINE_RE.match(text)
+        if not match:
+            # Headers, page footers and wrapped descriptions
+            continue
+        stats['lines'] += 1
+        amount = parse_amount(match.group('amount'))
+        if (match.group('drcr') or '').lower() == 'cr':
+            amount = None
+        line = _spending_line(parse_date(match.group('date')), match.group('description'), amount, currency)
+        if line is None:
+            stats['skipped'] += 1
+            continue
+        yield line
+
+
+def _bill_line(day, units):
+    return ParsedLine(day, 'Electricity Bill', round(units, 2), 'kWh', 'energy', 'electricity')
+
+
+def parse_electricity_csv(lines, stats, currency):
+    rows = csv.reader(lines)
+    columns = _find_columns(rows, ['units'])
+    parse_date = DateParser()
+    for row in rows:
+        stats['lines'] += 1
+        day = parse_date(_cell(row, columns, 'date'))
+        units = parse_amount(_cell(row, columns, 'units'))
+        if day is None or not units or units <= 0:
+            stats['skipped'] += 1
+            continue
+        yield _bill_line(day, units)
+
+
+def parse_electricity_text(lines, stats, currency):
+    parse_date = DateParser()
+    day = units = None
+    for text in lines:
+        stats['lines'] += 1
+        if day is None and (match := BILL_DATE_RE.search(text)):
+            day = parse_date(match.group('date'))
+        if units is None and (match := BILL_UNITS_RE.search(text)):
+            units = parse_amount(match.group('units'))
+    if not units:
+        raise StatementError("Couldn't find the units consumed on this bill.")
+    # Dating it to the upload day would put a month's usage on one day
+    if day is None:
+        raise StatementError("Couldn't find the billing date on this bill.")
+    yield _bill_line(day, units)
+
+
+PARSERS = {
+    ('bank', 'csv'): parse_bank_csv,
+    ('bank', 'text'): parse_bank_text,
+    ('electricity', 'csv'): parse_electricity_csv,
+    ('electricity', 'text'): parse_electricity_text,
+}
+
+
+class LineSource:
+    """The text lines of an uploaded file, tracking roughly how many bytes have been read."""
+
+    def __init__(self, binary, name, size):
+        self.binary = binary
+        self.size = size
+        self.position = 0
+        extension = name.lower().rsplit('.', 1)[-1]
+        self.is_pdf = extension == 'pdf'
+        self.format = 'csv' if extension == 'csv' else 'text'
+
+    def __iter__(self):
+        if self.is_pdf:
+            yield from self._pdf_lines()
+            return
+        text = io.TextIOWrapper(self.binary, encoding='utf-8-sig', errors='replace', newline='')
+        for line in text:
+            self.position = self.binary.tell()
+            yield line
+
+    def _pdf_lines(self):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise StatementError("Reading PDF statements needs the pypdf package (pip install pypdf).")
+        pages = PdfReader(self.binary).pages
+        for number, page in enumerate(pages, start=1):
+            yield from (page.extract_text() or '').splitlines()
+            self.position = self.size * number // len(pages)
+
+
+# --- Writing ---
+
+PREFIXES = {'transport': 'Travel', 'energy': 'Energy', 'food': 'Food', 'consumption': 'Purchase'}
+
+
+def dedupe_key(user_id, day, amount):
+    """Identifies an activity by (user, date, amount), the way a statement line would."""
+    return hashlib.blake2b(f"{user_id}|{day.isoformat()}|{amount:.2f}".encode(), digest_size=8).hexdigest()
+
+
+def describe(line):
+    """Same shape as the activity form's descriptions, so parse_subtype still works, plus the merchant."""
+    amount = f"₹{line.amount:,.2f}" if line.unit == 'INR' else f"{line.amount:,.2f} {line.unit}"
+    description = f"{PREFIXES[line.category]}: {line.subtype.replace('-', ' ').title()} - {amount}"
+    if line.description and line.category != 'energy':
+        description += f" ({line.description[:120]})"
+    return description
+
+
+def write_batch(user, lines):
+    """Inserts the lines that aren't already activities. Returns (imported, duplicates)."""
+    user_id = user.pk
+    days = [line.day for line in lines]
+    existing = Counter(
+        dedupe_key(user_id, timezone.localdate(timestamp), value)
+        for timestamp, value in Activity.objects.filter(
+            user_id=user_id, timestamp__date__range=(min(days), max(days)),
+        ).values_list('timestamp', 'value')
+    )
+    # Repeats of a key this statement adds on top of the existing ones, numbered so
+    # their content hashes differ
+    occurrences = Counter(existing)
+    fresh = []
+    for line in lines:
+        key = dedupe_key(user_id, line.day, line.amount)
+        # Each existing activity absorbs one matching line, so genuine repeats within
+        # a new statement (two identical coffees) are still imported
+        if existing[key]:
+            existing[key] -= 1
+        else:
+            fresh.append((line, occurrences[key]))
+            occurrences[key] += 1
+    if not fresh:
+        return 0, len(lines)
+
+    footprints = calculate_footprints(
+        [line.category for line, _ in fresh], [line.subtype for line, _ in fresh],
+        [line.amount for line, _ in fresh], [line.unit for line, _ in fresh], [line.day for line, _ in fresh],
+    )
+    noon = dt_time(12)
+    activities = []
+    for line, occurrence in fresh:
+        activity = Activity(
+            user_id=user_id, category=line.category, subtype=line.subtype, description=describe(line)[:255],
+            value=line.amount, unit=line.unit, timestamp=timezone.make_aware(datetime.combine(line.day, noon)),
+        )
+        activity.content_hash = activity_hash(activity, occurrence)
+        activities.append(activity)
+    # A concurrent import of the same statement can't double up: its rows hit the unique index
+    with transaction.atomic():
+        inserted = bulk_create_activities(activities, footprints)
+        # A misread amount (an extra zero) is kept out of the totals until confirmed
+        quarantined = screen(inserted)
+    if inserted:
+        kg = dict(zip((activity.content_hash for activity in activities), footprints))
+        new_days = mark_active(user, *(activity.timestamp for activity in inserted))
+        record_counts(
+            activity_count=len(inserted), active_user_days=new_days,
+            co2_logged_kg=float(sum(kg[a.content_hash] for a in inserted if a.pk not in quarantined)),
+        )
+    return len(inserted), len(lines) - len(inserted)
+
+
+def _save_progress(statement, source, stats, **extra):
+    StatementImport.objects.filter(pk=statement.pk).update(
+        bytes_processed=source.position if source else 0,
+        lines_read=stats['lines'], imported=stats['imported'], duplicates=stats['duplicates'], skipped=stats['skipped'],
+        **extra,
+    )
+
+
+def import_statement(statement, batch_size=IMPORT_BATCH_SIZE):
+    """Parses and imports one StatementImport, saving progress as it goes. Returns the stats."""
+    stats = Counter()
+    source = None
+    StatementImport.objects.filter(pk=statement.pk).update(status='processing', error='')
+    try:
+        try:
+            currency = CATEGORY_UNITS['consumption']
+            converter = get_converter()
+            cutoff = archive_cutoff()
+            with statement.file.open('rb') as binary:
+                source = LineSource(binary, statement.original_name, statement.bytes_total)
+                parse = PARSERS[(statement.kind, source.format)]
+                batch = []
+                for line in parse(source, stats, currency):
+                    # Archived months are closed: their lines can't be checked for duplicates
+                    if not converter.accepts(line.category, line.unit) or line.day < cutoff:
+                        stats['skipped'] += 1
+                        continue
+                    batch.append(line)
+                    if len(batch) >= batch_size:
+                        imported, duplicates = write_batch(statement.user, batch)
+                        stats.update(imported=imported, duplicates=duplicates)
+                        batch = []
+                        _save_progress(statement, source, stats)
+                if batch:
+                    imported, duplicates = write_batch(statement.user, batch)
+                    stats.update(imported=imported, duplicates=duplicates)
+        finally:
+            # Bulk inserts bypass the write-through totals, so rebuild them once at the end,
+            # also when a later batch failed: the earlier ones are already saved
+            if stats['imported']:
+                rebuild_totals([statement.user_id])
+        _save_progress(statement, source, stats, status='done', finished_at=timezone.now())
+    except Exception as error:
+        if not isinstance(error, (StatementError, csv.Error, UnicodeError)):
+            logger.exception("Importing statement %s failed", statement.pk)
+        _save_progress(statement, source, stats, status='failed', error=str(error)[:1000], finished_at=timezone.now())
+    return stats
+
+
+# --- Scheduling ---
+
+_executor = None
+
+
+def _run_in_background(statement_id):
+    close_old_connections()
+    try:
+        statement = StatementImport.objects.select_related('user').get(pk=statement_id)
+        import_statement(statement)
+    finally:
+        # This thread's connection isn't managed by a request cycle
+        connection.close()
+
+
+def schedule_import(statement):
+    """Imports small uploads right away and queues larger ones on a background thread."""
+    global _executor
+    if statement.bytes_total <= settings.STATEMENT_INLINE_MAX_BYTES:
+        return import_statement(statement)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.STATEMENT_IMPORT_WORKERS, thread_name_prefix='statement-import')
+    transaction.on_commit(lambda: _executor.submit(_run_in_background, statement.pk))
+    return None
@@ -0,0 +1,169 @@
+"""
+Activity-day calendars and streaks.
+
+Each user has one ActivityCalendar: a bitmap with one bit per day, bit n standing for
+`start` + n days, set when the user logged at least one activity that day (archived
+months included). Activity writes keep it current: mark_active() sets a day's bit,
+clear_if_inactive() clears it once the day's last activity is gone. New users get an
+empty calendar when they sign up (signals.create_profile); for older users one is built
+from the activity and archive tables the first time it's read.
+
+Totals, streaks and calendar windows are bit operations on the bitmap as one integer,
+so they cost the same for a user with a week of history and one with ten years. The
+streak chart gets window() - the requested range only, base64-encoded, eight days per
+byte - rather than a list of every active date.
+"""
+import base64
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .archive import active_days
+from .models import Activity, ActivityCalendar, ArchivedMonth
+
+# Days shown by the streak chart on the profile page (20 weeks)
+STREAK_CHART_DAYS = 140
+
+
+def _day_of(when):
+    if isinstance(when, datetime):
+        return timezone.localdate(when) if timezone.is_aware(when) else when.date()
+    return when
+
+
+def to_int(data):
+    return int.from_bytes(bytes(data), 'little')
+
+
+def to_bytes(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def _store(user, calendar, start, bits):
+    calendar.start, calendar.days = start, to_bytes(bits)
+    calendar.save()
+    # Keeps the copy cached on request.user current for the rest of the request
+    user.activity_calendar = calendar
+
+
+def build_calendar(user):
+    """(Re)builds the user's calendar from the activity and archive tables."""
+    days = active_days(user)
+    start = days[0].replace(day=1) if days else date.today().replace(day=1)
+    bits = 0
+    for day in days:
+        bits |= 1 << (day - start).days
+    calendar, _ = ActivityCalendar.objects.update_or_create(user=user, defaults={'start': start, 'days': to_bytes(bits)})
+    user.activity_calendar = calendar
+    return calendar
+
+
+def get_calendar(user):
+    """The user's calendar, built on first use. Cached on the user object for the request."""
+    try:
+        return user.activity_calendar
+    except ActivityCalendar.DoesNotExist:
+        return build_calendar(user)
+
+
+def mark_active(user, *whens):
+    """
+    Marks the days of the given timestamps as active. Returns how many of them weren't
+    already. Call after the activities are saved, inside the transaction that saved them.
+    """
+    days = {_day_of(when) for when in whens}
+    with transaction.atomic():
+        calendar = ActivityCalendar.objects.select_for_update().filter(pk=user.pk).first()
+        if calendar is None:
+            # Users from before calendars existed: the fresh one already includes the new
+            # activities. Their days count as new; a day that also had older activities is
+            # counted twice until the nightly recount.
+            calendar = build_calendar(user)
+            bits = to_int(calendar.days)
+            return sum(1 for day in days if bits >> (day - calendar.start).days & 1)
+        start, bits = calendar.start, to_int(calendar.days)
+        earliest = min(days)
+        if earliest < start:
+            new_start = earliest.replace(day=1)
+            bits <<= (start - new_start).days
+            start = new_start
+        before = bits
+        for day in days:
+            bits |= 1 << (day - start).days
+        if bits != before:
+            _store(user, calendar, start, bits)
+        return bits.bit_count() - before.bit_count()
+
+
+def clear_if_inactive(user, when):
+    """
+    Clears the day of `when` if the user has no activity left on it. Returns True if it
+    was cleared. Call after the activity is deleted, inside the same transaction.
+    """
+    day = _day_of(when)
+    start_of_day = timezone.make_aware(datetime.combine(day, time.min))
+    if Activity.objects.filter(user=user, timestamp__gte=start_of_day, timestamp__lt=start_of_day + timedelta(days=1)).exists():
+        return False
+    archived = ArchivedMonth.objects.filter(user=user, month=day.replace(day=1)).values_list('active_days', flat=True)
+    if any(bits >> (day.day - 1) & 1 for bits in archived):
+        return False
+    with transaction.atomic():
+        calendar = ActivityCalendar.objects.select_for_update().filter(pk=user.pk).first()
+        if calendar is None:
+            build_calendar(user)
+            return False
+        offset = (day - calendar.start).days
+        bits = to_int(calendar.days)
+        if offset < 0 or not bits >> offset & 1:
+            return False
+        _store(user, calendar, calendar.start, bits & ~(1 << offset))
+        return True
+
+
+# --- Reading ---
+
+def longest_run(bits):
+    """Length of the longest run of set bits: each `bits &= bits >> 1` shortens every run by one."""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+def current_run(bits, offset):
+    """Length of the run of set bits ending at bit `offset` (0 if that bit is clear)."""
+    if offset < 0:
+        return 0
+    # Invert the days up to `offset` and find the highest clear day below it
+    below = ~bits & ((1 << (offset + 1)) - 1)
+    return offset - below.bit_length() + 1
+
+
+def streak_stats(user, today=None):
+    """{'total_active', 'max_streak', 'current_streak'}; the current streak may end today or yesterday."""
+    today = today or date.today()
+    calendar = get_calendar(user)
+    bits = to_int(calendar.days)
+    offset = (today - calendar.start).days
+    return {
+        'total_active': bits.bit_count(),
+        'max_streak': longest_run(bits),
+        'current_streak': current_run(bits, offset) or current_run(bits, offset - 1),
+    }
+
+
+def window(user, first, last):
+    """
+    The active days from `first` to `last` inclusive, as {'start', 'days', 'bitmap'}:
+    bit n of the base64 bitmap (little-endian, eight days per byte) is `first` + n days.
+    """
+    calendar = get_calendar(user)
+    bits = to_int(calendar.days)
+    shift = (first - calendar.start).days
+    bits = bits >> shift if shift >= 0 else bits << -shift
+    length = (last - first).days + 1
+    bits &= (1 << length) - 1
+    data = bits.to_bytes((length + 7) // 8, 'little')
+    return {'start': first.isoformat(), 'days': length, 'bitmap': base64.b64encode(data).decode()}
@@ -0,0 +1,172 @@
+"""
+Write-through dashboard totals.
+
+Each user has one DashboardSummary row holding today's, yesterday's, this month's and
+last month's emissions plus this month's per-category totals. Every activity create,
+update or delete adjusts it with F() expressions in the same transaction, so the
+activity page reads its stats with a single primary-key lookup instead of re-aggregating.
+
+Day and month boundaries are handled lazily: a summary last touched on an earlier day is
+rolled forward (today -> yesterday, month -> last month) the next time it is read.
+Paths that write activities in bulk should call rebuild_summary() (or rebuild_totals()
+for many users) afterwards.
+"""
+import calendar
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .forecast import budget_projection, forecast_users, record_emission_change, save_forecasts
+from .models import Activity, DashboardSummary, Emission, User, get_profile
+
+CATEGORY_FIELDS = {category: f'{category}_month_kg' for category, _ in Activity.ACTIVITY_CATEGORIES}
+
+
+def _month_bounds(today):
+    month_start = today.replace(day=1)
+    last_month_start = (month_start - timedelta(days=1)).replace(day=1)
+    return month_start, last_month_start
+
+
+def rebuild_summary(user, today=None):
+    """Recomputes the user's summary exactly, in one conditional-aggregate query."""
+    today = today or date.today()
+    month_start, last_month_start = _month_bounds(today)
+    on_date = 'activity__timestamp__date'
+    this_month = Q(**{f'{on_date}__gte': month_start})
+    totals = Emission.objects.filter(activity__user=user, activity__quarantined=False, **{f'{on_date}__gte': last_month_start}).aggregate(
+        today_kg=Sum('co2_equivalent_kg', filter=Q(**{on_date: today})),
+        yesterday_kg=Sum('co2_equivalent_kg', filter=Q(**{on_date: today - timedelta(days=1)})),
+        month_kg=Sum('co2_equivalent_kg', filter=this_month),
+        last_month_kg=Sum('co2_equivalent_kg', filter=Q(**{f'{on_date}__lt': month_start})),
+        **{
+            field: Sum('co2_equivalent_kg', filter=this_month & Q(activity__category=category))
+            for category, field in CATEGORY_FIELDS.items()
+        },
+    )
+    summary, _ = DashboardSummary.objects.update_or_create(
+        user=user,
+        defaults={'day': today, 'month': month_start, **{key: value or 0 for key, value in totals.items()}},
+    )
+    return summary
+
+
+def rebuild_totals(user_ids, today=None):
+    """Rebuilds the summaries and forecasts of users whose activities were changed in bulk."""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return
+    for user in User.objects.filter(id__in=user_ids):
+        rebuild_summary(user, today)
+    save_forecasts(forecast_users(user_ids, today), today)
+
+
+def _roll_forward(summary, today):
+    """Moves stale buckets along to today's date. Returns True if anything changed."""
+    month_start, last_month_start = _month_bounds(today)
+    changed = False
+    if summary.month != month_start:
+        summary.last_month_kg = summary.month_kg if summary.month == last_month_start else 0
+        summary.month_kg = 0
+        for field in CATEGORY_FIELDS.values():
+            setattr(summary, field, 0)
+        summary.month = month_start
+        changed = True
+    if summary.day != today:
+        summary.yesterday_kg = summary.today_kg if summary.day == today - timedelta(days=1) else 0
+        summary.today_kg = 0
+        summary.day = today
+        changed = True
+    return changed
+
+
+def get_summary(user, today=None, for_update=False):
+    """
+    The user's summary, current as of today. Returns (summary, created); a newly
+    created summary was built from the activity table and already includes every row.
+    """
+    today = today or date.today()
+    queryset = DashboardSummary.objects.select_for_update() if for_update else DashboardSummary.objects
+    summary = queryset.filter(pk=user.pk).first()
+    if summary is None:
+        return rebuild_summary(user, today), True
+    if _roll_forward(summary, today):
+        summary.save()
+    return summary, False
+
+
+def record_activity_change(user, category, when, delta_kg, today=None):
+    """
+    Applies an emission change (positive for new/increased, negative for removed/decreased)
+    to the user's running totals and forecast. Call inside the transaction that made the change.
+    """
+    today = today or date.today()
+    if delta_kg:
+        day = timezone.localdate(when) if timezone.is_aware(when) else when.date()
+        month_start, last_month_start = _month_bounds(today)
+        with transaction.atomic():
+            summary, created = get_summary(user, today, for_update=True)
+            if not created:
+                updates = {}
+                if day == today:
+                    updates['today_kg'] = F('today_kg') + delta_kg
+                elif day == today - timedelta(days=1):
+                    updates['yesterday_kg'] = F('yesterday_kg') + delta_kg
+                if day >= month_start:
+                    updates['month_kg'] = F('month_kg') + delta_kg
+                    if category in CATEGORY_FIELDS:
+                        updates[CATEGORY_FIELDS[category]] = F(CATEGORY_FIELDS[category]) + delta_kg
+                elif day >= last_month_start:
+                    updates['last_month_kg'] = F('last_month_kg') + delta_kg
+                if updates:
+                    # .update() skips auto_now, and updated_at backs the stats endpoint's ETag
+                    DashboardSummary.objects.filter(pk=summary.pk).update(updated_at=timezone.now(), **updates)
+    else:
+        # The totals stand, but the activity itself changed; API ETags are built from updated_at too
+        DashboardSummary.objects.filter(pk=user.pk).update(updated_at=timezone.now())
+    record_emission_change(user, when, delta_kg, today)
+
+
+def dashboard_stats(user, today=None, summary=None):
+    """
+    Emission stats and budget bars for the activity page, built from the summary row.
+    Shared by the page render, the AJAX write responses and the polling endpoint.
+    """
+    today = today or date.today()
+    if summary is None:
+        summary, _ = get_summary(user, today)
+
+    # The monthly limit is the user's own budget, spread evenly over the days of the month for the daily one
+    monthly_limit = get_profile(user).carbon_budget_kg
+    daily_limit = round(monthly_limit / calendar.monthrange(today.year, today.month)[1], 1)
+    daily_budget_percentage = round((summary.today_kg / daily_limit) * 100) if daily_limit > 0 else 0
+    monthly_budget_percentage = round((summary.month_kg / monthly_limit) * 100) if monthly_limit > 0 else 0
+
+    return {
+        'emission_stats': {
+            'today': round(summary.today_kg, 2),
+            'yesterday': round(summary.yesterday_kg, 2),
+            'this_month': round(summary.month_kg, 2),
+            'last_month': round(summary.last_month_kg, 2),
+        },
+        'daily_budget': {
+            'used': round(summary.today_kg, 2),
+            'limit': daily_limit,
+            'percentage': min(daily_budget_percentage, 100) # Cap at 100% for visual
+        },
+        'monthly_budget': {
+            'used': round(summary.month_kg, 2),
+            'limit': monthly_limit,
+            'percentage': min(monthly_budget_percentage, 100) # Cap at 100% for visual
+        },
+        'budget_projection': budget_projection(user, monthly_limit, today),
+    }
+
+
+def stats_etag(user, today=None):
+    """Changes whenever anything shown by dashboard_stats could have changed."""
+    today = today or date.today()
+    summary, _ = get_summary(user, today)
+    return f"{user.pk}-{today.isoformat()}-{summary.updated_at.timestamp()}-{get_profile(user).carbon_budget_kg}"
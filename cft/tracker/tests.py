@@ -1,3 +1,1135 @@
-from django.test import TestCase
+import base64
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.template.backends.django import Template as DjangoTemplate
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .archive import archive_users, archived_rows, monthly_totals
+from .cache import cache_anonymous_page, get_or_recompute
+from .counters import COUNTER_FIELDS, platform_stats, recount
+from .db_router import REPLICA_ALIAS, ReplicaRouter, read_from_replica
+from .dedupe import activity_hash, bulk_create_activities, create_activity
+from .forecast import HISTORY_DAYS, budget_projection, forecast_users
+from .insights import FRAME_COLUMNS, build_insights, users_needing_insights
+from .management.commands.benchmark import CALLABLES, PAGES
+from .middleware import PerformanceMiddleware
+from .models import Activity, ActivityBaseline, ArchivedMonth, Challenge, Community, DashboardSummary, Emission, EmissionForecast, ExchangeRate, PlatformCounters, Profile, StatementImport, UserChallenge
+from .profiling import read_index
+from .serializers import ActivitySerializer
+from .simulator import PLANS, load_history, simulate
+from .statements import StatementError, _run_in_background, import_statement, parse_bank_csv, parse_bank_text, parse_electricity_text, schedule_import, write_batch
+from .summary import CATEGORY_FIELDS, get_summary, rebuild_summary, record_activity_change
+from .streaks import clear_if_inactive, current_run, longest_run, mark_active, streak_stats, window
+from .units import Converter, convert, get_converter, normalize_unit, reset_converter
+from .views import cached_leaderboard_data, compute_leaderboard_data
+
+
+class ProfileQueryTests(TestCase):
+    """Profiles are created once; logins and profile page views don't write to them."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ana', 'ana@example.com', 'pass-1234-word')
+
+    def assertNoProfileWrites(self, queries):
+        writes = [q['sql'] for q in queries if 'tracker_profile' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(writes, [])
+
+    def test_profile_created_with_user(self):
+        self.assertEqual(Profile.objects.filter(user=self.user).count(), 1)
+
+    def test_login_queries(self):
+        # User lookup, session insert (with savepoint), last_login update, session update (with savepoint)
+        with self.assertNumQueries(9) as ctx:
+            response = self.client.post(reverse('login'), {'username': 'ana', 'password': 'pass-1234-word'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(any('tracker_profile' in q['sql'] for q in ctx.captured_queries))
+
+    def test_myprofile_get_queries(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('myprofile'))  # warms the leaderboard cache
+        # includes the what-if plans' one activity read
+        with self.assertNumQueries(11) as ctx:
+            response = self.client.get(reverse('myprofile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum('tracker_profile' in q['sql'] for q in ctx.captured_queries), 1)
+        self.assertNoProfileWrites(ctx.captured_queries)
+
+    def test_missing_profile_created_lazily(self):
+        Profile.objects.filter(user=self.user).delete()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('myprofile')).status_code, 200)
+        self.assertEqual(Profile.objects.filter(user=self.user).count(), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('myprofile'))
+        self.assertNoProfileWrites(ctx.captured_queries)
+
+
+
+class UnitTests(TestCase):
+    def test_meter_units_only_mean_kwh_for_energy(self):
+        self.assertEqual(normalize_unit('energy', ' Units'), 'kWh')
+        self.assertEqual(normalize_unit('food', 'units'), 'units')
+        self.assertEqual(normalize_unit('consumption', 'rs'), 'INR')
+        serializer = ActivitySerializer(data={'category': 'food', 'subtype': 'vegan', 'value': 2, 'unit': 'units'})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("'units'", str(serializer.errors['unit']))
+
+
+    def test_physical_units_convert_to_base_units(self):
+        converter = Converter([])
+        normalized = converter.normalize([2, 500, 1, 3.6, 7], ['mi', 'm', 'gal', 'MJ', 'furlong'])
+        np.testing.assert_allclose(normalized, [3.218688, 0.5, 3.785411784, 1.0, 7])
+        self.assertAlmostEqual(converter.convert(2, 'therm'), 58.6142)
+        self.assertEqual(converter.normalize([], []).size, 0)
+
+    def test_purchases_use_the_rate_in_force_on_their_date(self):
+        converter = Converter([('XYZ', date(2024, 6, 1), 20.0), ('XYZ', date(2024, 1, 1), 10.0)])
+        # Before the first rate the earliest one applies; undated amounts use the latest
+        self.assertAlmostEqual(converter.convert(100, 'XYZ', date(2023, 12, 31)), 10.0)
+        self.assertAlmostEqual(converter.convert(100, 'XYZ', date(2024, 3, 1)), 10.0)
+        self.assertAlmostEqual(converter.convert(100, 'XYZ', timezone.make_aware(datetime(2024, 6, 1, 9))), 5.0)
+        self.assertAlmostEqual(converter.convert(100, 'XYZ'), 5.0)
+        np.testing.assert_allclose(
+            converter.normalize([100, 100, 2], ['XYZ', 'XYZ', 'km'], [date(2024, 5, 31), date(2024, 6, 2), date(2024, 6, 2)]),
+            [10.0, 5.0, 2.0],
+        )
+
+    def test_saving_a_rate_resets_the_converter(self):
+        self.addCleanup(reset_converter)
+        before = get_converter()
+        self.assertIsNone(before.dimension('XYZ'))
+        self.assertIs(get_converter(), before)
+        ExchangeRate.objects.create(currency='XYZ', valid_from=date(2024, 1, 1), per_usd=4.0)
+        self.assertEqual(get_converter().dimension('XYZ'), 'currency')
+        self.assertAlmostEqual(convert(100, 'XYZ', date(2024, 2, 1)), 25.0)
+
+class SummaryTests(TestCase):
+    FIELDS = ['today_kg', 'yesterday_kg', 'month_kg', 'last_month_kg', *CATEGORY_FIELDS.values()]
+
+    def setUp(self):
+        self.user = User.objects.create_user('ivy', 'ivy@example.com', 'pass-1234-word')
+        get_summary(self.user)
+
+    def log(self, category, subtype, when, kg):
+        activity = Activity.objects.create(user=self.user, category=category, subtype=subtype, value=kg, timestamp=when)
+        Emission.objects.create(activity=activity, co2_equivalent_kg=kg)
+        record_activity_change(self.user, category, when, kg)
+        return activity
+
+    def stored(self):
+        summary = DashboardSummary.objects.get(pk=self.user.pk)
+        return {field: round(getattr(summary, field), 6) for field in self.FIELDS}
+
+    def rebuilt(self):
+        summary = rebuild_summary(self.user)
+        return {field: round(getattr(summary, field), 6) for field in self.FIELDS}
+
+    def test_write_through_matches_a_rebuild(self):
+        now = timezone.now()
+        last_month = timezone.make_aware(datetime.combine(date.today().replace(day=1) - timedelta(days=5), datetime.min.time()))
+        self.log('food', 'vegan', now, 1.5)
+        self.log('transport', 'bus', now, 2.0)
+        removed = self.log('energy', 'electricity', now - timedelta(days=1), 4.0)
+        self.log('food', 'fish', last_month, 3.0)
+        record_activity_change(self.user, 'energy', removed.timestamp, -4.0)
+        removed.delete()
+
+        stored = self.stored()
+        self.assertEqual(stored, self.rebuilt())
+        self.assertEqual((stored['today_kg'], stored['food_month_kg']), (3.5, 1.5))
+
+    def test_rolls_forward_on_a_new_day(self):
+        self.log('food', 'vegan', timezone.now(), 1.5)
+        tomorrow = date.today() + timedelta(days=1)
+        summary, created = get_summary(self.user, tomorrow)
+        self.assertFalse(created)
+        self.assertEqual((summary.today_kg, summary.yesterday_kg, summary.day), (0, 1.5, tomorrow))
+
+
+    def test_ajax_create_returns_the_new_stats(self):
+        self.client.force_login(self.user)
+        page = self.client.get(reverse('activity')).content.decode()
+        self.assertEqual(page.count('<form method="POST" class="activity-form">'), 4)
+
+        self.log('food', 'vegan', timezone.now(), 1.5)
+        response = self.client.post(
+            reverse('activity'), {'category': 'food', 'dietType': 'vegan', 'foodQuantity': '2', 'idempotency_key': 'ajax-1'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        ).json()
+        self.assertTrue(response['success'])
+        today = round(1.5 + response['activity']['footprint'], 2)
+        self.assertEqual(response['stats']['emission_stats']['today'], today)
+        self.assertEqual(response['stats']['daily_budget']['used'], today)
+        self.assertEqual(response['stats']['monthly_budget']['used'], response['stats']['emission_stats']['this_month'])
+        # log() skips the calendar, so today counts as newly active
+        self.assertEqual(response['streak_delta'], {'total_active': 1})
+
+class ForecastTests(TestCase):
+    # A Monday; the 21 days left in March are exactly three weeks
+    TODAY = date(2025, 3, 10)
+
+    def setUp(self):
+        self.user = User.objects.create_user('ray', 'ray@example.com', 'pass-1234-word')
+
+    def log_days(self, kg_for_weekday):
+        for offset in range(HISTORY_DAYS + 1):
+            day = self.TODAY - timedelta(days=offset)
+            when = timezone.make_aware(datetime.combine(day, datetime.min.time()) + timedelta(hours=12))
+            activity = Activity.objects.create(user=self.user, category='energy', subtype='electricity', value=1, timestamp=when)
+            Emission.objects.create(activity=activity, co2_equivalent_kg=kg_for_weekday(day.weekday()))
+
+    def test_ses_continues_a_flat_series(self):
+        self.log_days(lambda weekday: 2.0)
+        month_to_date, remaining = forecast_users([self.user.id], self.TODAY)[self.user.id]
+        self.assertAlmostEqual(month_to_date, 20.0)
+        self.assertAlmostEqual(remaining, 42.0)
+
+    def test_seasonal_naive_repeats_the_last_week(self):
+        self.log_days(lambda weekday: 5.0 if weekday >= 5 else 1.0)
+        month_to_date, remaining = forecast_users([self.user.id], self.TODAY, 'seasonal-naive')[self.user.id]
+        self.assertAlmostEqual(month_to_date, 26.0)
+        self.assertAlmostEqual(remaining, 3 * (5 * 1.0 + 2 * 5.0))
+
+    def test_activity_updates_the_stored_forecast(self):
+        self.log_days(lambda weekday: 2.0)
+        before = budget_projection(self.user, 100, self.TODAY)['projected']
+        now = timezone.make_aware(datetime.combine(self.TODAY, datetime.min.time()) + timedelta(hours=9))
+        record_activity_change(self.user, 'food', now, 3.0, self.TODAY)
+        self.assertAlmostEqual(budget_projection(self.user, 100, self.TODAY)['projected'], before + 3.0)
+
+        # Last month's activity only moves the projection at the next daily refresh
+        record_activity_change(self.user, 'food', now - timedelta(days=20), 4.0, self.TODAY)
+        self.assertAlmostEqual(budget_projection(self.user, 100, self.TODAY)['projected'], before + 3.0)
+
+        # 20:00 UTC on 28 February is already 1 March in Tokyo
+        with timezone.override('Asia/Tokyo'):
+            record_activity_change(self.user, 'food', timezone.make_aware(datetime(2025, 2, 28, 20), dt_timezone.utc), 1.0, self.TODAY)
+        self.assertAlmostEqual(EmissionForecast.objects.get(user=self.user).month_to_date_kg, 24.0)
+
+class StreakTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ben', 'ben@example.com', 'pass-1234-word')
+        self.today = date.today()
+
+    def log(self, day, hour=12):
+        when = timezone.make_aware(datetime.combine(day, datetime.min.time().replace(hour=hour)))
+        activity = Activity.objects.create(user=self.user, category='food', subtype='vegan', value=1, unit='serving', timestamp=when)
+        return activity, mark_active(self.user, when)
+
+    def test_runs(self):
+        self.assertEqual(longest_run(0b0111011110), 4)
+        self.assertEqual(current_run(0b0111011110, 4), 4)
+        self.assertEqual(current_run(0b0111011110, 5), 0)
+        self.assertEqual(current_run(0b111, 2), 3)
+
+    def test_calendar_follows_activity_writes(self):
+        # The calendar exists from sign-up, so even the first activity's day is counted
+        for days_ago in (0, 1, 2, 10):
+            self.assertEqual(self.log(self.today - timedelta(days=days_ago))[1], 1)
+        _, added = self.log(self.today, hour=9)
+        self.assertEqual(added, 0)
+        # An earlier day than the calendar's start moves the start back
+        old, added = self.log(self.today - timedelta(days=400))
+        self.assertEqual(added, 1)
+        self.assertEqual(streak_stats(self.user, self.today), {'total_active': 5, 'max_streak': 3, 'current_streak': 3})
+
+        old.delete()
+        self.assertTrue(clear_if_inactive(self.user, old.timestamp))
+        self.assertEqual(streak_stats(self.user, self.today)['total_active'], 4)
+
+        # Two activities today: removing one keeps the day
+        today_activity = Activity.objects.filter(user=self.user, timestamp__date=self.today).first()
+        today_activity.delete()
+        self.assertFalse(clear_if_inactive(self.user, today_activity.timestamp))
+
+        # A rebuilt calendar agrees with the maintained one
+        self.user.activity_calendar.delete()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(streak_stats(user, self.today), {'total_active': 4, 'max_streak': 3, 'current_streak': 3})
+
+        # A user from before calendars existed: the calendar built on their next write counts its day
+        user.activity_calendar.delete()
+        self.user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(self.log(self.today - timedelta(days=5))[1], 1)
+
+    def test_window(self):
+        for days_ago in (0, 3):
+            self.log(self.today - timedelta(days=days_ago))
+        result = window(self.user, self.today - timedelta(days=9), self.today)
+        self.assertEqual(result['days'], 10)
+        bits = int.from_bytes(base64.b64decode(result['bitmap']), 'little')
+        self.assertEqual(bits, (1 << 9) | (1 << 6))
+
+
+class PlatformCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        recount()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user('cy', 'cy@example.com', 'pass-1234-word')
+        self.client.force_login(self.user)
+
+    def post(self, data, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('activity'), data, HTTP_X_REQUESTED_WITH='XMLHttpRequest', **extra).json()
+
+    def test_counters_follow_writes_and_match_recount(self):
+        self.post({'category': 'food', 'dietType': 'vegan', 'foodQuantity': '2', 'idempotency_key': 'k1'})
+        second = self.post({'category': 'food', 'dietType': 'vegan', 'foodQuantity': '3', 'idempotency_key': 'k2'})
+        self.post({'category': 'food', 'dietType': 'vegan', 'foodQuantity': '3', 'idempotency_key': 'k2'})  # a retry
+        self.post({'action': 'delete', 'activity_id': second['activity']['id']})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('myprofile'), {
+                'first_name': 'Cy', 'last_name': '', 'email': 'cy@example.com', 'phone_number': '', 'location': 'Pune',
+            })
+
+        counters = PlatformCounters.objects.values(*COUNTER_FIELDS).get(pk=1)
+        self.assertEqual(counters['user_count'], 1)
+        self.assertEqual(counters['activity_count'], 1)
+        self.assertEqual(counters['active_user_days'], 1)
+        self.assertEqual(counters['region_count'], 1)
+        recounted = recount()
+        for field in COUNTER_FIELDS:
+            self.assertAlmostEqual(counters[field], getattr(recounted, field), places=6, msg=field)
+
+    def test_home_page_reads_one_row(self):
+        with self.assertNumQueries(1):
+            stats = platform_stats()
+        self.assertEqual(stats['totalUsers'], 1)
+
+
+
+class ReplicaRouterTests(TestCase):
+    def test_only_reads_inside_the_block_use_the_replica(self):
+        router = ReplicaRouter()
+        with mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: settings.DATABASES['default']}):
+            self.assertEqual(Activity.objects.all().db, 'default')
+            with read_from_replica():
+                self.assertEqual(router.db_for_read(Activity), REPLICA_ALIAS)
+                self.assertEqual(Activity.objects.all().db, REPLICA_ALIAS)
+                self.assertEqual(router.db_for_write(Activity), 'default')
+                user = User.objects.create_user('rae', 'rae@example.com', 'pass-1234-word')
+                self.assertEqual(user._state.db, 'default')
+            self.assertEqual(router.db_for_read(Activity), 'default')
+
+        # Without a replica configured everything stays on default
+        with read_from_replica():
+            self.assertEqual(router.db_for_read(Activity), 'default')
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def log(self, user, days_ago, kg):
+        activity = Activity.objects.create(
+            user=user, category='food', subtype='vegan', value=kg, unit='serving',
+            timestamp=timezone.now() - timedelta(days=days_ago),
+        )
+        Emission.objects.create(activity=activity, co2_equivalent_kg=kg)
+
+    def make_user(self, name, current, previous):
+        user = User.objects.create_user(name, f'{name}@example.com', 'pass-1234-word')
+        if current:
+            self.log(user, 2, current)
+        if previous:
+            self.log(user, 40, previous)
+        return user
+
+    def test_constant_queries(self):
+        self.make_user('a', 10, 20)
+        with self.assertNumQueries(2):
+            compute_leaderboard_data()
+        for n in range(10):
+            self.make_user(f'u{n}', n + 1, n + 2)
+        with self.assertNumQueries(2):
+            rows = compute_leaderboard_data()
+        self.assertEqual(len(rows), 11)
+
+    def test_reduction_and_ranking(self):
+        self.make_user('steady', 10, 10)
+        self.make_user('cutter', 30, 60)
+        self.make_user('new', 5, 0)
+        self.make_user('riser', 12, 8)
+        rows = {row['username']: row for row in compute_leaderboard_data()}
+        self.assertEqual(rows['cutter']['reduction_kg'], 30)
+        self.assertEqual(rows['cutter']['reduction_pct'], 50.0)
+        self.assertEqual(rows['riser']['reduction_pct'], -50.0)
+        self.assertEqual(rows['riser']['reduction'], '↑ 50%')
+        self.assertIsNone(rows['new']['reduction_pct'])
+
+        by_emission = [row['username'] for row in cached_leaderboard_data()]
+        self.assertEqual(by_emission, ['new', 'steady', 'riser', 'cutter'])
+        by_reduction = [row['username'] for row in cached_leaderboard_data('reduction')]
+        self.assertEqual(by_reduction, ['cutter', 'steady', 'riser', 'new'])
+
+
+
+
+class CacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def compute(self):
+        self.calls.append(1)
+        return len(self.calls)
+
+    def test_stale_copy_served_while_one_caller_recomputes(self):
+        self.assertEqual(get_or_recompute('k', self.compute, ttl=60), 1)
+        self.assertEqual(get_or_recompute('k', self.compute, ttl=60), 1)
+
+        cache.set('k', ('stale', time.time() - 1), 60)
+        cache.add('k:lock', 1)
+        self.assertEqual(get_or_recompute('k', self.compute, ttl=60), 'stale')
+        self.assertEqual(len(self.calls), 1)
+
+        cache.delete('k:lock')
+        self.assertEqual(get_or_recompute('k', self.compute, ttl=60), 2)
+        self.assertIsNone(cache.get('k:lock'))
+
+    def test_cold_cache_waits_for_the_caller_computing_it(self):
+        cache.add('k:lock', 1)
+
+        def fill(seconds):
+            # Stands in for the other request finishing while this one waits
+            cache.set('k', ('theirs', time.time() + 60), 60)
+
+        with mock.patch('tracker.cache.time.sleep', side_effect=fill):
+            self.assertEqual(get_or_recompute('k', self.compute, ttl=60), 'theirs')
+        self.assertEqual(self.calls, [])
+
+    def test_anonymous_page_cached_and_bypassed(self):
+        @cache_anonymous_page('page:test', ttl=60)
+        def view(request):
+            return HttpResponse(f"render {self.compute()}")
+
+        def get(user=None, cookies=None, **params):
+            request = RequestFactory().get('/', params)
+            request.user = user or AnonymousUser()
+            request.COOKIES.update(cookies or {})
+            return view(request).content.decode()
+
+        self.assertEqual(get(), 'render 1')
+        self.assertEqual(get(), 'render 1')
+        user = User.objects.create_user('cal', 'cal@example.com', 'pass-1234-word')
+        self.assertEqual(get(user), 'render 2')
+        self.assertEqual(get(page='2'), 'render 3')
+        self.assertEqual(get(cookies={CookieStorage.cookie_name: 'pending'}), 'render 4')
+        self.assertEqual(get(), 'render 1')
+
+        self.assertIsNone(cache.get('page:tracker-home'))
+        self.client.get(reverse('tracker-home'))
+        self.assertIsNotNone(cache.get('page:tracker-home'))
+
+class LiveFeedTests(TestCase):
+    def test_challenge_topics_need_a_login(self):
+        url = reverse('live-feed')
+        self.assertEqual(self.client.get(url, {'topics': 'challenge:1'}).status_code, 403)
+        self.assertEqual(self.client.get(url, {'topics': 'leaderboard,challenge:1'}).status_code, 403)
+        self.assertEqual(self.client.get(url, {'topics': 'leaderboard'}).status_code, 200)
+        self.client.force_login(User.objects.create_user('gail', 'gail@example.com', 'pass-1234-word'))
+        self.assertEqual(self.client.get(url, {'topics': 'challenge:1'}).status_code, 200)
+
+
+class StatementParsingTests(TestCase):
+    def test_bill_without_a_date_is_rejected(self):
+        bill = ["Bill date: 05/03/2025", "Units consumed: 212"]
+        [line] = parse_electricity_text(bill, {'lines': 0}, 'INR')
+        self.assertEqual((line.day, line.amount, line.unit), (date(2025, 3, 5), 212, 'kWh'))
+        with self.assertRaisesMessage(StatementError, "billing date"):
+            list(parse_electricity_text(bill[1:], {'lines': 0}, 'INR'))
+
+
+    def test_bank_csv_lines_classified_or_skipped(self):
+        statement = [
+            'Account: 1234',
+            'Date,Narration,Withdrawal,Deposit',
+            '05/03/2025,UBER TRIP BLR,250.00,',
+            '06/03/2025,SALARY MARCH,,50000.00',
+            '06/03/2025,BESCOM electricity bill,"1,200.00",',
+            '07/03/2025,Swiggy order,450.00,',
+            '07/03/2025,Corner shop,99.00,',
+            '08/03/2025,IMPS transfer to friend,500.00,',
+        ]
+        stats = Counter()
+        lines = list(parse_bank_csv(statement, stats, 'INR'))
+        self.assertEqual(
+            [(line.day, line.amount, line.category, line.subtype) for line in lines],
+            [(date(2025, 3, 5), 250, 'transport', 'taxi'), (date(2025, 3, 7), 450, 'food', 'dining'), (date(2025, 3, 7), 99, 'consumption', 'other')],
+        )
+        self.assertEqual((stats['lines'], stats['skipped']), (6, 3))
+
+        # One signed amount column: credits and negative amounts aren't spending
+        signed = ['Date,Description,Amount,Type', '2025-03-05,Shell petrol,1500.00,DR', '2025-03-05,Refund Myntra,300.00,CR', '2025-03-06,Zara,-200.00,']
+        stats = Counter()
+        [line] = parse_bank_csv(signed, stats, 'INR')
+        self.assertEqual((line.amount, line.subtype), (1500, 'fuel'))
+        self.assertEqual(stats['skipped'], 2)
+        with self.assertRaises(StatementError):
+            list(parse_bank_csv(['Merchant,Total', 'Zara,200.00'], Counter(), 'INR'))
+
+    def test_bank_text_lines_classified_or_skipped(self):
+        page = [
+            'Statement for March 2025',
+            '01/03/2025  SWIGGY BANGALORE  450.00 Dr  12,000.00 Cr',
+            '02/03/2025  NEFT SALARY  50,000.00 Cr  62,000.00 Cr',
+            '03-Mar-2025  IRCTC TICKET  1,200.00 Dr',
+            'Page 1 of 2',
+        ]
+        stats = Counter()
+        lines = list(parse_bank_text(page, stats, 'INR'))
+        self.assertEqual([(line.day, line.amount, line.subtype) for line in lines], [(date(2025, 3, 1), 450, 'dining'), (date(2025, 3, 3), 1200, 'train')])
+        self.assertEqual((stats['lines'], stats['skipped']), (3, 1))
+
+
+class StatementImportTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.directory)
+        self.settings_override.enable()
+        self.user = User.objects.create_user('sam', 'sam@example.com', 'pass-1234-word')
+        today = date.today().strftime('%d/%m/%Y')
+        self.data = (
+            f"Date,Narration,Withdrawal\n{today},Swiggy order,450.00\n{today},Starbucks,300.00\n"
+            f"{today},Starbucks,300.00\n{today},NEFT transfer,900.00\n"
+        ).encode()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def upload(self):
+        return StatementImport.objects.create(
+            user=self.user, kind='bank', file=ContentFile(self.data, name='march.csv'), original_name='march.csv', bytes_total=len(self.data),
+        )
+
+    def test_uploading_the_same_statement_twice(self):
+        first = import_statement(self.upload())
+        # Two identical coffees in one statement are both real
+        self.assertEqual((first['imported'], first['duplicates'], first['skipped']), (3, 0, 1))
+        again = import_statement(self.upload())
+        self.assertEqual((again['imported'], again['duplicates']), (0, 3))
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(StatementImport.objects.values_list('status', flat=True).distinct().get(), 'done')
+
+    def test_totals_rebuilt_when_a_later_batch_fails(self):
+        calls = []
+
+        def fail_second_batch(user, lines):
+            calls.append(StatementImport.objects.values('status', 'imported', 'lines_read').get())
+            if len(calls) == 2:
+                raise RuntimeError("disk full")
+            return write_batch(user, lines)
+
+        with mock.patch('tracker.statements.write_batch', side_effect=fail_second_batch), self.assertLogs('tracker.statements', 'ERROR'):
+            stats = import_statement(self.upload(), batch_size=1)
+        # Progress was saved after the first batch
+        self.assertEqual(calls[1], {'status': 'processing', 'imported': 1, 'lines_read': 1})
+        statement = StatementImport.objects.get()
+        self.assertEqual((statement.status, statement.error, stats['imported']), ('failed', 'disk full', 1))
+        self.assertAlmostEqual(DashboardSummary.objects.get(pk=self.user.pk).today_kg, Emission.objects.get().co2_equivalent_kg)
+
+    def test_small_files_inline_and_large_ones_in_the_background(self):
+        with override_settings(STATEMENT_INLINE_MAX_BYTES=len(self.data)):
+            stats = schedule_import(self.upload())
+        self.assertEqual(stats['imported'], 3)
+        statement = StatementImport.objects.get()
+        self.assertEqual(
+            (statement.status, statement.bytes_processed, statement.lines_read, statement.imported, statement.skipped),
+            ('done', len(self.data), 4, 3, 1),
+        )
+
+        executor = mock.Mock()
+        with override_settings(STATEMENT_INLINE_MAX_BYTES=len(self.data) - 1), mock.patch('tracker.statements._executor', executor):
+            with self.captureOnCommitCallbacks(execute=True):
+                queued = self.upload()
+                self.assertIsNone(schedule_import(queued))
+                executor.submit.assert_not_called()
+        executor.submit.assert_called_once_with(_run_in_background, queued.pk)
+        self.assertEqual(StatementImport.objects.get(pk=queued.pk).status, 'pending')
+
+class DedupeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('hal', 'hal@example.com', 'pass-1234-word')
+        self.now = timezone.now()
+
+    def activity(self, value=2, **fields):
+        return Activity(user=self.user, category='food', subtype='vegan', value=value, unit='serving', timestamp=self.now, **fields)
+
+    def test_create_activity_returns_the_stored_duplicate(self):
+        first, created = create_activity(self.activity(idempotency_key='k1'), 1.4)
+        self.assertTrue(created)
+        again, created = create_activity(self.activity(), 1.4)
+        self.assertEqual((again.pk, created), (first.pk, False))
+        # Same key, different content: the retry still gets the original
+        retry, created = create_activity(self.activity(value=5, idempotency_key='k1'), 3.5)
+        self.assertEqual((retry.pk, created), (first.pk, False))
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(retry.emission.co2_equivalent_kg, 1.4)
+
+    def test_bulk_create_returns_only_new_rows_with_keys(self):
+        stored, _ = create_activity(self.activity(), 1.4)
+        batch = [self.activity(), self.activity(value=3), self.activity(value=4)]
+        for activity in batch:
+            activity.content_hash = activity_hash(activity)
+        inserted = bulk_create_activities(batch, [1.4, 2.1, 2.8])
+        self.assertEqual(sorted(a.value for a in inserted), [3, 4])
+        self.assertTrue(all(a.pk and a.pk != stored.pk for a in inserted))
+        self.assertEqual(
+            dict(Emission.objects.values_list('activity__value', 'co2_equivalent_kg')),
+            {2: 1.4, 3: 2.1, 4: 2.8},
+        )
+
+    def test_each_create_form_has_its_own_key(self):
+        self.client.force_login(self.user)
+        keys = self.client.get(reverse('activity')).context['idempotency_keys']
+        self.assertEqual(len(set(keys.values())), 4)
+        xhr = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        meal = self.client.post(reverse('activity'), {'category': 'food', 'dietType': 'vegan', 'foodQuantity': '2', 'idempotency_key': keys['food']}, **xhr).json()
+        trip = self.client.post(reverse('activity'), {'category': 'transport', 'transportMode': 'bus', 'distance': '12', 'idempotency_key': keys['transport']}, **xhr).json()
+        self.assertEqual((meal['duplicate'], trip['duplicate']), (False, False))
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 2)
+
+    def test_merge_backfills_after_deleting_duplicates(self):
+        # An old row without a hash, and a later copy that has one: the backfill would
+        # collide with the copy unless the copy is deleted first
+        [old] = Activity.objects.bulk_create([self.activity()])
+        Emission.objects.create(activity=old, co2_equivalent_kg=1.4)
+        copy, _ = create_activity(self.activity(), 1.4)
+        self.assertIsNone(Activity.objects.get(pk=old.pk).content_hash)
+        self.assertAlmostEqual(rebuild_summary(self.user).today_kg, 2.8)
+
+        call_command('merge_duplicate_activities', dry_run=True, stdout=io.StringIO())
+        self.assertEqual(Activity.objects.count(), 2)
+
+        call_command('merge_duplicate_activities', stdout=io.StringIO())
+        [kept] = Activity.objects.all()
+        self.assertEqual((kept.pk, kept.content_hash), (old.pk, copy.content_hash))
+        self.assertFalse(Emission.objects.filter(activity_id=copy.pk).exists())
+        self.assertAlmostEqual(DashboardSummary.objects.get(pk=self.user.pk).today_kg, 1.4)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('jo', 'jo@example.com', 'pass-1234-word')
+        self.cutoff = date.today().replace(day=1)
+        self.old_month = (self.cutoff - timedelta(days=70)).replace(day=1)
+
+    def log(self, day, kg, category='food', **fields):
+        when = timezone.make_aware(datetime.combine(day, datetime.min.time().replace(hour=12)))
+        activity = Activity.objects.create(user=self.user, category=category, subtype='vegan', value=kg, timestamp=when, **fields)
+        Emission.objects.create(activity=activity, co2_equivalent_kg=kg)
+        return activity
+
+    def test_old_months_move_out_and_totals_stay(self):
+        self.log(self.old_month, 1.0)
+        self.log(self.old_month + timedelta(days=2), 2.0)
+        self.log(self.old_month + timedelta(days=2), 5.0, category='transport')
+        held = self.log(self.old_month + timedelta(days=3), 50.0, quarantined=True)
+        recent = self.log(self.cutoff, 4.0)
+        before = monthly_totals(self.user, self.old_month, self.cutoff)
+
+        self.assertEqual(archive_users([self.user.id], self.cutoff, dry_run=True)['activities'], 3)
+        self.assertEqual(Activity.objects.count(), 5)
+        stats = archive_users([self.user.id], self.cutoff)
+        self.assertEqual((stats['activities'], stats['months'], stats['co2_kg']), (3, 1, 8.0))
+        self.assertEqual(set(Activity.objects.values_list('id', flat=True)), {held.id, recent.id})
+        self.assertEqual(monthly_totals(self.user, self.old_month, self.cutoff), before)
+
+        food = ArchivedMonth.objects.get(user=self.user, month=self.old_month, category='food')
+        self.assertEqual((food.activity_count, food.co2_kg, food.active_days), (2, 3.0, 0b101))
+        self.assertEqual(sorted(row['co2_kg'] for row in archived_rows(self.user, self.old_month)), [1.0, 2.0, 5.0])
+
+        # A backdated activity is added to the month already archived
+        self.log(self.old_month + timedelta(days=1), 0.5)
+        archive_users([self.user.id], self.cutoff)
+        food.refresh_from_db()
+        self.assertEqual((food.activity_count, food.co2_kg, food.active_days), (3, 3.5, 0b111))
+        self.assertEqual(len(archived_rows(self.user, self.old_month)), 4)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('kit', 'kit@example.com', 'pass-1234-word')
+        # Token only, like the mobile apps: no session, no page views
+        token = Token.objects.create(user=self.user)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+    def url(self, name, **kwargs):
+        return reverse(name, kwargs={'version': 'v1', **kwargs})
+
+    def get(self, url, **headers):
+        return self.client.get(url, **self.auth, **headers)
+
+    def post(self, data, **headers):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url('api-activities'), data, content_type='application/json', **self.auth, **headers)
+
+    def meal(self, servings, **fields):
+        return {'category': 'food', 'subtype': 'vegan', 'value': servings, 'unit': 'servings', **fields}
+
+    def test_single_post_duplicates(self):
+        first = self.post(self.meal(2), HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.json()['unit'], 'serving')
+        retry = self.post(self.meal(2), HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual((retry.status_code, retry.json()['duplicate'], retry.json()['id']), (200, True, first.json()['id']))
+        # No key, but the same content within the dedupe window
+        self.assertTrue(self.post(self.meal(2)).json()['duplicate'])
+        self.assertEqual(self.post(self.meal(3)).status_code, 201)
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_post_and_retry(self):
+        self.post(self.meal(1))
+        response = self.post([self.meal(1), self.meal(2)])
+        self.assertEqual((response.status_code, response.json()['created'], response.json()['duplicates']), (201, 1, 1))
+
+        items = [self.meal(3), self.meal(4)]
+        self.assertEqual(self.post(items, HTTP_IDEMPOTENCY_KEY='batch-1').json()['created'], 2)
+        self.assertAlmostEqual(DashboardSummary.objects.get(pk=self.user.pk).today_kg, 0.7 * 10)
+        # As if the dedupe window had passed: only the idempotency keys can catch the retry
+        Activity.objects.update(content_hash=None)
+        retry = self.post(items, HTTP_IDEMPOTENCY_KEY='batch-1')
+        self.assertEqual((retry.status_code, retry.json()['created'], retry.json()['duplicates']), (200, 0, 2))
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 4)
+
+    def test_activity_list_pages_and_revalidates(self):
+        now = timezone.now()
+        for n in range(5):
+            self.post(self.meal(n + 1, timestamp=(now - timedelta(hours=n)).isoformat()))
+        url, seen = self.url('api-activities') + '?page_size=2', []
+        first = self.get(url)
+        while url:
+            page = self.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            seen += [row['value'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(seen, [1, 2, 3, 4, 5])
+
+        url = self.url('api-activities') + '?page_size=2'
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.post(self.meal(6))
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_patch_and_delete(self):
+        activity_id = self.post(self.meal(2)).json()['id']
+        url = self.url('api-activity-detail', pk=activity_id)
+        etag = self.get(url)['ETag']
+        response = self.client.patch(url, {'description': 'Lunch'}, content_type='application/json', **self.auth)
+        self.assertEqual(response.json()['description'], 'Lunch')
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(url, **self.auth).status_code, 204)
+        self.assertEqual(self.get(url).status_code, 404)
+        self.assertEqual(DashboardSummary.objects.get(pk=self.user.pk).today_kg, 0)
+        other = User.objects.create_user('lee', 'lee@example.com', 'pass-1234-word')
+        theirs = Activity.objects.create(user=other, category='food', subtype='vegan', value=1, timestamp=timezone.now())
+        self.assertEqual(self.client.delete(self.url('api-activity-detail', pk=theirs.pk), **self.auth).status_code, 404)
+
+    def test_reads_revalidate(self):
+        community = Community.objects.create(name='Campus', description='', community_type='University')
+        challenge = Challenge.objects.create(community=community, title='Walk', description='', goal=10, end_date=date.today())
+        for name in ('api-stats', 'api-leaderboard', 'api-challenges'):
+            response = self.get(self.url(name))
+            self.assertEqual(response.status_code, 200, name)
+            self.assertEqual(self.get(self.url(name), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304, name)
+
+        etag = self.get(self.url('api-stats'))['ETag']
+        self.post(self.meal(2))
+        self.assertEqual(self.get(self.url('api-stats'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.get(self.url('api-challenges'))['ETag']
+        UserChallenge.objects.create(user=self.user, challenge=challenge, progress=3)
+        response = self.get(self.url('api-challenges'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['participants'], 1)
+
+
+class InsightTests(TestCase):
+    def frame(self):
+        monday = datetime(2025, 3, 3, tzinfo=dt_timezone.utc)
+        rows = [(1, monday + timedelta(days=day, hours=8), 'transport', 'car-gasoline', 60, 'km', 15.0) for day in range(5)]
+        # Electricity logged on weekday evenings, plus one Sunday morning
+        rows += [(1, monday + timedelta(days=day, hours=19), 'energy', 'electricity', 5, 'kWh', 2.0) for day in range(5)]
+        rows += [(1, monday + timedelta(days=6, hours=9), 'energy', 'electricity', 5, 'kWh', 2.0)]
+        rows += [(1, monday + timedelta(hours=13), 'food', 'vegan', 1, 'serving', 0.7)]
+        return pd.DataFrame.from_records(rows, columns=FRAME_COLUMNS)
+
+    def test_build_insights(self):
+        insights = build_insights(self.frame(), days=30)
+        by_kind = {item['kind']: item for item in insights}
+        # 300 km a month at 0.25 instead of the train's 0.04 kg/km
+        self.assertEqual(insights[0]['kind'], 'substitution')
+        self.assertAlmostEqual(insights[0]['saving_kg'], 63.0)
+        self.assertIn("Car Gasoline is your biggest source", by_kind['top_contributor']['text'])
+        self.assertIn("Transportation makes up", by_kind['top_category']['text'])
+        self.assertIn("weekday evenings (83%", by_kind['peak_time']['text'])
+        self.assertEqual(build_insights(self.frame().iloc[0:0]), [])
+
+    def test_only_users_with_new_activity_are_rerun(self):
+        ann, bob = (User.objects.create_user(name, f'{name}@example.com', 'pass-1234-word') for name in ('ann', 'bob'))
+        for user in (ann, bob):
+            Activity.objects.create(user=user, category='food', subtype='vegan', value=1, timestamp=timezone.now())
+        self.assertEqual(users_needing_insights(), [ann.id, bob.id])
+        call_command('generate_insights', stdout=io.StringIO())
+        self.assertEqual(users_needing_insights(), [])
+        newest = Activity.objects.create(user=bob, category='food', subtype='vegan', value=2, timestamp=timezone.now())
+        self.assertEqual(users_needing_insights(), [bob.id])
+        call_command('generate_insights', stdout=io.StringIO())
+        self.assertEqual(Profile.objects.get(user=bob).insights_watermark, newest.id)
+
+class SimulatorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('sim', 'sim@example.com', 'pass-1234-word')
+        self.user.profile.carbon_budget_kg = 100
+        self.user.profile.save()
+
+    def log(self, days_ago, category, subtype, value, unit, kg):
+        activity = Activity.objects.create(
+            user=self.user, category=category, subtype=subtype, value=value, unit=unit,
+            timestamp=timezone.now() - timedelta(days=days_ago),
+        )
+        Emission.objects.create(activity=activity, co2_equivalent_kg=kg)
+
+    def test_plans_priced_from_factors(self):
+        # 400 km by car (100 kg) and 14 red-meat servings (99.4 kg) in the latest month
+        self.log(1, 'transport', 'car-gasoline', 400, 'km', 100)
+        self.log(2, 'food', 'red-meat', 14, 'serving', 99.4)
+        self.log(3, 'transport', 'car-gasoline', 10, 'L', 23.1)  # litres aren't swapped
+        with self.assertNumQueries(1):
+            history = load_history(self.user, months=1)
+        self.assertEqual(history.totals.tolist(), [222.5])
+
+        result = simulate(self.user, months=1)
+        plans = {plan['key']: plan for plan in result['plans']}
+        self.assertEqual(plans['train-for-car']['monthly_saving_kg'], 84.0)
+        self.assertEqual(plans['train-for-half-car']['monthly_saving_kg'], 42.0)
+        self.assertEqual(plans['vegetarian-3-days']['monthly_saving_kg'], 36.6)
+        self.assertEqual(plans['train-and-vegetarian']['monthly_saving_kg'], 120.6)
+        self.assertEqual(plans['bus-for-motorcycle']['monthly_saving_kg'], 0)
+        self.assertEqual(result['plans'][0]['key'], 'train-and-vegetarian')
+        self.assertEqual(result['baseline']['months_over_budget'], 1)
+        self.assertEqual(plans['train-and-vegetarian']['projected_monthly_kg'], 101.9)
+        self.assertEqual(plans['train-and-vegetarian']['budget_percentage'], 102)
+
+    def test_api(self):
+        self.log(1, 'transport', 'car-gasoline', 400, 'km', 100)
+        self.client.force_login(self.user)
+        url = reverse('api-simulations', kwargs={'version': 'v1'})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['plans']), len(PLANS))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        plan = {'key': 'bus', 'swaps': [{'category': 'transport', 'from_subtype': 'car-gasoline', 'to_subtype': 'bus', 'share': 1}]}
+        response = self.client.post(url, {'months': 1, 'plans': [plan]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['plans'][0]['monthly_saving_kg'], 60.0)
+
+        plan['swaps'].append({'category': 'transport', 'from_subtype': 'car-gasoline', 'to_subtype': 'train', 'share': 0.5})
+        response = self.client.post(url, {'plans': [plan]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+
+class BenchmarkSmokeTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_seed_then_benchmark(self):
+        out = io.StringIO()
+        call_command('seed_synthetic', users=2, days=7, communities=1, challenges=1, seed=7, stdout=out)
+        self.assertIn('Seeded 2 users', out.getvalue())
+        self.assertEqual(PlatformCounters.objects.get().user_count, 2)
+
+        output = os.path.join(self.directory, 'results.json')
+        # The test runner has already set up the test environment, which can't be nested
+        with mock.patch('tracker.management.commands.benchmark.setup_test_environment'), \
+                mock.patch('tracker.management.commands.benchmark.teardown_test_environment'):
+            call_command('benchmark', repeat=1, output=output, stdout=out)
+        with open(output, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(report['meta']['users'], 2)
+        self.assertEqual(set(report['results']), {name for name, _, _ in PAGES} | {name for name, _ in CALLABLES})
+        self.assertGreater(report['results']['activity']['queries'], 0)
+
+class AnomalyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('dee', 'dee@example.com', 'pass-1234-word')
+        self.client.force_login(self.user)
+
+    def post(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('activity'), data, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+
+    def log_energy(self, kwh):
+        return self.post({'category': 'energy', 'electricityUnits': str(kwh), 'energyUnit': 'kWh'})['activity']
+
+    def today_kg(self):
+        return DashboardSummary.objects.get(pk=self.user.pk).today_kg
+
+    def test_outlier_held_out_until_confirmed(self):
+        for kwh in (48, 50, 53, 47, 51, 49):
+            self.assertFalse(self.log_energy(kwh)['quarantined'])
+        before = self.today_kg()
+        typo = self.log_energy(5000)
+        self.assertTrue(typo['quarantined'])
+        self.assertAlmostEqual(self.today_kg(), before)
+        self.assertFalse(self.log_energy(120)['quarantined'])
+        self.assertAlmostEqual(rebuild_summary(self.user).today_kg, self.today_kg())
+        self.assertEqual(ActivityBaseline.objects.get(user=self.user, category='energy').count, 7)
+
+        self.assertTrue(self.post({'action': 'confirm', 'activity_id': typo['id']})['success'])
+        self.assertAlmostEqual(self.today_kg(), before + 46.8 + 1950)
+        self.assertEqual(ActivityBaseline.objects.get(user=self.user, category='energy').count, 8)
+        counters = PlatformCounters.objects.get(pk=1)
+        self.assertAlmostEqual(counters.co2_logged_kg, recount().co2_logged_kg, places=6)
+
+        # Deleting a quarantined activity doesn't touch the totals
+        typo = self.log_energy(90000)
+        self.assertTrue(typo['quarantined'])
+        total = self.today_kg()
+        self.post({'action': 'delete', 'activity_id': typo['id']})
+        self.assertAlmostEqual(self.today_kg(), total)
+
+    def test_bulk_writes_and_rescan(self):
+        now = timezone.now()
+        readings = [50, 52, 48, 51, 49, 50.5, 4900, 47]
+        payload = [
+            {'category': 'energy', 'subtype': 'electricity', 'value': kwh, 'unit': 'kWh', 'timestamp': (now - timedelta(days=len(readings) - i)).isoformat()}
+            for i, kwh in enumerate(readings)
+        ]
+        url = reverse('api-activities', kwargs={'version': 'v1'})
+        with self.captureOnCommitCallbacks(execute=True):
+            results = self.client.post(url, payload, content_type='application/json').json()['results']
+        self.assertEqual([row['value'] for row in results if row['quarantined']], [4900])
+        month_kg = DashboardSummary.objects.get(pk=self.user.pk).month_kg
+        self.assertAlmostEqual(rebuild_summary(self.user).month_kg, month_kg)
+
+        # History from before screening existed: nothing flagged, no baselines
+        Activity.objects.update(quarantined=False)
+        ActivityBaseline.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('scan_anomalies', stdout=io.StringIO())
+        self.assertEqual(list(Activity.objects.filter(quarantined=True).values_list('value', flat=True)), [4900])
+        self.assertEqual(ActivityBaseline.objects.get(user=self.user).count, 7)
+        self.assertAlmostEqual(DashboardSummary.objects.get(pk=self.user.pk).month_kg, month_kg)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('root', 'root@example.com', 'pass-1234-word')
+        self.client.force_login(self.admin)
+
+    def add_activities(self, count):
+        user = User.objects.create_user(f'u{User.objects.count()}', 'u@example.com', 'pass-1234-word')
+        for n in range(count):
+            activity = Activity.objects.create(
+                user=user, category='food', subtype='vegan', value=n + 1, unit='serving',
+                timestamp=timezone.now() - timedelta(days=n),
+            )
+            Emission.objects.create(activity=activity, co2_equivalent_kg=1.0)
+
+    def changelist_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(ctx)
+
+    def test_queries_dont_grow_with_rows(self):
+        for name in ('admin:tracker_activity_changelist', 'admin:tracker_emission_changelist', 'admin:tracker_profile_changelist'):
+            self.add_activities(2)
+            few = self.changelist_queries(reverse(name))
+            self.add_activities(20)
+            self.assertEqual(self.changelist_queries(reverse(name)), few, name)
+
+    def test_recalculate_action(self):
+        self.add_activities(3)
+        response = self.client.post(reverse('admin:tracker_activity_changelist'), {
+            'action': 'recalculate_footprints', '_selected_action': list(Activity.objects.values_list('pk', flat=True)),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Emission.objects.filter(co2_equivalent_kg=1.0).exists())
+
+    def test_admin_edits_keep_totals_in_sync(self):
+        self.add_activities(3)
+        user = User.objects.get(username='u1')
+        newest, middle, oldest = Activity.objects.filter(user=user).order_by('-timestamp')
+        mark_active(user, newest.timestamp, middle.timestamp, oldest.timestamp)
+        rebuild_summary(user)
+        recount()
+
+        moved = timezone.localtime(middle.timestamp - timedelta(days=4))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:tracker_emission_change', args=[newest.emission.pk]), {
+                'activity': newest.pk, 'co2_equivalent_kg': '5.0',
+            })
+            self.client.post(reverse('admin:tracker_activity_change', args=[middle.pk]), {
+                'user': user.pk, 'category': 'food', 'subtype': 'vegan', 'description': 'Moved', 'value': '2', 'unit': 'serving',
+                'timestamp_0': moved.strftime('%Y-%m-%d'), 'timestamp_1': moved.strftime('%H:%M:%S'), 'quarantined': 'on',
+            })
+            self.client.post(reverse('admin:tracker_activity_changelist'), {
+                'action': 'delete_selected', '_selected_action': [oldest.pk], 'post': 'yes',
+            })
+        self.assertFalse(Activity.objects.filter(pk=oldest.pk).exists())
+
+        summary = DashboardSummary.objects.get(pk=user.pk)
+        rebuilt = rebuild_summary(user)
+        self.assertEqual((summary.today_kg, summary.month_kg), (rebuilt.today_kg, rebuilt.month_kg))
+        self.assertEqual(summary.today_kg, 5.0)
+        # A fresh user object: the calendar is cached on the instance
+        self.assertEqual(streak_stats(User.objects.get(pk=user.pk)), {'total_active': 2, 'max_streak': 1, 'current_streak': 1})
+        counters = PlatformCounters.objects.values(*COUNTER_FIELDS).get(pk=1)
+        recounted = recount()
+        for field in COUNTER_FIELDS:
+            self.assertAlmostEqual(counters[field], getattr(recounted, field), places=6, msg=field)
+
+    def test_recalculate_command_rebuilds_totals(self):
+        self.add_activities(3)
+        user = User.objects.get(username='u1')
+        stale = rebuild_summary(user).today_kg
+        call_command('recalculate_footprints', stdout=io.StringIO())
+        today_kg = Emission.objects.get(activity__user=user, activity__timestamp__date=date.today()).co2_equivalent_kg
+        self.assertNotAlmostEqual(today_kg, stale)
+        self.assertAlmostEqual(DashboardSummary.objects.get(pk=user.pk).today_kg, today_kg)
+        self.assertTrue(EmissionForecast.objects.filter(user=user).exists())
+
+    def test_recalculate_keeps_footprints_edited_by_hand(self):
+        self.add_activities(2)
+        user = User.objects.get(username='u1')
+        edited = Activity.objects.filter(user=user).first()
+        self.client.force_login(user)
+        self.client.post(reverse('activity'), {'action': 'update', 'activity_id': edited.pk, 'footprint': '9.5', 'description': 'Big lunch'})
+        self.assertTrue(Emission.objects.get(activity=edited).manual_override)
+
+        out = io.StringIO()
+        call_command('recalculate_footprints', dry_run=True, stdout=out)
+        self.assertIn(f"#{edited.pk} Big lunch: 9.50", out.getvalue())
+        call_command('recalculate_footprints', stdout=io.StringIO())
+        self.assertEqual(Emission.objects.get(activity=edited).co2_equivalent_kg, 9.5)
+        self.assertEqual(Emission.objects.filter(activity__user=user, co2_equivalent_kg=1.0).count(), 0)
+
+
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.directory, 'requests.jsonl')
+        self.user = User.objects.create_user('pat', 'pat@example.com', 'pass-1234-word')
+        # Enabling the middleware sets up a shared buffer and patches template rendering
+        for patcher in (
+            mock.patch.object(PerformanceMiddleware, 'buffer', None),
+            mock.patch.object(DjangoTemplate, 'render', DjangoTemplate.render),
+            mock.patch('tracker.middleware.atexit.register'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_removed_from_the_chain_when_disabled(self):
+        with override_settings(PERF_MONITORING_ENABLED=False), self.assertRaises(MiddlewareNotUsed):
+            PerformanceMiddleware(lambda request: None)
+        self.assertIsNone(PerformanceMiddleware.buffer)
+
+    def test_records_queries_and_time(self):
+        self.client.force_login(self.user)
+        with override_settings(PERF_MONITORING_ENABLED=True, PERF_SAMPLE_RATE=1.0, PERF_FLUSH_INTERVAL=0, PERF_LOG_PATH=self.log_path):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('myprofile'))
+        [record] = PerformanceMiddleware.buffer.records
+        self.assertEqual((record['url_name'], record['method'], record['status']), ('myprofile', 'GET', 200))
+        self.assertEqual(record['queries'], len(queries))
+        self.assertGreater(record['total_ms'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        with open(self.log_path, encoding='utf-8') as log:
+            self.assertEqual([json.loads(line) for line in log], [record])
+
+        out = io.StringIO()
+        call_command('perfreport', path=self.log_path, stdout=out)
+        self.assertIn('myprofile', out.getvalue())
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(PROFILE_DIR=self.directory, PROFILE_INTERVAL=0.001)
+        self.settings_override.enable()
+        self.user = User.objects.create_user('eve', 'eve@example.com', 'pass-1234-word')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def test_only_staff_can_ask_for_a_profile(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('myprofile'), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(read_index(self.directory), [])
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('myprofile') + '?_profile')
+        stem = response['X-Profile-Id']
+        [record] = read_index(self.directory)
+        self.assertEqual((record['url_name'], record['stem']), ('myprofile', stem))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, f"{stem}.folded")))
+        with open(os.path.join(self.directory, f"{stem}.speedscope.json"), encoding='utf-8') as f:
+            profile = json.load(f)['profiles'][0]
+        self.assertEqual(len(profile['samples']), record['samples'])
+
+        out = io.StringIO()
+        merged = os.path.join(self.directory, 'merged.folded')
+        call_command('profilereport', dir=self.directory, output=merged, stdout=out)
+        self.assertIn('myprofile: 1 profile(s)', out.getvalue())
+        self.assertTrue(os.path.exists(merged))
+
+
+class ProductionSettingsTests(TestCase):
+    def setUp(self):
+        with mock.patch.dict(os.environ, {'CFT_SECRET_KEY': 'test-only'}):
+            self.production = importlib.reload(importlib.import_module('cft.settings_production'))
+        self.static_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.static_root)
+
+    def test_pages_compressed_and_revalidated(self):
+        self.assertEqual(self.production.TEMPLATES[0]['OPTIONS']['loaders'][0][0], 'django.template.loaders.cached.Loader')
+        with override_settings(MIDDLEWARE=self.production.MIDDLEWARE, TEMPLATES=self.production.TEMPLATES, STATIC_ROOT=self.static_root):
+            response = self.client.get(reverse('tracker-home'), HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            revisit = self.client.get(reverse('tracker-home'), HTTP_ACCEPT_ENCODING='gzip, br', HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(revisit.status_code, 304)
 
-# Create your tests here.
@@ -0,0 +1,186 @@
+"""
+Unit and currency normalization.
+
+Activity values are converted to a base unit before an emission factor is applied:
+km for distance, kWh for energy, litres for fuel, servings for food and US dollars for
+spending. Physical units convert by the fixed factors in UNITS. Currencies convert by the
+ExchangeRate table, which is seeded by migration and holds dated rates, so a purchase is
+valued at the rate in force on the day it was made; add rows in the admin as rates move.
+
+get_converter() compiles both into in-memory arrays and caches them per process, so
+normalize() over a whole batch is a handful of numpy lookups. The form, the bulk import
+and the recalculation job all go through it.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+from django.apps import apps
+from django.utils import timezone
+
+# unit: (dimension, factor to the dimension's base unit)
+UNITS = {
+    'km': ('length', 1.0),
+    'm': ('length', 0.001),
+    'mi': ('length', 1.609344),
+    'kWh': ('energy', 1.0),
+    'Wh': ('energy', 0.001),
+    'MJ': ('energy', 1 / 3.6),
+    'therm': ('energy', 29.3071),
+    'L': ('volume', 1.0),
+    'gal': ('volume', 3.785411784),
+    'serving': ('count', 1.0),
+    'USD': ('currency', 1.0),
+}
+BASE_UNITS = {'length': 'km', 'energy': 'kWh', 'volume': 'L', 'count': 'serving', 'currency': 'USD'}
+
+# Canonical unit per category, and which dimensions a category accepts. Fuel is logged in
+# litres; travel and food imported from bank statements are amounts of money.
+CATEGORY_UNITS = {'transport': 'km', 'energy': 'kWh', 'food': 'serving', 'consumption': 'INR'}
+CATEGORY_DIMENSIONS = {
+    'transport': {'length', 'volume', 'currency'},
+    'energy': {'energy'},
+    'food': {'count', 'currency'},
+    'consumption': {'currency'},
+}
+
+UNIT_ALIASES = {
+    'km': 'km', 'kms': 'km', 'kilometer': 'km', 'kilometers': 'km', 'kilometre': 'km', 'kilometres': 'km',
+    'm': 'm', 'meter': 'm', 'meters': 'm', 'metre': 'm', 'metres': 'm',
+    'mi': 'mi', 'mile': 'mi', 'miles': 'mi',
+    'kwh': 'kWh', 'wh': 'Wh', 'mj': 'MJ', 'therm': 'therm', 'therms': 'therm',
+    'l': 'L', 'litre': 'L', 'litres': 'L', 'liter': 'L', 'liters': 'L', 'ltr': 'L',
+    'gal': 'gal', 'gallon': 'gal', 'gallons': 'gal',
+    'serving': 'serving', 'servings': 'serving', 'meal': 'serving', 'meals': 'serving',
+    'inr': 'INR', 'rs': 'INR', 'rs.': 'INR', '₹': 'INR', 'rupees': 'INR',
+    'usd': 'USD', '$': 'USD', 'dollars': 'USD', 'eur': 'EUR', '€': 'EUR', 'gbp': 'GBP', '£': 'GBP',
+}
+# Spellings that only mean something in one category: electricity bills count kWh as "units".
+CATEGORY_UNIT_ALIASES = {
+    'energy': {'unit': 'kWh', 'units': 'kWh'},
+}
+
+# How long a process trusts its compiled rates before re-reading the table. Saving a rate
+# resets the converter immediately in the process that saved it.
+RATES_REFRESH_SECONDS = 300
+
+
+def normalize_unit(category, unit):
+    """
+    Maps free-form unit spellings ('kms', 'KWH', 'Rs') to the canonical unit stored
+    on Activity. Falls back to the category's canonical unit when unit is empty.
+    """
+    if not unit:
+        return CATEGORY_UNITS.get(category, '')
+    unit = unit.strip()
+    key = unit.lower()
+    alias = CATEGORY_UNIT_ALIASES.get(category, {}).get(key) or UNIT_ALIASES.get(key)
+    return alias or (unit.upper() if len(unit) == 3 and unit.isalpha() else unit)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+class Converter:
+    """Unit-to-base-unit factors compiled from UNITS and a snapshot of the exchange rates."""
+
+    def __init__(self, rates):
+        by_currency = defaultdict(list)
+        for currency, valid_from, per_usd in rates:
+            by_currency[currency].append((valid_from, per_usd))
+        # Per currency: sorted start dates and the USD value of one unit from each date on
+        self.rates = {}
+        for currency, history in by_currency.items():
+            history.sort()
+            starts = np.array([valid_from for valid_from, _ in history], dtype='datetime64[D]')
+            self.rates[currency] = (starts, 1 / np.array([per_usd for _, per_usd in history], dtype=np.float64))
+        self.built_at = time.monotonic()
+
+    def currencies(self):
+        return sorted({'USD', *self.rates})
+
+    def dimension(self, unit):
+        if unit in UNITS:
+            return UNITS[unit][0]
+        return 'currency' if unit in self.rates else None
+
+    def accepts(self, category, unit):
+        return self.dimension(unit) in CATEGORY_DIMENSIONS.get(category, ())
+
+    def factors(self, unit, dates=None):
+        """
+        The factor taking `unit` to its base unit. For currencies with `dates`
+        (datetime64[D] array) it's an array holding the rate in force on each date.
+        """
+        if unit in UNITS:
+            return UNITS[unit][1]
+        if unit in self.rates:
+            starts, usd = self.rates[unit]
+            if dates is None:
+                return usd[-1]
+            # Dates before the first known rate use the earliest one
+            return usd[np.maximum(np.searchsorted(starts, dates, side='right') - 1, 0)]
+        # Unknown units pass through unchanged
+        return 1.0
+
+    def normalize(self, values, units, dates=None):
+        """Converts parallel sequences of values and units to base units; returns a float64 array."""
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return values
+        if dates is not None:
+            dates = np.array([_as_date(d) for d in dates], dtype='datetime64[D]')
+        unique_units, unit_index = np.unique(np.asarray(units, dtype=str), return_inverse=True)
+        normalized = np.empty_like(values)
+        for i, unit in enumerate(unique_units):
+            rows = unit_index == i
+            normalized[rows] = values[rows] * self.factors(unit, None if dates is None else dates[rows])
+        return normalized
+
+    def convert(self, value, unit, when=None):
+        """Single-value normalize(), for the form path."""
+        dates = None if when is None else np.array([_as_date(when)], dtype='datetime64[D]')
+        return float(value * np.ravel(self.factors(unit, dates))[0])
+
+
+_converter = None
+_converter_lock = threading.Lock()
+
+
+def load_rates():
+    ExchangeRate = apps.get_model('tracker', 'ExchangeRate')
+    return ExchangeRate.objects.values_list('currency', 'valid_from', 'per_usd')
+
+
+def get_converter():
+    global _converter
+    converter = _converter
+    if converter is None or time.monotonic() - converter.built_at > RATES_REFRESH_SECONDS:
+        with _converter_lock:
+            if _converter is converter:
+                _converter = Converter(load_rates())
+            converter = _converter
+    return converter
+
+
+def reset_converter():
+    global _converter
+    _converter = None
+
+
+def unit_dimension(unit):
+    return get_converter().dimension(unit)
+
+
+def normalize(values, units, dates=None):
+    """Base-unit values for a batch; see Converter.normalize."""
+    return get_converter().normalize(values, units, dates)
+
+
+def convert(value, unit, when=None):
+    return get_converter().convert(value, unit, when)
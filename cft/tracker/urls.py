@@ -1,6 +1,6 @@
 # tracker/urls.py
 
-from django.urls import path
+from django.urls import include, path
 from django.contrib.auth import views as auth_views
 from . import views
 
@@ -18,6 +18,9 @@ urlpatterns = [
 
     path('myprofile/', views.myprofile, name='myprofile'),
     path('activity/', views.activity, name='activity'),
+    path('activity/stats/', views.activity_stats, name='activity-stats'),
+    path('activity/import/', views.statement_import, name='statement-import'),
+    path('activity/import/<int:pk>/', views.statement_import_status, name='statement-import-status'),
 
     path('community/', views.community_view, name='community'),
     path('community/<int:pk>/', views.community_detail_view, name='community-detail'),
@@ -25,6 +28,10 @@ urlpatterns = [
     path('community/<int:pk>/leave/', views.leave_community, name='leave-community'),
     path('challenges/', views.challenges_view, name='challenges'),
     path('challenge/<int:pk>/join/', views.join_challenge, name='join-challenge'),
+    path('live/', views.live_feed, name='live-feed'),
+
+    # Versioned REST API (tracker/api.py); only v1 exists so far
+    path('api/<str:version>/', include('tracker.api_urls')),
 
 
 ]
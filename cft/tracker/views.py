@@ -1,15 +1,36 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, get_user_model, decorators, forms as auth_forms
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Sum
-from django.db import models
-from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm, ChallengeForm
-from .models import Profile, Activity, Emission, Community, Challenge, UserChallenge, User, UserAchievement
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_GET
+from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.db.models import Count, Q, Sum
+from django.db import models, transaction
+from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm, ChallengeForm, StatementUploadForm
+from .models import Profile, Activity, Emission, Community, Challenge, UserChallenge, User, UserAchievement, StatementImport, get_profile
 import json
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta
 import random
+import uuid
 from .map_assets.map_generator import generate_india_heatmap_from_profiles
+from .footprint import calculate_footprint
+from .units import get_converter, normalize_unit
+from .insights import insights_for_display
+from .simulator import plans_for_display
+from .forecast import budget_projection
+from .summary import CATEGORY_FIELDS, dashboard_stats, get_summary, record_activity_change, stats_etag
+from .db_router import read_from_replica
+from .cache import cache_anonymous_page, get_or_recompute
+from .dedupe import create_activity, idempotency_key
+from .archive import monthly_totals
+from .statements import schedule_import
+from .counters import location_changed, platform_stats, record_counts
+from .anomalies import confirm, counted_kg, screen
+from .streaks import STREAK_CHART_DAYS, clear_if_inactive, mark_active, streak_stats, window as calendar_window
+from .live import LEADERBOARD_TOPIC, event_stream, parse_topics, publish_leaderboard, snapshot_events
 
  
 
@@ -27,26 +48,84 @@ def register(request):
     return render(request, 'tracker/register.html', {'form': form})
 
 # --- HELPER FUNCTION FOR RANKING ---
-def get_leaderboard_and_rank(current_user=None):
-    thirty_days_ago = date.today() - timedelta(days=30)
-    all_users = User.objects.all()
-    leaderboard_data = []
+LEADERBOARD_DAYS = 30
+# 'emission': lowest footprint first. 'reduction': biggest cut against the user's own
+# previous 30 days first, which doesn't favour people who simply log less.
+LEADERBOARD_RANKINGS = ('emission', 'reduction')
+
+
+def _reduction_label(reduction_pct):
+    if reduction_pct is None:
+        return 'N/A'
+    return f"↓ {reduction_pct:.0f}%" if reduction_pct >= 0 else f"↑ {-reduction_pct:.0f}%"
+
+
+def _reduction_trend(reduction_pct):
+    """CSS class for the reduction column."""
+    if reduction_pct is None:
+        return ''
+    return 'positive' if reduction_pct >= 0 else 'negative'
 
-    for user in all_users:
-        emissions = Emission.objects.filter(
-            activity__user=user,
-            activity__timestamp__gte=thirty_days_ago
-        ).aggregate(total=Sum('co2_equivalent_kg'))
 
-        total_emissions = emissions['total'] or 0
+def compute_leaderboard_data():
+    """
+    Every user's emissions over the last 30 days and the 30 before, lowest current total
+    first with zero-emission users last. Two queries however many users there are: the
+    users, and both periods' totals per user in one conditional aggregate.
+    """
+    today = date.today()
+    current_start = timezone.make_aware(datetime.combine(today - timedelta(days=LEADERBOARD_DAYS), time.min))
+    previous_start = current_start - timedelta(days=LEADERBOARD_DAYS)
+
+    # The leaderboard tolerates replica lag, so it's read from there when one is configured
+    with read_from_replica():
+        users = list(User.objects.order_by('id').values_list('id', 'username'))
+        totals = {
+            row['activity__user_id']: row
+            for row in Emission.objects.filter(activity__timestamp__gte=previous_start, activity__quarantined=False)
+            .values('activity__user_id')
+            .annotate(
+                current=Sum('co2_equivalent_kg', filter=Q(activity__timestamp__gte=current_start)),
+                previous=Sum('co2_equivalent_kg', filter=Q(activity__timestamp__lt=current_start)),
+            )
+        }
+
+    leaderboard_data = []
+    for user_id, username in users:
+        row = totals.get(user_id) or {}
+        current, previous = row.get('current') or 0, row.get('previous') or 0
+        # Only meaningful when the user logged in both periods
+        reduction_pct = round((previous - current) / previous * 100, 1) if previous > 0 and current > 0 else None
         leaderboard_data.append({
-            'user_id': user.id,
-            'username': user.username,
-            'emission': total_emissions,
+            'user_id': user_id,
+            'username': username,
+            'emission': current,
+            'previous': previous,
+            'reduction_kg': previous - current,
+            'reduction_pct': reduction_pct,
+            'reduction': _reduction_label(reduction_pct),
+            'trend': _reduction_trend(reduction_pct),
         })
 
     # Sort by emissions (lowest first), users with 0 at the end
     leaderboard_data.sort(key=lambda x: (x['emission'] == 0, x['emission']))
+    # Push the new standings to anyone watching the live feed
+    publish_leaderboard(leaderboard_data)
+    return leaderboard_data
+
+
+def cached_leaderboard_data(rank_by='emission'):
+    # The same for every visitor, so it's cached and recomputed by a single request when it expires
+    # v2: rows carry the previous period and reduction
+    leaderboard_data = get_or_recompute('leaderboard:30d:v2', compute_leaderboard_data, settings.LEADERBOARD_CACHE_TTL)
+    if rank_by == 'reduction':
+        # Re-sorted from the same cached rows; users without both periods go last
+        return sorted(leaderboard_data, key=lambda x: (x['reduction_pct'] is None, -(x['reduction_pct'] or 0), x['emission']))
+    return leaderboard_data
+
+
+def get_leaderboard_and_rank(current_user=None, rank_by='emission'):
+    leaderboard_data = cached_leaderboard_data(rank_by)
 
     user_rank = "N/A"
     if current_user:
@@ -70,7 +149,8 @@ def get_leaderboard_and_rank(current_user=None):
             'rank_icon': rank_icon,
             'user': data['username'],
             'emission': f"{data['emission']:.1f} kg",
-            'reduction': 'N/A'
+            'reduction': data['reduction'],
+            'trend': data['trend'],
         })
 
     # New: Compose a dict for rank out of total, used by the profile page
@@ -86,49 +166,55 @@ def get_leaderboard_and_rank(current_user=None):
 
 @decorators.login_required
 def myprofile(request):
-    Profile.objects.get_or_create(user=request.user)
+    profile = get_profile(request.user)
 
     if request.method == 'POST':
         u_form = UserUpdateForm(request.POST, instance=request.user)
-        p_form = ProfileUpdateForm(request.POST, instance=request.user.profile)
+        p_form = ProfileUpdateForm(request.POST, instance=profile)
         if u_form.is_valid() and p_form.is_valid():
+            old_location = p_form.initial.get('location')
             u_form.save()
             p_form.save()
+            if 'location' in p_form.changed_data:
+                location_changed(profile, old_location)
             messages.success(request, 'Your profile has been updated successfully!')
             return redirect('myprofile')
     else:
         u_form = UserUpdateForm(instance=request.user)
-        p_form = ProfileUpdateForm(instance=request.user.profile)
+        p_form = ProfileUpdateForm(instance=profile)
 
     today = date.today()
-    start_of_month = today.replace(day=1)
-    
-    monthly_emissions = Emission.objects.filter(
-        activity__user=request.user, 
-        activity__timestamp__gte=start_of_month
-    ).aggregate(total=Sum('co2_equivalent_kg'))
-    total_footprint_this_month = monthly_emissions['total'] or 0
+    summary, _ = get_summary(request.user, today)
+    total_footprint_this_month = summary.month_kg
 
     _,_, user_rank = get_leaderboard_and_rank(request.user) # Get current user's rank
 
-    category_data_query = Emission.objects.filter(activity__user=request.user, activity__timestamp__gte=start_of_month).values('activity__category').annotate(total=Sum('co2_equivalent_kg'))
-    category_data = {'labels': [item['activity__category'].capitalize() for item in category_data_query], 'data': [item['total'] for item in category_data_query]}
-    
-    trends_data = {'labels': [], 'data': []}
-    for i in range(5, -1, -1):
-        month_start = (today.replace(day=1) - timedelta(days=i*30)).replace(day=1)
-        month_end = (month_start + timedelta(days=35)).replace(day=1) - timedelta(days=1)
-        month_emissions = Emission.objects.filter(activity__user=request.user, activity__timestamp__range=[month_start, month_end]).aggregate(total=Sum('co2_equivalent_kg'))
-        trends_data['labels'].append(month_start.strftime("%b %Y"))
-        trends_data['data'].append(round(month_emissions['total'] or 0, 2))
-        
-    user_budget = request.user.profile.carbon_budget_kg
+    category_totals = [(category, getattr(summary, field)) for category, field in CATEGORY_FIELDS.items() if getattr(summary, field)]
+    category_data = {'labels': [category.capitalize() for category, _ in category_totals], 'data': [round(total, 2) for _, total in category_totals]}
+
+    # Chart data is read-only history, fine to serve from the replica
+    with read_from_replica():
+        # Last six months, archived ones included, in two grouped queries
+        first_month = (today.replace(day=1) - timedelta(days=150)).replace(day=1)
+        monthly = monthly_totals(request.user, first_month, today)
+        trends_data = {
+            'labels': [month.strftime("%b %Y") for month in monthly],
+            'data': [round(total, 2) for total in monthly.values()],
+        }
+
+    user_budget = profile.carbon_budget_kg
     carbon_budget = {'limit': user_budget, 'used': round(total_footprint_this_month, 2), 'percentage': min(100, round((total_footprint_this_month / user_budget) * 100)) if user_budget > 0 else 100}
+    carbon_budget['projection'] = budget_projection(request.user, user_budget)
     
-    actionable_insights = [{"text": "Switching one car trip to public transit could save ~15kg CO₂e.", "icon": "fas fa-bus"}]
+    # Precomputed by `manage.py generate_insights`; new users get the generic tip until their first run
+    actionable_insights = insights_for_display(request.user) or [{"text": "Switching one car trip to public transit could save ~15kg CO₂e.", "icon": "fas fa-bus"}]
+
+    # Built-in what-if plans priced against the last three months, one query
+    with read_from_replica():
+        what_if_plans = plans_for_display(request.user)
     
-    active_days = Activity.objects.filter(user=request.user).dates('timestamp', 'day')
-    streak_data_for_chart = {"active_days": [d.strftime("%Y-%m-%d") for d in active_days]}
+    # The chart's ~20 weeks as a bitmap, not every active day the user ever had
+    streak_data_for_chart = {**streak_stats(request.user, today), **calendar_window(request.user, today - timedelta(days=STREAK_CHART_DAYS - 1), today)}
 
 
     context = {
@@ -141,52 +227,89 @@ def myprofile(request):
         'streak_data_json': json.dumps(streak_data_for_chart),
         'carbon_budget': carbon_budget,
         'actionable_insights': actionable_insights,
+        'what_if_plans': what_if_plans,
     }
     return render(request, 'tracker/myprofile.html', context)
 
 
-def home(request):
-    total_users = User.objects.count()
-    country_comparison = {'user_country_name': 'India', 'user_country_flag': 'https://flagcdn.com/w40/in.png', 'user_value': 1.9, 'global_value': 4.7}
-    max_val = max(country_comparison['user_value'], country_comparison['global_value'], 1) * 1.1
-    country_comparison['user_percentage'] = (country_comparison['user_value'] / max_val) * 100
-    country_comparison['global_percentage'] = (country_comparison['global_value'] / max_val) * 100
-
-    # --- REAL RECENT BADGES ---
-    recent_badges_query = UserAchievement.objects.order_by('-date_earned')[:3]
+def _global_stats():
+    # One row of incrementally maintained counters (see tracker/counters.py)
+    return platform_stats()
+
+
+def _country_comparison(global_stats):
+    comparison = {
+        'user_country_name': 'India', 'user_country_flag': 'https://flagcdn.com/w40/in.png',
+        'user_value': settings.COUNTRY_AVERAGE_TONNES, 'global_value': settings.GLOBAL_AVERAGE_TONNES,
+        'platform_value': global_stats['userAverage'],
+    }
+    max_val = max(comparison['user_value'], comparison['global_value'], comparison['platform_value'] or 0, 1) * 1.1
+    for key in ('user', 'global', 'platform'):
+        comparison[f'{key}_percentage'] = ((comparison[f'{key}_value'] or 0) / max_val) * 100
+    return comparison
+
+
+def _recent_badges():
+    recent_badges_query = UserAchievement.objects.select_related('achievement').order_by('-date_earned')[:3]
     recent_badges = [{'icon': b.achievement.icon, 'name': b.achievement.name} for b in recent_badges_query]
-    if not recent_badges:
-        recent_badges = [{'icon': '🌟', 'name': 'Welcome!'}]
+    return recent_badges or [{'icon': '🌟', 'name': 'Welcome!'}]
+
+
+def _india_map_html():
+    def build_map():
+        # 1. Get all user profiles that have a location defined
+        all_profiles_with_location = Profile.objects.filter(location__isnull=False).exclude(location__exact='')
+        # 2. Call the map generator function with the profile data
+        with read_from_replica():
+            return generate_india_heatmap_from_profiles(all_profiles_with_location)
+    # Reading the shapefile is slow, so only one request rebuilds the map when it expires
+    return get_or_recompute('home:india_map', build_map, settings.SHARED_FRAGMENT_CACHE_TTL)
+
+
+@cache_anonymous_page('page:tracker-home')
+def home(request):
+    global_stats = SimpleLazyObject(_global_stats)
+    country_comparison = SimpleLazyObject(lambda: _country_comparison(global_stats))
 
     # --- REAL LEADERBOARD & RANK ---
     leaderboard, user_rank,_ = get_leaderboard_and_rank(request.user if request.user.is_authenticated else None)
 
-     # --- NEW: GENERATE THE HEATMAP ---
-    # 1. Get all user profiles that have a location defined
-    all_profiles_with_location = Profile.objects.filter(location__isnull=False).exclude(location__exact='')
-    # 2. Call the map generator function with the profile data
-    india_map_html = generate_india_heatmap_from_profiles(all_profiles_with_location)
-    # --- END OF NEW LOGIC ---
-
+    tip = {'icon': '💡', 'title': "Today's Eco Tip", 'content': 'Replace 1 car trip with biking today', 'impact': 'Potential save: 2.3kg CO2'}
+    if request.user.is_authenticated:
+        personal = insights_for_display(request.user, limit=1)
+        if personal:
+            tip = {'icon': '💡', 'title': "Your Top Insight", 'content': personal[0]['text'], 'impact': personal[0]['impact']}
 
     context = {
-        'global_stats': {'totalUsers': total_users, 'co2Saved': 847, 'countriesCount': 67},
+        # Shared sections sit in {% cache %} fragments in home.html. They're passed as lazy
+        # objects so their queries only run when the fragment has expired.
+        'global_stats': global_stats,
         'country_comparison': country_comparison,
-        'recent_badges': recent_badges,
+        'recent_badges': SimpleLazyObject(_recent_badges),
         'leaderboard': leaderboard,
         'summary_data': {'this_month': 0, 'last_month': 0, 'improvement': 0, 'rank': user_rank}, # Use real rank
         'emissions_table_data': [],
         'emissions_data_json': json.dumps({'labels': [], 'data': []}),
         'daily_challenge': {'text': 'Log your first activity!', 'impact': ''},
         'insights': {
-            'tip': {'icon': '💡', 'title': "Today's Eco Tip", 'content': 'Replace 1 car trip with biking today', 'impact': 'Potential save: 2.3kg CO2'},
+            'tip': tip,
             'weather': {'icon': '☀️', 'title': "Weather Advice", 'content': 'Perfect day for cycling!', 'impact': 'Air quality: Good'},
             'events': {'icon': '🌱', 'title': "Local Events", 'content': 'Tree planting drive this Saturday', 'impact': 'Green Park 10AM'},
         },
-        'india_map_html': india_map_html, 
+        'india_map_html': SimpleLazyObject(_india_map_html),
+        'fragment_cache_ttl': settings.SHARED_FRAGMENT_CACHE_TTL,
+        'leaderboard_cache_ttl': settings.LEADERBOARD_CACHE_TTL,
     }
     return render(request, 'tracker/home.html', context)
 
+def _form_unit(request, category, field):
+    """The unit chosen on the activity form, defaulting to the category's own; ValueError if it doesn't fit."""
+    unit = normalize_unit(category, request.POST.get(field))
+    if not get_converter().accepts(category, unit):
+        raise ValueError(f"Unsupported unit {unit!r} for {category}")
+    return unit
+
+
 @decorators.login_required
 def activity(request):
     """
@@ -215,12 +338,22 @@ def activity(request):
                 new_footprint_val = float(request.POST.get('footprint'))
                 new_description = request.POST.get('description')
 
+                old_footprint = counted_kg(activity_to_update)
                 activity_to_update.description = new_description
                 activity_to_update.emission.co2_equivalent_kg = round(new_footprint_val, 2)
-                activity_to_update.emission.save()
-                activity_to_update.save()
+                activity_to_update.emission.manual_override = True
+                with transaction.atomic():
+                    activity_to_update.emission.save()
+                    activity_to_update.save()
+                    record_activity_change(request.user, activity_to_update.category, activity_to_update.timestamp, counted_kg(activity_to_update) - old_footprint)
+                    record_counts(co2_logged_kg=counted_kg(activity_to_update) - old_footprint)
                 if is_ajax:
-                    return JsonResponse({'success': True, 'activity': {'id': activity_to_update.id, 'description': new_description, 'footprint': new_footprint_val}})
+                    return JsonResponse({
+                        'success': True,
+                        'activity': {'id': activity_to_update.id, 'description': new_description, 'footprint': new_footprint_val},
+                        'stats': dashboard_stats(request.user),
+                        'streak_delta': {'total_active': 0},
+                    })
                 else:
                     messages.success(request, 'Activity updated successfully!')
             except (Activity.DoesNotExist, ValueError, TypeError):
@@ -229,14 +362,39 @@ def activity(request):
                 else: messages.error(request, error_message)
             return redirect(redirect_url)
 
+        # Handle CONFIRMING a quarantined activity (see tracker/anomalies.py); rejecting one is a delete
+        if action == 'confirm':
+            try:
+                activity_to_confirm = Activity.objects.select_related('emission').get(id=request.POST.get('activity_id'), user=request.user)
+            except (Activity.DoesNotExist, ValueError):
+                error_message = 'Activity not found or you do not have permission to confirm it.'
+                if is_ajax: return JsonResponse({'success': False, 'error': error_message})
+                messages.error(request, error_message)
+                return redirect(redirect_url)
+            confirm(activity_to_confirm)
+            if is_ajax:
+                return JsonResponse({'success': True, 'confirmed_id': activity_to_confirm.id, 'stats': dashboard_stats(request.user)})
+            messages.success(request, 'Activity confirmed and added to your totals.')
+            return redirect(redirect_url)
+
         # Handle activity DELETION
         if action == 'delete':
             try:
                 activity_id = request.POST.get('activity_id')
-                activity_to_delete = Activity.objects.get(id=activity_id, user=request.user)
-                activity_to_delete.delete()
+                activity_to_delete = Activity.objects.select_related('emission').get(id=activity_id, user=request.user)
+                removed_footprint = counted_kg(activity_to_delete)
+                with transaction.atomic():
+                    activity_to_delete.delete()
+                    record_activity_change(request.user, activity_to_delete.category, activity_to_delete.timestamp, -removed_footprint)
+                    day_cleared = clear_if_inactive(request.user, activity_to_delete.timestamp)
+                    record_counts(activity_count=-1, co2_logged_kg=-removed_footprint, active_user_days=-1 if day_cleared else 0)
                 if is_ajax:
-                    return JsonResponse({'success': True, 'deleted_id': activity_id})
+                    return JsonResponse({
+                        'success': True,
+                        'deleted_id': activity_id,
+                        'stats': dashboard_stats(request.user),
+                        'streak_delta': {'total_active': -1 if day_cleared else 0},
+                    })
                 else:
                     messages.success(request, 'Activity deleted successfully!')
             except Activity.DoesNotExist:
@@ -247,54 +405,62 @@ def activity(request):
 
         # Handle activity CREATION (existing logic)
         category = request.POST.get('category')
-        # A simple placeholder for emission factor calculation.
-        # In a real app, this would be a more complex lookup from a dedicated model or configuration file.
-        EMISSION_FACTORS = {
-            'travel': {'car-gasoline': 0.25, 'bus': 0.1, 'flight-short': 0.2, 'car-electric': 0.05, 'train': 0.04, 'motorcycle': 0.1, 'bicycle': 0, 'walking': 0, 'flight-long': 0.25},
-            'energy': {'electricity': 0.39},
-            'food': {'red-meat': 7.1, 'white-meat': 2.5, 'fish': 1.5, 'vegetarian': 1.0, 'vegan': 0.7, 'other': 1.2},
-            'purchases': {'clothing': 0.1, 'electronics': 0.5, 'home-goods': 0.3, 'services': 0.05, 'other': 0.2}
-        }
-
         try:
-            if category == 'transport':
-                mode = request.POST.get('transportMode')
-                distance = float(request.POST.get('distance'))
-                footprint = distance * EMISSION_FACTORS['travel'].get(mode, 0.15)
-                description = f"Travel: {mode.replace('-', ' ').title()} - {distance} km"
-                new_activity = Activity.objects.create(user=request.user, category='transport', description=description, value=distance, unit='km')
+            # The activity, its emission and the running totals are written together
+            with transaction.atomic():
+                if category == 'transport':
+                    mode = request.POST.get('transportMode')
+                    distance = float(request.POST.get('distance'))
+                    # Distance in km or miles, or litres/gallons of fuel burned
+                    unit = _form_unit(request, 'transport', 'distanceUnit')
+                    footprint = calculate_footprint('transport', mode, distance, unit)
+                    description = f"Travel: {mode.replace('-', ' ').title()} - {distance} {unit}"
+                    new_activity = Activity(user=request.user, category='transport', subtype=mode, description=description, value=distance, unit=unit)
             
-            elif category == 'energy':
-                units = float(request.POST.get('electricityUnits'))
-                footprint = units * EMISSION_FACTORS['energy']['electricity']
-                description = f"Energy: Manual Entry - {units} kWh"
-                new_activity = Activity.objects.create(user=request.user, category='energy', description=description, value=units, unit='kWh')
-
-            elif category == 'food':
-                diet_type = request.POST.get('dietType')
-                quantity = float(request.POST.get('foodQuantity', 1))
-                footprint = quantity * EMISSION_FACTORS['food'].get(diet_type, 1.0)
-                description = f"Food: {diet_type.replace('-', ' ').title()} ({quantity} servings)"
-                new_activity = Activity.objects.create(user=request.user, category='food', description=description, value=quantity, unit='serving')
-
-            elif category == 'consumption':
-                purchase_cat = request.POST.get('purchaseCategory')
-                amount = float(request.POST.get('purchaseAmount'))
-                # Convert INR to a USD-equivalent for consistent emission factor application
-                # Using an approximate conversion rate (e.g., 1 USD = 83 INR)
-                INR_TO_USD_RATE = 1 / 83 
-                amount_in_usd_equivalent = amount * INR_TO_USD_RATE
-                footprint = amount_in_usd_equivalent * EMISSION_FACTORS['purchases'].get(purchase_cat, 0.2)
-                description = f"Purchase: {purchase_cat.replace('-', ' ').title()} - ₹{amount:,.2f}"
-                new_activity = Activity.objects.create(user=request.user, category='consumption', description=description, value=amount, unit='INR')
+                elif category == 'energy':
+                    units = float(request.POST.get('electricityUnits'))
+                    unit = _form_unit(request, 'energy', 'energyUnit')
+                    # Gas is billed in therms; everything else is taken to be grid electricity
+                    source = 'natural-gas' if unit == 'therm' else 'electricity'
+                    footprint = calculate_footprint('energy', source, units, unit)
+                    label = 'Natural Gas' if source == 'natural-gas' else 'Manual Entry'
+                    description = f"Energy: {label} - {units} {unit}"
+                    new_activity = Activity(user=request.user, category='energy', subtype=source, description=description, value=units, unit=unit)
+
+                elif category == 'food':
+                    diet_type = request.POST.get('dietType')
+                    quantity = float(request.POST.get('foodQuantity', 1))
+                    footprint = calculate_footprint('food', diet_type, quantity)
+                    description = f"Food: {diet_type.replace('-', ' ').title()} ({quantity} servings)"
+                    new_activity = Activity(user=request.user, category='food', subtype=diet_type, description=description, value=quantity, unit='serving')
+
+                elif category == 'consumption':
+                    purchase_cat = request.POST.get('purchaseCategory')
+                    amount = float(request.POST.get('purchaseAmount'))
+                    # Amounts are converted to USD at the current rate before the factor is applied
+                    currency = _form_unit(request, 'consumption', 'currency')
+                    footprint = calculate_footprint('consumption', purchase_cat, amount, unit=currency)
+                    formatted = f"₹{amount:,.2f}" if currency == 'INR' else f"{amount:,.2f} {currency}"
+                    description = f"Purchase: {purchase_cat.replace('-', ' ').title()} - {formatted}"
+                    new_activity = Activity(user=request.user, category='consumption', subtype=purchase_cat, description=description, value=amount, unit=currency)
             
-            # Common emission creation for all new activities
-            final_footprint = round(footprint, 2)
-            Emission.objects.create(activity=new_activity, co2_equivalent_kg=final_footprint)
+                # Common emission creation for all new activities. A resubmission (same
+                # idempotency key, or same content moments apart) gets the stored activity back.
+                new_activity.idempotency_key = idempotency_key(request)
+                new_activity, created = create_activity(new_activity, footprint)
+                final_footprint = new_activity.emission.co2_equivalent_kg
+                new_days = 0
+                if created:
+                    # An unusually large amount is stored but kept out of the totals until confirmed
+                    screen([new_activity])
+                    record_activity_change(request.user, new_activity.category, new_activity.timestamp, counted_kg(new_activity))
+                    new_days = mark_active(request.user, new_activity.timestamp)
+                    record_counts(activity_count=1, co2_logged_kg=counted_kg(new_activity), active_user_days=new_days)
 
             if is_ajax:
                 return JsonResponse({
                     'success': True,
+                    'duplicate': not created,
                     'activity': {
                         'id': new_activity.id,
                         'category': new_activity.category,
@@ -302,10 +468,17 @@ def activity(request):
                         'description': new_activity.description,
                         'date': new_activity.timestamp.strftime('%Y-%m-%d'),
                         'footprint': final_footprint,
-                    }
+                        'quarantined': new_activity.quarantined,
+                    },
+                    'stats': dashboard_stats(request.user),
+                    'streak_delta': {'total_active': new_days},
                 })
-            else:
+            elif created and new_activity.quarantined:
+                messages.warning(request, "That's much more than you usually log, so it's been left out of your totals. Confirm it in your history if it's right.")
+            elif created:
                 messages.success(request, 'Activity logged successfully!')
+            else:
+                messages.info(request, 'That activity was already logged.')
 
         except (ValueError, TypeError):
             error_message = 'Invalid data submitted. Please check your inputs.'
@@ -324,7 +497,7 @@ def activity(request):
 
     try:
         selected_date = date.fromisoformat(selected_date_str)
-        activities = Activity.objects.filter(user=request.user, timestamp__date=selected_date).order_by('-timestamp')
+        activities = Activity.objects.filter(user=request.user, timestamp__date=selected_date).select_related('emission').order_by('-timestamp')
         if selected_category != 'all':
             activities = activities.filter(category=selected_category)
     except (ValueError, TypeError):
@@ -333,28 +506,8 @@ def activity(request):
         messages.error(request, "Invalid date format provided.")
 
     # --- NEW: Calculate emission stats ---
-    from django.db.models import Sum
+    # Running totals are kept up to date on every write (see tracker/summary.py)
     yesterday = today - timedelta(days=1)
-    
-    # Today and Yesterday's totals
-    today_emissions = activities.filter(timestamp__date=today).aggregate(total=Sum('emission__co2_equivalent_kg'))['total'] or 0
-    yesterday_emissions = Activity.objects.filter(user=request.user, timestamp__date=yesterday).aggregate(total=Sum('emission__co2_equivalent_kg'))['total'] or 0
-
-    # Monthly totals
-    this_month_start = today.replace(day=1)
-    last_month_end = this_month_start - timedelta(days=1)
-    last_month_start = last_month_end.replace(day=1)
-
-    this_month_emissions = Activity.objects.filter(user=request.user, timestamp__date__gte=this_month_start).aggregate(total=Sum('emission__co2_equivalent_kg'))['total'] or 0
-    last_month_emissions = Activity.objects.filter(user=request.user, timestamp__date__gte=last_month_start, timestamp__date__lte=last_month_end).aggregate(total=Sum('emission__co2_equivalent_kg'))['total'] or 0
-
-    # --- NEW: Carbon Budget Calculation ---
-    # Using hardcoded limits for now. In a real app, these would be user-configurable.
-    daily_limit = 15 # kg CO2e
-    monthly_limit = 450 # kg CO2e
-    
-    daily_budget_percentage = round((today_emissions / daily_limit) * 100) if daily_limit > 0 else 0
-    monthly_budget_percentage = round((this_month_emissions / monthly_limit) * 100) if monthly_limit > 0 else 0
 
     context = {
         'today_str': today.strftime("%Y-%m-%d"), # For default value in date picker
@@ -362,25 +515,97 @@ def activity(request):
         'activities': activities,
         'selected_date': selected_date_str,
         'selected_category': selected_category,
-        'emission_stats': {
-            'today': round(today_emissions, 2),
-            'yesterday': round(yesterday_emissions, 2),
-            'this_month': round(this_month_emissions, 2),
-            'last_month': round(last_month_emissions, 2),
-        },
-        'daily_budget': {
-            'used': round(today_emissions, 2),
-            'limit': daily_limit,
-            'percentage': min(daily_budget_percentage, 100) # Cap at 100% for visual
-        },
-        'monthly_budget': {
-            'used': round(this_month_emissions, 2),
-            'limit': monthly_limit,
-            'percentage': min(monthly_budget_percentage, 100) # Cap at 100% for visual
-        }
+        'currencies': get_converter().currencies(),
+        # One key per rendered form; resubmitting the same form can't log it twice, and
+        # each create form needs its own or one would be taken for a retry of another
+        'idempotency_keys': {category: uuid.uuid4().hex for category in ('transport', 'energy', 'food', 'consumption')},
+        **dashboard_stats(request.user, today),
     }
     return render(request, 'tracker/activity.html', context)
 
+@decorators.login_required
+def statement_import(request):
+    """
+    Upload an electricity bill or bank/card statement to turn into activities.
+    Small files are imported straight away; larger ones show progress while they run.
+    """
+    if request.method == 'POST':
+        form = StatementUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            statement = form.save(commit=False)
+            statement.user = request.user
+            statement.original_name = request.FILES['file'].name[:255]
+            statement.bytes_total = request.FILES['file'].size
+            statement.save()
+            stats = schedule_import(statement)
+            if stats is None:
+                messages.info(request, f"Importing {statement.original_name} in the background. Progress is shown below.")
+            else:
+                statement.refresh_from_db()
+                if statement.status == 'failed':
+                    messages.error(request, f"Couldn't import {statement.original_name}: {statement.error}")
+                else:
+                    messages.success(request, f"Imported {stats['imported']} activities from {statement.original_name} ({stats['duplicates']} already logged, {stats['skipped']} skipped).")
+            return redirect('statement-import')
+    else:
+        form = StatementUploadForm()
+
+    context = {
+        'form': form,
+        'imports': StatementImport.objects.filter(user=request.user)[:10],
+    }
+    return render(request, 'tracker/statement_import.html', context)
+
+@decorators.login_required
+@require_GET
+def statement_import_status(request, pk):
+    """Progress of one import, polled by the upload page while it runs in the background."""
+    statement = get_object_or_404(StatementImport, pk=pk, user=request.user)
+    return JsonResponse({
+        'status': statement.status,
+        'status_display': statement.get_status_display(),
+        'progress': statement.progress,
+        'lines_read': statement.lines_read,
+        'imported': statement.imported,
+        'duplicates': statement.duplicates,
+        'skipped': statement.skipped,
+        'error': statement.error,
+    })
+
+@decorators.login_required
+@require_GET
+@condition(etag_func=lambda request: stats_etag(request.user))
+def activity_stats(request):
+    """
+    The activity page's stats and budget bars as JSON, for cheap client polling.
+    Unchanged stats are answered with 304 Not Modified via the ETag.
+    """
+    response = JsonResponse(dashboard_stats(request.user))
+    # Let the browser keep the response but always revalidate it
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+async def live_feed(request):
+    """
+    Server-sent events for the leaderboard and challenge progress (see tracker/live.py),
+    e.g. /live/?topics=leaderboard,challenge:3
+    """
+    topics = parse_topics(request.GET.get('topics'))
+    if not topics:
+        return HttpResponseBadRequest("Pass topics=leaderboard and/or challenge:<id>.")
+    user = await request.auser()
+    # Challenges are for members only; anonymous visitors can only watch the public leaderboard
+    if not user.is_authenticated and any(topic != LEADERBOARD_TOPIC for topic in topics):
+        return HttpResponseForbidden("Log in to follow challenge progress.")
+    # Only the ASGI server can hold the connection open; under WSGI send the current state once.
+    # Anonymous clients always get the one-off snapshot, so they can't pin connections open.
+    streaming = isinstance(request, ASGIRequest) and user.is_authenticated
+    stream = event_stream(topics) if streaming else snapshot_events(topics)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
 @decorators.login_required
 def community_view(request):
     """
@@ -427,7 +652,10 @@ def challenges_view(request):
         # If form is invalid, it will fall through and be re-rendered with errors
 
     today = date.today()
-    active_challenges = Challenge.objects.filter(end_date__gte=today).select_related('community').order_by('end_date')
+    active_challenges = Challenge.objects.filter(end_date__gte=today).select_related('community').annotate(
+        participant_count=Count('userchallenge'),
+        completed_count=Count('userchallenge', filter=Q(userchallenge__is_completed=True)),
+    ).order_by('end_date')
     completed_challenges = Challenge.objects.filter(end_date__lt=today).select_related('community').order_by('-end_date')
 
     joined_challenges = []